@@ -0,0 +1,60 @@
+# data parallel beautiful_mnist across local processes that all-reduce their gradients through shared memory
+# PROCS=1,2,4 runs the same training once per process count and prints how throughput scales, every process trains on BS samples per step
+import time
+from typing import Tuple
+from tinygrad import Tensor, TinyJit, nn
+from tinygrad.helpers import getenv, colored
+from tinygrad.nn.datasets import mnist
+from tinygrad.nn.distributed import ProcessGroup, launch
+from examples.beautiful_mnist import Model
+
+def train(pg:ProcessGroup, steps:int, bs:int, results):
+  X_train, Y_train, X_test, Y_test = mnist()
+
+  model = Model()
+  # every rank starts from the weights of rank 0
+  for x in nn.state.get_state_dict(model).values(): x.replace(pg.broadcast(x.realize()))
+  opt = nn.optim.Adam(nn.state.get_parameters(model))
+  Tensor.manual_seed(pg.rank)
+
+  @TinyJit
+  def grad_step() -> Tuple[Tensor, Tensor]:
+    with Tensor.train():
+      opt.zero_grad()
+      samples = Tensor.randint(bs, high=X_train.shape[0])
+      loss = model(X_train[samples]).sparse_categorical_crossentropy(Y_train[samples]).backward()
+      return loss.realize(), Tensor.cat(*[p.grad.flatten() for p in opt.params]).realize()
+
+  @TinyJit
+  def apply_step(grads:Tensor) -> None:
+    with Tensor.train():
+      for p,g in zip(opt.params, (grads / pg.world_size).split([p.numel() for p in opt.params])): p.grad = g.reshape(p.shape)
+      opt.step()
+
+  @TinyJit
+  def get_test_acc() -> Tensor: return (model(X_test).argmax(axis=1) == Y_test).mean()*100
+
+  for i in range(steps):
+    if i == 2: st = time.perf_counter()  # the first two steps capture the jits
+    loss, grads = grad_step()
+    apply_step(pg.all_reduce(grads))
+    if pg.rank == 0 and i%10 == 9: print(f"{pg.world_size} procs, step {i+1:4d}: loss {loss.item():6.2f}")
+  pg.barrier()
+  if pg.rank == 0: results.put((pg.world_size, (steps-2)*bs*pg.world_size/(time.perf_counter()-st), get_test_acc().item()))
+
+if __name__ == "__main__":
+  import multiprocessing
+  results = multiprocessing.get_context("spawn").Queue()
+  steps, bs = getenv("STEPS", 70), getenv("BS", 512)
+  base, all_procs = None, [int(x) for x in getenv("PROCS", "1,2,4").split(",")]
+  for procs in all_procs:
+    launch(train, procs, steps, bs, results)
+    world_size, samples_per_s, test_acc = results.get()
+    base = base or samples_per_s
+    print(colored(f"{world_size} procs: {samples_per_s:9.2f} samples/s, {samples_per_s/base:5.2f}x of {all_procs[0]} procs, "
+                  f"test_accuracy: {test_acc:5.2f}%", "green"))
+
+  # verify eval acc of the last run
+  if target := getenv("TARGET_EVAL_ACC_PCT", 0.0):
+    if test_acc >= target: print(colored(f"{test_acc=} >= {target}", "green"))
+    else: raise ValueError(colored(f"{test_acc=} < {target}", "red"))
@@ -203,6 +203,9 @@ class LLaMa:
     elif quantize == "nf4":
       from llama3 import NF4Linear
       linear = NF4Linear(64)
+    elif quantize == "int4":
+      from llama3 import Int4Linear
+      linear = Int4Linear(32)
     else:
       linear = nn.Linear
 
@@ -339,7 +342,7 @@ if __name__ == "__main__":
   parser.add_argument("--profile", action="store_true", help="Output profile data to out.prof")
   parser.add_argument("--gen", default="1", help=f"""Generation of the model to use {list(MODEL_PARAMS.keys())}""")
   parser.add_argument("--size", type=str, default=None, help=f"""Size of model to use {", ".join([f"{list(v.keys())} for gen '{k}'" for k, v in MODEL_PARAMS.items()])}""")
-  parser.add_argument("--quantize", type=str, default=None, help="Quantize the weights to int8 or nf4 in memory")
+  parser.add_argument("--quantize", type=str, default=None, help="Quantize the weights to int8, nf4 or int4 in memory")
   parser.add_argument("--model", type=Path, default=None, help="Folder with the original weights to load, or single .index.json, .safetensors or .bin file")
   parser.add_argument("--shard", type=int, default=1, help="number of devices to load the weights to")
 
@@ -127,6 +127,39 @@ def NF4Linear(block_size):
       return new_state_dict
   return _NF4Linear
 
+def Int4Linear(block_size, dtype=dtypes.float16):
+  class _Int4Linear:
+    def __init__(self, in_features, out_features, bias=False):
+      assert not bias, "bias not supported"
+      self.in_features, self.out_features = in_features, out_features
+      self.weight = Tensor.empty(out_features, in_features // 2, dtype=dtypes.uint8)
+      self.scale = Tensor.empty(out_features, in_features // block_size, dtype=dtype)
+
+    def __call__(self, x: Tensor) -> Tensor:
+      # two signed nibbles per byte, low one first. AND and a float multiply are safe to pad so the whole unpack fuses into the matmul
+      low_bits, high_bits = (self.weight & 0xF).cast(self.scale.dtype), (self.weight & 0xF0).cast(self.scale.dtype) * (1 / 2 ** 4)
+      unpacked = Tensor.stack(low_bits, high_bits, dim=-1) - 8
+      unscaled = unpacked.reshape(self.out_features, -1, block_size) * self.scale.unsqueeze(-1)
+      return x.linear(unscaled.reshape(self.out_features, self.in_features).T)
+
+    @staticmethod
+    def quantize(state_dict: dict[str, Tensor], device) -> dict[str, Tensor]:
+      new_state_dict = {}
+      for k, v in state_dict.items():
+        if "feed_forward" in k or "attention.w" in k:
+          grouped = v.reshape(v.shape[0], -1, block_size)
+          scale = grouped.abs().max(axis=-1, keepdim=True).maximum(1e-8) / 7
+          coded = ((grouped / scale).round().clip(-8, 7) + 8).cast(dtypes.uint8).reshape(v.shape[0], -1, 2)
+          new_state_dict[k] = coded[..., 0] + coded[..., 1] * 2 ** 4
+          new_state_dict[k.replace(".weight", ".scale")] = scale.squeeze(-1).cast(dtype)
+          if isinstance(device, tuple):
+            new_state_dict[k].shard_(device, axis=-1)
+            new_state_dict[k.replace('weight', 'scale')].shard_(device, axis=None)
+        else:
+          new_state_dict[k] = v
+      return new_state_dict
+  return _Int4Linear
+
 MODEL_PARAMS = {
   "8B": {
     "args": {"dim": 4096, "n_heads": 32, "n_kv_heads": 8, "n_layers": 32, "norm_eps": 1e-5, "rope_theta": 500000, "vocab_size": 128256, "hidden_dim": 14336},
@@ -141,6 +174,7 @@ def build_transformer(model_path: Path, model_size="8B", quantize=None, device=N
   # build model
   if quantize == "int8": linear = Int8Linear
   elif quantize == "nf4": linear = NF4Linear(64)
+  elif quantize == "int4": linear = Int4Linear(32)
   else: linear = nn.Linear
   with Context(THREEFRY=0):
     model = Transformer(**MODEL_PARAMS[model_size]["args"], linear=linear, max_context=8192, jit=True)
@@ -213,7 +247,7 @@ if __name__ == "__main__":
   parser.add_argument("--model", type=Path, help="Model path")
   parser.add_argument("--size", choices=["8B", "70B"], default="8B", help="Model size")
   parser.add_argument("--shard", type=int, default=1, help="Shard the model across multiple devices")
-  parser.add_argument("--quantize", choices=["int8", "nf4"], help="Quantization method")
+  parser.add_argument("--quantize", choices=["int8", "nf4", "int4"], help="Quantization method")
   parser.add_argument("--no_api", action="store_true", help="Disable the api and run a cli test interface")
   parser.add_argument("--host", type=str, default="0.0.0.0", help="Web server bind address")
   parser.add_argument("--port", type=int, default=7776, help="Web server port")
@@ -250,6 +284,7 @@ if __name__ == "__main__":
   device = tuple(f"{Device.DEFAULT}:{i}" for i in range(args.shard)) if args.shard > 1 else Device.DEFAULT
   model = build_transformer(args.model, model_size=args.size, quantize=args.quantize, device=device)
   param_bytes = sum(x.lazydata.size * x.dtype.itemsize for x in get_parameters(model))
+  print(f"model weights: {param_bytes/1e9:.2f} GB" + (f" ({args.quantize})" if args.quantize else ""))
 
   if not args.no_api and not args.benchmark:
     from bottle import Bottle, request, response, HTTPResponse, abort, static_file
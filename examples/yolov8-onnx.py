@@ -1,18 +1,34 @@
 #!/usr/bin/env python3
-import os
+# compares the onnx interpreter with the folded + jitted runner on yolov8, set EXTERNAL=1 to map the weights from an external data file
+import os, time
 from ultralytics import YOLO
 import onnx
 from pathlib import Path
-from extra.onnx import get_run_onnx
+from extra.onnx import get_run_onnx, get_jit_onnx
 from tinygrad.tensor import Tensor
+from tinygrad.helpers import getenv
 
 os.chdir("/tmp")
 if not Path("yolov8n-seg.onnx").is_file():
   model = YOLO("yolov8n-seg.pt")
   model.export(format="onnx", imgsz=[480,640])
-onnx_model = onnx.load(open("yolov8n-seg.onnx", "rb"))
+fn = "yolov8n-seg.onnx"
+if getenv("EXTERNAL"):
+  onnx.save(onnx.load(fn), fn:="yolov8n-seg-external.onnx", save_as_external_data=True, location="yolov8n-seg-external.data")
+onnx_model = onnx.load(open(fn, "rb"), load_external_data=not getenv("EXTERNAL"))
 # TODO: move get example inputs to onnx
 input_shapes = {inp.name:tuple(x.dim_value for x in inp.type.tensor_type.shape.dim) for inp in onnx_model.graph.input}
 print(input_shapes)
-run_onnx = get_run_onnx(onnx_model)
-run_onnx({"images": Tensor.zeros(1,3,480,640)}, debug=True)
+
+for name, get_run in [("interpreted", lambda: get_run_onnx(onnx_model, fn, fold=False)), ("folded+jit", lambda: get_jit_onnx(onnx_model, fn))]:
+  st = time.perf_counter()
+  run_onnx = get_run()
+  load_tm = time.perf_counter() - st
+  tms = []
+  for _ in range(getenv("CNT", 5)):
+    img = Tensor.rand(1,3,480,640).realize()
+    st = time.perf_counter()
+    for out in run_onnx({"images": img}).values(): out.realize()
+    Tensor.zeros(1).realize().item()
+    tms.append(time.perf_counter() - st)
+  print(f"{name:12s}: load {load_tm*1000:8.2f} ms, first run {tms[0]*1000:8.2f} ms, best run {min(tms)*1000:8.2f} ms")
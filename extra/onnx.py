@@ -1,13 +1,13 @@
 from __future__ import annotations
 from google.protobuf.internal.containers import RepeatedCompositeFieldContainer
-import importlib
+import importlib, pathlib
 from functools import lru_cache
 import numpy as np
-from tinygrad import Tensor, dtypes, Device
-from tinygrad.tensor import _to_np_dtype
+from tinygrad import Tensor, TinyJit, dtypes, Device
+from tinygrad.tensor import _to_np_dtype, _from_np_dtype
 from tinygrad.helpers import getenv, DEBUG, CI, OSX
 from tinygrad.dtype import ConstType
-from typing import List, Dict, Union
+from typing import List, Dict, Union, Optional
 from onnx import AttributeProto, ModelProto, TensorProto, TypeProto
 try:
   from onnx.helper import tensor_dtype_to_np_dtype
@@ -50,7 +50,16 @@ onnx_ops = importlib.import_module('extra.onnx_ops')
 
 ONNXLIMIT = getenv("ONNXLIMIT", -1)
 
-def get_run_onnx(onnx_model: ModelProto):
+# these must run on every call, even when all their inputs are known at load time
+UNFOLDABLE_OPS = {"Gradient", "Dropout", "RandomNormal", "RandomUniform", "RandomNormalLike", "RandomUniformLike", "Multinomial", "Bernoulli"}
+
+def get_run_onnx(onnx_model: ModelProto, model_path:Optional[str]=None, fold:bool=True):
+  """
+  Returns a function that runs `onnx_model` on a dict of inputs.
+  Nodes that only depend on initializers and constants are run once here and realized (when `fold` is set), the rest run on every call.
+  Initializers with external data that onnx didn't load (`onnx.load(fn, load_external_data=False)`) are mapped from their files,
+  found next to `model_path`, through disk tensors.
+  """
   def type_parse(type_proto: TypeProto):
     ret = []
     while True:
@@ -74,6 +83,15 @@ def get_run_onnx(onnx_model: ModelProto):
   def buffer_parse(inp: TensorProto) -> Tensor:
     if inp.data_type in (8,14,15): raise Exception(f"data type not supported {inp.name} {inp.dims} {inp.data_type}")
     dtype = DTYPE_MAP[inp.data_type] if is_dtype_supported(DTYPE_MAP[inp.data_type]) else dtypes.float32
+    if inp.data_location == TensorProto.EXTERNAL and len(inp.raw_data) == 0:
+      assert model_path is not None, f"need model_path to find the external data of {inp.name}"
+      info = {x.key:x.value for x in inp.external_data}
+      fn = pathlib.Path(model_path).parent / info["location"]
+      offset, length = int(info.get("offset", 0)), int(info.get("length", fn.stat().st_size - int(info.get("offset", 0))))
+      disk = Tensor.empty(offset+length, dtype=dtypes.uint8, device=f"disk:{fn}")[offset:offset+length]
+      ret = disk.bitcast(_from_np_dtype(tensor_dtype_to_np_dtype(inp.data_type))).to(Device.DEFAULT).cast(dtype).reshape(tuple(inp.dims))
+      ret.requires_grad = False
+      return ret
     if dat := list(inp.float_data) or list(inp.int32_data) or list(inp.int64_data):
       return Tensor(dat, dtype=dtype, requires_grad=False).reshape(tuple(inp.dims))
     if len(inp.raw_data) > 0:
@@ -109,6 +127,81 @@ def get_run_onnx(onnx_model: ModelProto):
 
   onnx_model_version = onnx_model.opset_import[0].version
 
+  def run_node(n, inp:List[Tensor], opt:Dict, intermediate_tensors:Dict[str,Tensor]) -> tuple:
+    # NOTE some ops live here because they require access to some local variables
+    # have to use n.output for cases when num_outputs is absent
+    if n.op_type in onnx_ops.tensor_methods:
+      ret = getattr(Tensor, n.op_type.lower())(*inp, **opt)
+    elif n.op_type == "Split":
+      axis = opt.get("axis", 0)
+      split = None if len(inp) == 1 else to_python_const(inp[1])
+      if split is None:
+        split = [inp[0].shape[axis] // len(n.output)] * len(n.output)
+        for i in range(inp[0].shape[axis] % len(n.output)):
+          split[i] += 1
+      i, ret = 0, []
+      arg = [None] * inp[0].ndim
+      for s in split:
+        arg[axis] = (i,i+s)
+        ret.append(inp[0].shrink(arg=tuple(arg)))
+        i = i+s
+      ret = tuple(ret)
+
+    # need to check onnx_model_version
+    elif n.op_type == "Slice":
+      if onnx_model_version < 10:
+        axes, ends, starts, steps = list(opt.get("axes", range(inp[0].ndim))), list(opt["ends"]), list(opt["starts"]), [1]*inp[0].ndim
+      else:
+        starts, ends = inp[1:3]
+        axes = list(range(inp[0].ndim)) if len(inp) <= 3 else to_python_const(inp[3].cast(dtypes.int32))
+        steps = inp[4].cast(dtypes.int32).tolist() if len(inp) > 4 else [1]*inp[0].ndim
+        starts, ends = to_python_const(starts), to_python_const(ends)
+      arg = [(0,x,1) for x in inp[0].shape]
+      for i, axis in enumerate(axes):
+        axis = int(axis) + inp[0].ndim if axis < 0 else int(axis)
+        if starts[i] < 0: starts[i] += inp[0].shape[axis]
+        if ends[i] < 0: ends[i] += inp[0].shape[axis]
+        starts[i], ends[i] = max(0, min(starts[i], inp[0].shape[axis])), max(0, min(ends[i], inp[0].shape[axis]))
+        if starts[i] > ends[i] and steps[i] >= 0: steps[i] = -steps[i]
+        arg[axis] = (starts[i], ends[i], steps[i])
+      new_shape = tuple((s, e) if st > 0 else (e+1, s+1) for s, e, st in arg)
+      if any(s==e for s,e in new_shape): ret = inp[0].shrink(new_shape)
+      else: ret = inp[0][tuple([slice(s,e,st) for s,e,st in arg])]
+
+    # need to call backward on intermediate_tensors
+    elif n.op_type == "Gradient":
+      assert len(opt["xs"]) == len(inp), f"len(opt['xs']):{len(opt['xs'])}, len(inp):{len(inp)} output and input has to match"
+      y = opt["y"]
+      intermediate_tensors[y].backward()
+      ret = tuple([t.grad for t in inp])
+
+    # onnx_ops.py
+    elif hasattr(onnx_ops, n.op_type):
+      fxn = getattr(onnx_ops, n.op_type)
+      if isinstance(fxn, dict):
+        for k in sorted(fxn.keys()):
+          if k <= onnx_model_version:
+            real_fxn = fxn[k]
+      else:
+        real_fxn = fxn
+      ret = real_fxn(*inp, **opt)
+    else:
+      print("UNSUPPORTED", n.op_type, n.input, n.output)
+      raise Exception(f"op_type {n.op_type} not supported")
+
+    return ret if isinstance(ret, tuple) else (ret, )
+
+  # run everything that only depends on initializers and constants once, folded nodes are skipped by run_onnx
+  folded = set()
+  if fold and domain != "ai.onnx.preview.training":
+    for num,n in enumerate(onnx_model.graph.node):
+      if n.op_type in UNFOLDABLE_OPS or not all(x == "" or x in tensors for x in n.input): continue
+      ret = run_node(n, [tensors[x] if x != "" else None for x in n.input], attribute_dict[num], {})
+      if realize:=[t for t in ret if isinstance(t, Tensor)]: Tensor.realize(*realize)
+      tensors.update(zip(n.output, ret))
+      folded.add(num)
+    if DEBUG >= 1: print(f"onnx: folded {len(folded)} of {len(onnx_model.graph.node)} nodes at load time")
+
   def run_onnx(inputs={}, debug=0):
     debug = getenv("DEBUGONNX") or debug
     input_tensors: Dict[str,Tensor] = {}
@@ -141,6 +234,9 @@ def get_run_onnx(onnx_model: ModelProto):
       return None
 
     for num,n in enumerate(onnx_model.graph.node):
+      if num in folded:
+        if num == ONNXLIMIT: return {outp:tensors[outp] for outp in n.output}
+        continue
       inp: List[Tensor] = []
       if debug >= 3: print("inputs:")
       for x in n.input:
@@ -150,68 +246,7 @@ def get_run_onnx(onnx_model: ModelProto):
       opt: Dict = attribute_dict[num]
       if debug >= 1: print(f"{num}: op {n.op_type} shape {[x.shape if isinstance(x, Tensor) else x for x in inp]} opt {opt}")
 
-      # NOTE some ops live here because they require access to some local variables
-      # have to use n.output for cases when num_outputs is absent
-      if n.op_type in onnx_ops.tensor_methods:
-        ret = getattr(Tensor, n.op_type.lower())(*inp, **opt)
-      elif n.op_type == "Split":
-        axis = opt.get("axis", 0)
-        split = None if len(inp) == 1 else to_python_const(inp[1])
-        if split is None:
-          split = [inp[0].shape[axis] // len(n.output)] * len(n.output)
-          for i in range(inp[0].shape[axis] % len(n.output)):
-            split[i] += 1
-        i, ret = 0, []
-        arg = [None] * inp[0].ndim
-        for s in split:
-          arg[axis] = (i,i+s)
-          ret.append(inp[0].shrink(arg=tuple(arg)))
-          i = i+s
-        ret = tuple(ret)
-
-      # need to check onnx_model_version
-      elif n.op_type == "Slice":
-        if onnx_model_version < 10:
-          axes, ends, starts, steps = list(opt.get("axes", range(inp[0].ndim))), list(opt["ends"]), list(opt["starts"]), [1]*inp[0].ndim
-        else:
-          starts, ends = inp[1:3]
-          axes = list(range(inp[0].ndim)) if len(inp) <= 3 else to_python_const(inp[3].cast(dtypes.int32))
-          steps = inp[4].cast(dtypes.int32).tolist() if len(inp) > 4 else [1]*inp[0].ndim
-          starts, ends = to_python_const(starts), to_python_const(ends)
-        arg = [(0,x,1) for x in inp[0].shape]
-        for i, axis in enumerate(axes):
-          axis = int(axis) + inp[0].ndim if axis < 0 else int(axis)
-          if starts[i] < 0: starts[i] += inp[0].shape[axis]
-          if ends[i] < 0: ends[i] += inp[0].shape[axis]
-          starts[i], ends[i] = max(0, min(starts[i], inp[0].shape[axis])), max(0, min(ends[i], inp[0].shape[axis]))
-          if starts[i] > ends[i] and steps[i] >= 0: steps[i] = -steps[i]
-          arg[axis] = (starts[i], ends[i], steps[i])
-        new_shape = tuple((s, e) if st > 0 else (e+1, s+1) for s, e, st in arg)
-        if any(s==e for s,e in new_shape): ret = inp[0].shrink(new_shape)
-        else: ret = inp[0][tuple([slice(s,e,st) for s,e,st in arg])]
-
-      # need to call backward on intermediate_tensors
-      elif n.op_type == "Gradient":
-        assert len(opt["xs"]) == len(inp), f"len(opt['xs']):{len(opt['xs'])}, len(inp):{len(inp)} output and input has to match"
-        y = opt["y"]
-        intermediate_tensors[y].backward()
-        ret = tuple([t.grad for t in inp])
-
-      # onnx_ops.py
-      elif hasattr(onnx_ops, n.op_type):
-        fxn = getattr(onnx_ops, n.op_type)
-        if isinstance(fxn, dict):
-          for k in sorted(fxn.keys()):
-            if k <= onnx_model_version:
-              real_fxn = fxn[k]
-        else:
-          real_fxn = fxn
-        ret = real_fxn(*inp, **opt)
-      else:
-        print("UNSUPPORTED", n.op_type, n.input, n.output)
-        raise Exception(f"op_type {n.op_type} not supported")
-
-      if not isinstance(ret, tuple): ret = (ret, )
+      ret = run_node(n, inp, opt, intermediate_tensors)
       assert len(n.output) <= len(ret), f"expected output size must be less than {len(ret)}, it's {n.output}"
       if debug >= 2: print([x.shape if isinstance(x, Tensor) else None for x in ret])
       if debug >= 2: print("outputs:")
@@ -222,5 +257,17 @@ def get_run_onnx(onnx_model: ModelProto):
         output_tensor_names = n.output
         break
 
-    return {outp:intermediate_tensors[outp] for outp in output_tensor_names}
+    return {outp:fetch_tensor(outp) for outp in output_tensor_names}
   return run_onnx
+
+def get_jit_onnx(onnx_model: ModelProto, model_path:Optional[str]=None):
+  """
+  Like `get_run_onnx` with the graph traced into a `TinyJit`, the first two calls capture it and later calls only launch the kernels.
+  Inputs are turned into realized Tensors before the call, the returned Tensors are reused by the next call.
+  """
+  run_onnx = get_run_onnx(onnx_model, model_path)
+  @TinyJit
+  def run(**inputs:Tensor) -> Dict[str, Tensor]: return {k:v.realize() for k,v in run_onnx(inputs).items()}
+  def run_jit(inputs={}) -> Dict[str, Tensor]:
+    return run(**{k:(v if isinstance(v, Tensor) else Tensor(v, requires_grad=False)).contiguous().realize() for k,v in inputs.items()})
+  return run_jit
@@ -58,6 +58,7 @@ setup(name='tinygrad',
             "hypothesis",
             "nibabel",
             "bottle",
+            "gguf",
         ],
         'docs': [
             "mkdocs",
@@ -2,10 +2,10 @@ import time
 from tinygrad import Tensor, Device, GlobalCounters, TinyJit
 from tinygrad.lazy import LazyBuffer
 from tinygrad.ops import ReduceOps
-from tinygrad.multi import MultiLazyBuffer, all_reduce
+from tinygrad.multi import MultiLazyBuffer, all_reduce, ALL_REDUCE_ALGORITHMS
 from tinygrad.engine.schedule import create_schedule
 from tinygrad.engine.realize import run_schedule
-from tinygrad.helpers import getenv, Context, RING, DEBUG
+from tinygrad.helpers import getenv, Context, DEBUG, diskcache_put
 from typing import List, Union
 
 def realize(x: Union[LazyBuffer, List[LazyBuffer]]):
@@ -13,7 +13,7 @@ def realize(x: Union[LazyBuffer, List[LazyBuffer]]):
   run_schedule(create_schedule(x))
   for lb in x: Device[lb.device].synchronize()
 
-def test(devs: List[str], N: int, iters:int = 10):
+def test(devs: List[str], N: int, algo: str, iters:int = 10):
   def _wrapped(op: ReduceOps, t: Tensor) -> Tensor:
     return Tensor(MultiLazyBuffer(all_reduce(op, t.lazydata.lbs), 0), device=devs)
   _jitted = TinyJit(_wrapped) if getenv("USEJIT", 1) == 1 else _wrapped
@@ -31,41 +31,53 @@ def test(devs: List[str], N: int, iters:int = 10):
     if DEBUG >= 2: i_secs = GlobalCounters.time_sum_s
     i_gflops = GlobalCounters.global_ops/i_secs/10**9
     i_gbs = (N*4)/i_secs/10**9
-    print(f"{'ring_allreduce' if RING >= 2 else 'naive_allreduce'} iter {i+1}/{iters}: {i_secs:.6f} sec {i_gflops:.2f} GFLOP/s {i_gbs:.2f} GB/s")
+    if DEBUG >= 1: print(f"{algo}_allreduce iter {i+1}/{iters}: {i_secs:.6f} sec {i_gflops:.2f} GFLOP/s {i_gbs:.2f} GB/s")
     secs += i_secs
     gflops += i_gflops
     gbs += i_gbs
 
   return (gflops/iters, gbs/iters, secs/iters)
 
-def run(sz, n_gpus=6, iters=10):
+def run(sz, n_gpus=6, iters=10, algos=tuple(ALL_REDUCE_ALGORITHMS)):
   dev = Device.DEFAULT
   devs = tuple([f"{dev}:{x}" for x in range(n_gpus)])
   N = sz // 4 # float32 is 4 bytes
 
-  with Context(RING=2):
-    (ring_gflops, ring_gbs, ring_secs) = test(devs, N, iters=iters)
-  with Context(RING=0):
-    (naive_gflops, naive_gbs, naive_secs) = test(devs, N, iters=iters)
-  return (ring_gflops, ring_gbs, ring_secs), (naive_gflops, naive_gbs, naive_secs)
+  ret = {}
+  for algo in algos:
+    with Context(ALLREDUCE=algo): ret[algo] = test(devs, N, algo, iters=iters)
+  return ret
+
+def tune(n_gpus:int, iters:int):
+  # time every algorithm on sizes from 4 KB to 256 MB and store the fastest one per size for select_all_reduce
+  table = []
+  for sz in [2**x for x in range(12, getenv("MAX_SZ_LOG2", 28)+1, 2)]:
+    res = run(sz, n_gpus=n_gpus, iters=iters)
+    best = min(res, key=lambda algo: res[algo][2])
+    print(f"{sz:12d} bytes: " + " ".join(f"{algo} {res[algo][2]*1e3:8.3f} ms" for algo in res) + f" -> {best}")
+    if table and table[-1][1] == best: table[-1] = (sz, best)
+    else: table.append((sz, best))
+  print(f"tuning table for {n_gpus} {Device.DEFAULT}: {table}")
+  diskcache_put("allreduce_tuning", {"device":Device.DEFAULT, "n":n_gpus}, table)
 
 def main():
   n_gpus = getenv("GPUS", 6)
 
-  if getenv("BENCHMARK_SPLIT"):
+  if getenv("TUNE"):
+    tune(n_gpus, iters=getenv("ITERS", 10))
+  elif getenv("BENCHMARK_SPLIT"):
     l, r = 0, 512
     while r - l > 1:
       m = (l + r) // 2
-      (ring_gflops, ring_gbs, ring_secs), (naive_gflops, naive_gbs, naive_secs) = run(m * 1024 * 4, n_gpus=n_gpus, iters=100)
-      if ring_secs > naive_secs: l = m
+      res = run(m * 1024 * 4, n_gpus=n_gpus, iters=100, algos=("ring", "naive"))
+      if res["ring"][2] > res["naive"][2]: l = m
       else: r = m
     print("Better split", r * 1024, "elements")
   else:
     sz = getenv("SZ", 1000) * 10**6 # size of data on each gpu
     print(f"Using {sz/10**9:.2f} GB of numbers on each of {n_gpus} GPUs, {n_gpus*sz/10**9:.2f} GB total.")
-    (ring_gflops, ring_gbs, ring_secs), (naive_gflops, naive_gbs, naive_secs) = run(sz)
-    print(f"Ring:\n  {ring_secs:.6f} seconds/iter\n  {ring_gflops:.2f} GFLOP/s\n  {ring_gbs:.2f} GB/s")
-    print(f"Naive:\n  {naive_secs:.6f} seconds/iter\n  {naive_gflops:.2f} GFLOP/s\n  {naive_gbs:.2f} GB/s")
+    for algo, (gflops, gbs, secs) in run(sz, n_gpus=n_gpus).items():
+      print(f"{algo}:\n  {secs:.6f} seconds/iter\n  {gflops:.2f} GFLOP/s\n  {gbs:.2f} GB/s")
 
 if __name__ == "__main__":
-  main()
\ No newline at end of file
+  main()
@@ -0,0 +1,30 @@
+# decode speed and weight memory of a stack of llama sized linears, unquantized vs int8 vs block-wise int4
+import time
+from tinygrad import Tensor, TinyJit, dtypes, nn, Device
+from tinygrad.helpers import getenv
+from tinygrad.nn.state import get_parameters
+from examples.llama3 import Int8Linear, Int4Linear
+
+if __name__ == "__main__":
+  DIM, LAYERS, CNT = getenv("DIM", 4096), getenv("LAYERS", 4), getenv("CNT", 20)
+  dtype = dtypes.half if getenv("HALF", int(Device.DEFAULT != "CLANG")) else dtypes.float
+  weights = {f"feed_forward.w{i}.weight": Tensor.randn(DIM, DIM, dtype=dtype).realize() for i in range(LAYERS)}
+  for name, linear in [(dtype.name, nn.Linear), ("int8", Int8Linear), ("int4", Int4Linear(32, dtype))]:
+    if name == "int8" and dtype != dtypes.half: continue  # Int8Linear computes in half
+    layers = [linear(DIM, DIM, bias=False) for _ in range(LAYERS)]
+    sd = weights if linear is nn.Linear else linear.quantize(weights, Device.DEFAULT)
+    for i,l in enumerate(layers):
+      l.weight = sd[f"feed_forward.w{i}.weight"].realize()
+      if hasattr(l, "scale"): l.scale = sd[f"feed_forward.w{i}.scale"].realize()
+    @TinyJit
+    def step(x:Tensor) -> Tensor:
+      for l in layers: x = l(x)
+      return x.realize()
+    tms = []
+    for _ in range(CNT):
+      x = Tensor.randn(1, DIM, dtype=dtype).realize()
+      st = time.perf_counter()
+      step(x).numpy()
+      tms.append(time.perf_counter() - st)
+    param_bytes = sum(x.lazydata.size * x.dtype.itemsize for x in get_parameters(layers))
+    print(f"{name:8s} weights {param_bytes/1e6:9.2f} MB   {1/min(tms):9.2f} tok/s   {param_bytes/min(tms)/1e9:7.2f} GB/s")
@@ -0,0 +1,21 @@
+# cost of creating small tensors from python lists and bytes, like the token ids fed to a serving loop every step
+import time
+from tinygrad import Tensor, dtypes
+from tinygrad.helpers import getenv
+
+def bench(name:str, fxn, cnt:int):
+  fxn()
+  st = time.perf_counter()
+  for _ in range(cnt): fxn()
+  print(f"{name:32s} {(time.perf_counter()-st)*1e6/cnt:9.2f} us")
+
+if __name__ == "__main__":
+  CNT = getenv("CNT", 2000)
+  toks, floats = list(range(100, 164)), [x/3 for x in range(4096)]
+  bench("64 token ids", lambda: Tensor(toks), CNT)
+  bench("64 token ids, realized", lambda: Tensor(toks).realize(), CNT)
+  bench("8x64 nested token ids", lambda: Tensor([toks]*8), CNT)
+  bench("64 token ids as uint16", lambda: Tensor(toks, dtype=dtypes.uint16), CNT)
+  bench("4096 floats", lambda: Tensor(floats), CNT//10)
+  bench("4096 floats as bfloat16", lambda: Tensor(floats, dtype=dtypes.bfloat16), CNT//10)
+  bench("64 KB of bytes", lambda: Tensor(bytes(65536)), CNT//4)
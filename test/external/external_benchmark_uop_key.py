@@ -0,0 +1,36 @@
+# cost of UOp.key for a 10k node AST, when built fresh, when cached and when an identical AST is interned
+import hashlib, functools, sys
+from tinygrad.dtype import dtypes, PtrDType
+from tinygrad.ops import UOp, UOps, BinaryOps
+from tinygrad.shape.shapetracker import ShapeTracker
+from tinygrad.helpers import Timing, getenv
+
+def build(n:int) -> UOp:
+  # a balanced tree of n loads summed together, every load has its own ShapeTracker like a real kernel AST
+  st = ShapeTracker.from_shape((16, 16))
+  def load(i:int):
+    vst = st.shrink(((0, 16), (0, 16-i%8)))
+    idx, valid = UOp(UOps.ST_IDX, dtypes.pyint, (), vst), UOp(UOps.ST_VALID, dtypes.bool, (), vst)
+    return UOp(UOps.LOAD, dtypes.float, (UOp(UOps.DEFINE_GLOBAL, PtrDType(dtypes.float), (), i+1), idx, valid))
+  loads = [load(i) for i in range(n//5)]
+  while len(loads) > 1: loads = [a.alu(BinaryOps.ADD, b) for a,b in zip(loads[::2], loads[1::2])] + loads[len(loads)//2*2:]
+  return UOp(UOps.SINK, None, (UOp(UOps.STORE, None, (UOp(UOps.DEFINE_GLOBAL, PtrDType(dtypes.float), (), 0), loads[0])),))
+
+def uncached_key(u:UOp) -> bytes:
+  # what key used to cost when it had to be recomputed on every access
+  return hashlib.sha256(functools.reduce(lambda x,y: x+y, [uncached_key(s) for s in u.src], str((u.op, u.dtype, u.arg)).encode())).digest()
+
+if __name__ == "__main__":
+  sys.setrecursionlimit(10000)
+  N, CNT = getenv("N", 10000), getenv("CNT", 10)
+  ast = build(N)
+  print(f"{len(ast.sparents)} uops")
+  with Timing(f"{CNT}x uncached key: "):
+    for _ in range(CNT): uncached_key(ast)
+  with Timing("first key: "): key = ast.key
+  with Timing(f"{CNT}x cached key: "):
+    for _ in range(CNT): assert ast.key == key
+  with Timing("intern: "): ast = ast.intern()
+  with Timing("build an identical AST: "): ast2 = build(N)
+  with Timing("intern the identical AST: "): ast2 = ast2.intern()
+  with Timing("key of the identical AST: "): assert ast2.key == key
@@ -2,9 +2,11 @@
 import os
 import time
 import unittest
+import tempfile, pathlib
 import numpy as np
 import onnx
-from extra.onnx import get_run_onnx
+from onnx import helper, numpy_helper, TensorProto
+from extra.onnx import get_run_onnx, get_jit_onnx
 from tinygrad.tensor import Tensor
 from tinygrad.helpers import CI, fetch, temp
 
@@ -135,5 +137,32 @@ class TestOnnxModel(unittest.TestCase):
     print(cls, _LABELS[cls])
     assert "car" in _LABELS[cls] or _LABELS[cls] == "convertible"
 
+class TestOnnxAOT(unittest.TestCase):
+  def _model(self, fn:str):
+    # y = reshape(x @ transpose(w) + (b * 2), shape), where transpose(w), b * 2 and shape only depend on initializers
+    w, b = np.random.randn(8, 16).astype(np.float32), np.random.randn(8).astype(np.float32)
+    nodes = [helper.make_node("Transpose", ["w"], ["wt"]), helper.make_node("Constant", [], ["two"], value=numpy_helper.from_array(np.float32(2))),
+             helper.make_node("Mul", ["b", "two"], ["b2"]), helper.make_node("MatMul", ["x", "wt"], ["xw"]),
+             helper.make_node("Add", ["xw", "b2"], ["z"]), helper.make_node("Reshape", ["z", "shape"], ["y"])]
+    graph = helper.make_graph(nodes, "aot", [helper.make_tensor_value_info("x", TensorProto.FLOAT, [4, 16])],
+                              [helper.make_tensor_value_info("y", TensorProto.FLOAT, [2, 16])],
+                              [numpy_helper.from_array(w, "w"), numpy_helper.from_array(b, "b"), numpy_helper.from_array(np.array([2, 16]), "shape")])
+    onnx.save(helper.make_model(graph), fn, save_as_external_data=True, all_tensors_to_one_file=True, location="aot.data", size_threshold=0)
+    return w, b
+
+  def test_fold_and_mmap(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      w, b = self._model(fn:=str(pathlib.Path(tmp) / "aot.onnx"))
+      x = np.random.randn(4, 16).astype(np.float32)
+      expected = (x @ w.T + b * 2).reshape(2, 16)
+      np.testing.assert_allclose(get_run_onnx(onnx.load(fn), fold=False)({"x": x})["y"].numpy(), expected, atol=1e-5)
+      model = onnx.load(fn, load_external_data=False)
+      self.assertEqual(model.graph.initializer[0].data_location, TensorProto.EXTERNAL)
+      np.testing.assert_allclose(get_run_onnx(model, fn)({"x": x})["y"].numpy(), expected, atol=1e-5)
+      run = get_jit_onnx(model, fn)
+      for _ in range(4):
+        x = np.random.randn(4, 16).astype(np.float32)
+        np.testing.assert_allclose(run({"x": x})["y"].numpy(), (x @ w.T + b * 2).reshape(2, 16), atol=1e-5)
+
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+import numpy as np
+from tinygrad import Tensor, dtypes, GlobalCounters
+from tinygrad.ops import UOps
+from examples.llama3 import Int8Linear, Int4Linear
+
+class TestQuantizedLinear(unittest.TestCase):
+  def test_int4_roundtrip(self):
+    w = Tensor.randn(64, 128).realize()
+    sd = Int4Linear(32, dtypes.float).quantize({"feed_forward.w1.weight": w}, None)
+    self.assertEqual(sd["feed_forward.w1.weight"].shape, (64, 64))
+    self.assertEqual(sd["feed_forward.w1.weight"].dtype, dtypes.uint8)
+    self.assertEqual(sd["feed_forward.w1.scale"].shape, (64, 4))
+    lin = Int4Linear(32, dtypes.float)(128, 64)
+    lin.weight, lin.scale = sd["feed_forward.w1.weight"].realize(), sd["feed_forward.w1.scale"].realize()
+    x = Tensor.randn(1, 128).realize()
+    # decoding one token, the unpack and the scales fuse into the matmul and no dequantized weight is ever stored
+    GlobalCounters.reset()
+    out = lin(x).numpy()
+    self.assertEqual(GlobalCounters.kernel_count, 1)
+    # each weight is off by at most half a step of its group's scale
+    wn, sn = w.numpy(), sd["feed_forward.w1.scale"].numpy()
+    deq = (lin(Tensor.eye(128)).numpy().T).reshape(64, 4, 32)
+    self.assertTrue((np.abs(deq - wn.reshape(64, 4, 32)) <= sn[..., None]/2 + 1e-5).all())
+    np.testing.assert_allclose(out, x.numpy() @ deq.reshape(64, 128).T, atol=1e-4, rtol=1e-4)
+
+  def test_int8_fuses(self):
+    lin = Int8Linear(128, 64)
+    lin.weight.realize(), lin.scale.realize()
+    sched = lin(Tensor.empty(1, 128, dtype=dtypes.half)).schedule()
+    self.assertEqual(len([si for si in sched if si.ast.op is UOps.SINK]), 1)
+
+if __name__ == '__main__':
+  unittest.main()
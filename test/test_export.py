@@ -0,0 +1,63 @@
+import unittest, ctypes, subprocess, tempfile, pathlib
+import numpy as np
+from tinygrad import Tensor, TinyJit, Variable, Device, nn
+from tinygrad.engine.export import export_c
+
+class Model:
+  def __init__(self):
+    self.l1, self.l2, self.l3 = nn.Linear(16, 32), nn.Linear(32, 8), nn.Linear(16, 8)
+    self.steps = Tensor.zeros(8).contiguous().realize()
+  def __call__(self, x:Tensor, y:Tensor):
+    self.steps.assign(self.steps + 1).realize()
+    return (self.l2(self.l1(x).relu()) + self.l3(y).tanh() + self.steps).realize(), (x*2).sum(1).realize()
+
+def _load(src:str, blob:bytes):
+  with tempfile.TemporaryDirectory() as tmp:
+    (pathlib.Path(tmp) / "net.c").write_text(src)
+    subprocess.check_output(["clang", "-shared", "-O2", "-fPIC", "-pthread", f"{tmp}/net.c", "-o", f"{tmp}/net.so"])
+    lib = ctypes.CDLL(f"{tmp}/net.so")
+  lib.net_init.restype = ctypes.c_void_p
+  weights = (ctypes.c_uint8 * len(blob)).from_buffer_copy(blob)
+  return lib, weights, ctypes.c_void_p(lib.net_init(weights))
+
+def _ptr(x:np.ndarray): return x.ctypes.data_as(ctypes.c_void_p)
+
+@unittest.skipUnless(Device.DEFAULT == "CLANG", "export is CLANG only")
+class TestExportC(unittest.TestCase):
+  def test_matches_jit(self):
+    for threads in [1, 3]:
+      model = Model()
+      jit = TinyJit(model)
+      for _ in range(3): jit(Tensor.randn(4, 16), Tensor.randn(4, 16))
+      lib, weights, net = _load(*export_c(jit, threads=threads))
+      for _ in range(2):
+        x, y = np.random.randn(4, 16).astype(np.float32), np.random.randn(4, 16).astype(np.float32)
+        out0, out1 = np.zeros((4, 8), np.float32), np.zeros((4,), np.float32)
+        lib.net_run(net, _ptr(x), _ptr(y), _ptr(out0), _ptr(out1))
+        ref0, ref1 = jit(Tensor(x), Tensor(y))
+        # the step counter is state, exported with the value it had and updated by both sides
+        np.testing.assert_allclose(out0, ref0.numpy(), atol=1e-5)
+        np.testing.assert_allclose(out1, ref1.numpy(), atol=1e-5)
+      lib.net_free(net)
+      del weights
+
+  def test_variable(self):
+    w = Tensor.randn(4).realize()
+    @TinyJit
+    def f(x:Tensor) -> Tensor: return (x * w).sum(0).realize()
+    for i in range(1, 4): f(Tensor.randn(i, 4).reshape(Variable("n", 1, 10).bind(i), 4))
+    lib, weights, net = _load(*export_c(f))
+    x, out = np.random.randn(7, 4).astype(np.float32), np.zeros((4,), np.float32)
+    lib.net_run(net, _ptr(x), _ptr(out), 7)
+    np.testing.assert_allclose(out, (x * w.numpy()).sum(0), atol=1e-5)
+    lib.net_free(net)
+    del weights
+
+  def test_not_clang(self):
+    @TinyJit
+    def f(x:Tensor) -> Tensor: return (x+1).to("PYTHON").realize()
+    for _ in range(3): f(Tensor.randn(4))
+    with self.assertRaises(NotImplementedError): export_c(f)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,7 +1,12 @@
 #!/usr/bin/env python
-import unittest
+import unittest, random, io, contextlib
+from unittest.mock import patch
 from tinygrad.tensor import Tensor
 from tinygrad import Device
+from tinygrad.ops import UOps
+from tinygrad.helpers import Context, CACHELEVEL, diskcache_get, diskcache_put
+from tinygrad.engine import realize
+from tinygrad.engine.realize import get_program, get_kernel, lower_schedule, _program_key, _rename_program
 
 class TestKernelCache(unittest.TestCase):
   def test_kernel_cache_in_action(self):
@@ -23,5 +28,63 @@ class TestKernelCache(unittest.TestCase):
 
     Device['CLANG'].compiler = orig_compile_func
 
+@unittest.skipIf(CACHELEVEL < 1, "needs the disk cache")
+class TestProgramCache(unittest.TestCase):
+  def setUp(self):
+    # a fresh constant so entries from an earlier run don't hit
+    self.ast = (Tensor.empty(4, 4) + random.random()).schedule()[-1].ast
+    self.renderer = Device[Device.DEFAULT].renderer
+
+  def test_warm_skips_codegen(self):
+    prg = get_program(self.renderer, Device.DEFAULT, self.ast)
+    with patch("tinygrad.engine.realize.get_kernel", side_effect=AssertionError("codegen ran")):
+      cached = get_program(self.renderer, Device.DEFAULT, self.ast)
+    # the hit is renamed so function names stay unique in the process
+    self.assertNotEqual(cached.function_name, prg.function_name)
+    self.assertEqual(cached.src.replace(cached.function_name, prg.function_name), prg.src)
+    self.assertEqual((cached.globals, cached.outs, cached.op_estimate), (prg.globals, prg.outs, prg.op_estimate))
+
+  def test_context_is_in_key(self):
+    get_program(self.renderer, Device.DEFAULT, self.ast)
+    with Context(NOOPT=1):
+      self.assertIsNone(diskcache_get("program", _program_key(self.renderer, Device.DEFAULT, self.ast)))
+
+  def test_corrupt_entry_is_miss(self):
+    prg = get_program(self.renderer, Device.DEFAULT, self.ast)
+    key = _program_key(self.renderer, Device.DEFAULT, self.ast)
+    digest, blob = diskcache_get("program", key)
+    diskcache_put("program", key, (digest, blob[:-1]))
+    with patch("tinygrad.engine.realize.get_kernel", wraps=get_kernel) as gk:
+      self.assertEqual((new:=get_program(self.renderer, Device.DEFAULT, self.ast)).src.replace(new.function_name, prg.function_name), prg.src)
+    gk.assert_called_once()
+    self.assertEqual(diskcache_get("program", key), (digest, blob))
+
+  def test_debug_bypasses_cache(self):
+    get_program(self.renderer, Device.DEFAULT, self.ast)
+    with patch("tinygrad.engine.realize.get_kernel", wraps=get_kernel) as gk, Context(DEBUG=3), contextlib.redirect_stdout(io.StringIO()):
+      get_program(self.renderer, Device.DEFAULT, self.ast)
+    gk.assert_called_once()
+
+  def test_key_is_stable_across_processes(self):
+    # an attribute that isn't a codegen option, with an address in its repr, must not end up in the key
+    key = _program_key(self.renderer, Device.DEFAULT, self.ast)
+    with patch.object(self.renderer, "handle", object(), create=True):
+      self.assertEqual(_program_key(self.renderer, Device.DEFAULT, self.ast), key)
+    with patch.object(self.renderer, "shared_max", self.renderer.shared_max+1):
+      self.assertNotEqual(_program_key(self.renderer, Device.DEFAULT, self.ast), key)
+
+class TestParallelCodegen(unittest.TestCase):
+  def test_matches_serial(self):
+    c = random.random()
+    a, b = Tensor.empty(8, 8) + c, (Tensor.empty(4, 16) * c).sum(1)
+    sched = [si for si in a.schedule(b) if si.ast.op is UOps.SINK]
+    with Context(PARALLEL_CODEGEN=2): eis = list(lower_schedule(sched[:]))
+    self.assertIsNotNone(realize.codegen_pool)
+    self.assertEqual(len(set(ei.prg.p.function_name for ei in eis)), 2)
+    # the workers lower to the same source as lowering here
+    for si,ei in zip(sched, eis):
+      k = get_kernel(Device[Device.DEFAULT].renderer, si.ast)
+      self.assertEqual(_rename_program(ei.prg.p, k.base_name).src, k.to_program(name_override=k.base_name).src)
+
 if __name__ == "__main__":
   unittest.main()
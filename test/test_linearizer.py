@@ -895,7 +895,9 @@ class TestLinearizer(unittest.TestCase):
   def test_tensor_cores(self):
     for tc in Device[Device.DEFAULT].renderer.tensor_cores:
       if (getenv("EMULATE_CUDA") or getenv("EMULATE_INTEL")) and (tc.dtype_in == dtypes.bfloat16 or tc.dtype_out == dtypes.bfloat16): continue
-      helper_tc_allclose(tc.dims[0], tc.dims[1], tc.dims[2], tc.dtype_in, tc.dtype_out, axis=0, tc_opt=0)
+      # cpu tensor cores have M=K=1, a matmul that small has no reduce
+      n, m, k = [max(d, 2) for d in tc.dims]
+      helper_tc_allclose(n, m, k, tc.dtype_in, tc.dtype_out, axis=0, tc_opt=0)
 
   @unittest.skipUnless(Device[Device.DEFAULT].renderer.tensor_cores, "test requires tensor cores")
   def test_tensor_cores_padded(self):
@@ -914,9 +916,9 @@ class TestLinearizer(unittest.TestCase):
                                            tc.dtype_in, tc.dtype_out, tc_opt=0, ensure_triggered=False)
 
       # check excessive padding doesn't trigger padded TC in TC_OPT=2
-      helper_tc_ensure_uops_and_opts_count(tc.dims[0]//4, tc.dims[1], tc.dims[2], tc.dtype_in, tc.dtype_out, tc_opt=2, ensure_triggered=False)
-      helper_tc_ensure_uops_and_opts_count(tc.dims[0], tc.dims[1]//4, tc.dims[2], tc.dtype_in, tc.dtype_out, tc_opt=2, ensure_triggered=False)
-      helper_tc_ensure_uops_and_opts_count(tc.dims[0], tc.dims[1], tc.dims[2]//4, tc.dtype_in, tc.dtype_out, tc_opt=2, ensure_triggered=False)
+      for i in [i for i in range(3) if tc.dims[i] >= 4]:
+        helper_tc_ensure_uops_and_opts_count(*[d//4 if j == i else d for j,d in enumerate(tc.dims)], tc.dtype_in, tc.dtype_out, tc_opt=2,
+                                             ensure_triggered=False)
 
       # check correctness
       helper_tc_allclose(tc.dims[0]+pad, tc.dims[1]+pad, tc.dims[2]+pad, tc.dtype_in, tc.dtype_out, tc_opt=2)
@@ -964,7 +966,7 @@ class TestLinearizer(unittest.TestCase):
       if u.op is UOps.WMMA:
         assert u.src[-1].src[0].op != UOps.PHI
 
-  @unittest.skipUnless(Device[Device.DEFAULT].renderer.tensor_cores, "test requires tensor cores")
+  @unittest.skipUnless(any(tc.dtype_in != tc.dtype_out for tc in Device[Device.DEFAULT].renderer.tensor_cores), "test requires casted tensor cores")
   def test_tensor_cores_unroll_casted_phi(self):
     tc = [tc for tc in Device[Device.DEFAULT].renderer.tensor_cores if tc.dtype_in != tc.dtype_out][0]
     x, y = Tensor.rand(128, 128, dtype=tc.dtype_in), Tensor.rand(128, 128, dtype=tc.dtype_in)
@@ -975,7 +977,7 @@ class TestLinearizer(unittest.TestCase):
         #assert u.src[-1].dtype == dtypes.float.vec(prod(tc.thread_local_sizes[2]))
         assert u.src[-1].src[0].op != UOps.PHI
 
-  @unittest.skipUnless(Device[Device.DEFAULT].renderer.tensor_cores, "test requires tensor cores")
+  @unittest.skipUnless(any(tc.dtype_in != tc.dtype_out for tc in Device[Device.DEFAULT].renderer.tensor_cores), "test requires casted tensor cores")
   def test_tensor_cores_unroll_casted_phi_with_children(self):
     # all PHI children are outside the loop
     tc = [tc for tc in Device[Device.DEFAULT].renderer.tensor_cores if tc.dtype_in != tc.dtype_out][0]
@@ -1240,6 +1242,10 @@ class TestLinearizer(unittest.TestCase):
 
 @unittest.skipUnless(Device[Device.DEFAULT].renderer.supports_float4, "need backends that support float4")
 class TestFloat4(unittest.TestCase):
+  # these check the classic float4 folding, the host-width folding CPU renderers do is checked in test_wide_vectors
+  def setUp(self): self.vector_bytes, Device[Device.DEFAULT].renderer.vector_bytes = Device[Device.DEFAULT].renderer.vector_bytes, None
+  def tearDown(self): Device[Device.DEFAULT].renderer.vector_bytes = self.vector_bytes
+
   @staticmethod
   def count_float4(k):
     return (len([uop for uop in k.uops if uop.op is UOps.LOAD and uop.dtype == dtypes.float.vec(4)]),
@@ -1263,6 +1269,23 @@ class TestFloat4(unittest.TestCase):
 
     assert TestFloat4.count_float4(k) == (2, 1)
 
+  def test_wide_vectors(self):
+    Device[Device.DEFAULT].renderer.vector_bytes = 64
+    a = Tensor.rand(64).realize()
+    b = Tensor.rand(64).realize()
+    c = a * b + a
+
+    s = create_schedule([c.lazydata])[0]
+    k = Kernel(s.ast)
+    k.hand_coded_optimizations()
+    k.linearize()
+
+    assert len([u for u in k.uops if u.op is UOps.LOAD and u.dtype == dtypes.float.vec(16)]) == 2
+    assert len([u for u in k.uops if u.op is UOps.STORE and u.src[2].dtype == dtypes.float.vec(16)]) == 1
+    # the ALU is done on the vectors if the renderer can
+    vec_alus = [u for u in k.uops if u.op is UOps.ALU and u.dtype == dtypes.float.vec(16)]
+    assert len(vec_alus) == (2 if BinaryOps.ADD in k.opts.vector_alus else 0)
+
   def test_float4_multidim(self):
     a = Tensor.rand(2, 8).realize()
     b = Tensor.rand(2, 8).realize()
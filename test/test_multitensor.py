@@ -1,12 +1,13 @@
 import unittest, functools, random
-from typing import List
+from unittest.mock import patch
+from typing import List, Optional
 from tinygrad import Tensor, Device, nn, GlobalCounters, TinyJit, dtypes
 from tinygrad.ops import MetaOps, ReduceOps, BinaryOps, UOps
-from tinygrad.helpers import CI, getenv, prod, Context
+from tinygrad.helpers import CI, getenv, prod, Context, flatten
 from tinygrad.nn.state import get_parameters, get_state_dict
 from tinygrad.engine.schedule import create_schedule
-from tinygrad.engine.realize import lower_schedule, BufferCopy, CompiledRunner
-from tinygrad.multi import all_reduce, MultiLazyBuffer
+from tinygrad.engine.realize import lower_schedule, run_schedule, BufferCopy, CompiledRunner
+from tinygrad.multi import all_reduce, bucketed_all_reduce, select_all_reduce, MultiLazyBuffer, ALL_REDUCE_ALGORITHMS, _tuning_tables
 import numpy as np
 from hypothesis import given, strategies as strat, settings
 from test.helpers import is_dtype_supported
@@ -165,6 +166,45 @@ class TestMultiTensor(unittest.TestCase):
       a,b = _test_allreduce(Tensor.rand(256, 256))
       np.testing.assert_almost_equal(a.numpy(), b.numpy(), decimal=5)
 
+  def test_allreduce_tree(self):
+    with Context(ALLREDUCE="tree"):
+      a,b = _test_allreduce(Tensor.rand(256, 256))
+      np.testing.assert_almost_equal(a.numpy(), b.numpy(), decimal=5)
+
+  def test_allreduce_halving_doubling(self):
+    with Context(ALLREDUCE="halving_doubling"):
+      a,b = _test_allreduce(Tensor.rand(256, 256))
+      np.testing.assert_almost_equal(a.numpy(), b.numpy(), decimal=5)
+
+  def test_allreduce_hierarchical(self):
+    with Context(ALLREDUCE="hierarchical", ALLREDUCE_GROUP=2):
+      a,b = _test_allreduce(Tensor.rand(256, 256))
+      np.testing.assert_almost_equal(a.numpy(), b.numpy(), decimal=5)
+
+  def test_allreduce_algorithms_uneven(self):
+    for algo in ALL_REDUCE_ALGORITHMS:
+      for devices in (devices_3, devices_4, (d0, d1, d2, d3, d4)):
+        t = Tensor.rand(len(devices)*3, 7).realize()
+        ts = t.shard(devices, 0).realize()
+        with Context(ALLREDUCE=algo):
+          b = Tensor(MultiLazyBuffer(all_reduce(ReduceOps.MAX, ts.lazydata.lbs), 0))
+          np.testing.assert_equal(b.numpy(), np.tile(t.numpy().reshape(len(devices), 3, 7).max(0), (len(devices), 1)))
+
+  # a tuning table written to the disk cache by the allreduce benchmark would change the picks
+  @patch("tinygrad.multi.diskcache_get", return_value=None)
+  def test_select_allreduce(self, _):
+    with patch.dict(_tuning_tables, clear=True):
+      assert select_all_reduce(d0, 2, 2**20, 4) == "naive"
+      assert select_all_reduce(d0, 4, 16, 4) == "naive"
+      assert select_all_reduce(d0, 4, 2**20, 4) == "ring"
+      with Context(RING=2): assert select_all_reduce(d0, 2, 16, 4) == "ring"
+      with Context(ALLREDUCE_GROUP=2): assert select_all_reduce(d0, 4, 16, 4) == "hierarchical"
+      _tuning_tables[(Device.DEFAULT, 4)] = [(1024, "tree"), (2**20, "halving_doubling"), (2**24, "hierarchical")]
+      assert select_all_reduce(d0, 4, 16, 4) == "tree"
+      assert select_all_reduce(d0, 4, 2**16, 4) == "halving_doubling"
+      assert select_all_reduce(d0, 4, 2**30, 4) == "hierarchical"
+      assert select_all_reduce(d0, 4, 2**30, 4, flat=True) == "ring"
+
   def test_copy_jit(self):
     @TinyJit
     def copy_tensor(x:Tensor): return (x.to(f"{x.device.split(':')[0]}:1") + 1)
@@ -204,6 +244,47 @@ class TestMultiTensor(unittest.TestCase):
         assert mean_err < 1e-6, f"big mean error, iteration {it}_{n}"
         assert max_err < 1e-6, f"big max error, iteration {it}_{n}"
 
+  def test_bucketed_allreduce(self):
+    ts = [Tensor.rand(64, 8), Tensor.rand(33), Tensor.rand(4, 4, 4), Tensor.rand(100)]
+    lbss = [t.shard(devices_4).lazydata.lbs for t in ts]
+    for bucket_size in (1, 256*4, 2**20):
+      reduced = bucketed_all_reduce(ReduceOps.SUM, lbss, bucket_size)
+      for t, lbs in zip(ts, reduced): np.testing.assert_allclose(Tensor(MultiLazyBuffer(lbs, None)).numpy(), t.numpy()*4, atol=1e-6, rtol=1e-6)
+
+  def _train_step(self, bucket_size:Optional[int]):
+    Tensor.manual_seed(1337)
+    with Tensor.train():
+      layers = [nn.Linear(16, 32), nn.Linear(32, 8)]
+      for p in get_parameters(layers): p.shard_(devices_3).realize().requires_grad = True
+      x = Tensor.rand(6, 16).shard(devices_3, axis=0).realize()
+      loss = x.sequential(layers).relu().sum()
+      if bucket_size is None: loss.backward()
+      else: nn.optim.data_parallel_backward(loss, get_parameters(layers), bucket_size)
+      grads = [p.grad for p in get_parameters(layers)]
+      sched = create_schedule(flatten([g.lazydata.lbs for g in grads]))
+      copies = len([si for si in sched if si.ast.op is UOps.EXT and si.ast.arg[0] is MetaOps.COPY])
+      run_schedule(sched)
+      return [g.numpy() for g in grads], copies
+
+  def test_deferred_allreduce_cast(self):
+    t = Tensor.rand(8, 4).shard(devices_4, axis=0)
+    with Context(DEFER_ALLREDUCE=1):
+      s, m = t.sum(0), (t*100).cast(dtypes.int32).max(0)
+      self.assertIsNotNone(s.lazydata.unreduced)
+      # a cast of the summed parts isn't the cast of the sum, not even a widening one
+      for dt in (dtypes.int32, dtypes.float16, dtypes.float64): self.assertIsNone(s.cast(dt).lazydata.unreduced)
+      # a max commutes with a cast that loses nothing
+      self.assertIsNotNone(m.cast(dtypes.int64).lazydata.unreduced)
+      self.assertIsNone(m.cast(dtypes.int16).lazydata.unreduced)
+      self.assertIsNone(m.cast(dtypes.float32).lazydata.unreduced)
+
+  def test_data_parallel_backward_bucketed(self):
+    grads, copies = self._train_step(None)
+    bucketed_grads, bucketed_copies = self._train_step(2**20)
+    for g, bg in zip(grads, bucketed_grads): np.testing.assert_allclose(g, bg, atol=1e-5, rtol=1e-5)
+    # one naive all-reduce for all four gradients instead of one each
+    assert copies == 4*bucketed_copies, (copies, bucketed_copies)
+
   def _test_matmul_shard_axis(self, shard_x, shard_w, device):
     X = Tensor.kaiming_uniform(N, N).realize()
     W = Tensor.kaiming_uniform(N, N).realize()
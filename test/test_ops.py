@@ -750,6 +750,11 @@ class TestOps(unittest.TestCase):
                                                 lambda a,b: Tensor.einsum('zqrs,tuqvr->zstuv', a,b), atol=1e-5)
     # bilinear transformation
     helper_test_op([(2,3),(5,3,7),(2,7)], lambda a,b,c: torch.einsum('ik,jkl,il->ij', [a,b,c]), lambda a,b,c: Tensor.einsum('ik,jkl,il->ij', [a,b,c]))
+    # chains of contractions, planned pairwise
+    helper_test_op([(10,15),(15,20),(20,5)], lambda a,b,c: torch.einsum('ij,jk,kl->il', [a,b,c]),
+                                             lambda a,b,c: Tensor.einsum('ij,jk,kl->il', [a,b,c]))
+    helper_test_op([(4,5),(5,6),(6,7),(7,3)], lambda a,b,c,d: torch.einsum('ab,bc,cd,de->ea', [a,b,c,d]),
+                                              lambda a,b,c,d: Tensor.einsum('ab,bc,cd,de->ea', [a,b,c,d]))
     # test ellipsis # TODO: FIXME
     with self.assertRaises(Exception):
       helper_test_op([(16,29,256),(16,29,256)], lambda a,b: torch.einsum('...id, ...jd -> ...ij', [a,b]),
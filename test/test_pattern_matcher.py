@@ -1,8 +1,8 @@
 import unittest, itertools
 from test.helpers import TestUOps
 from tinygrad.dtype import dtypes
-from tinygrad.ops import UOps, UOp, PatternMatcher, UPat, BinaryOps, TernaryOps, ReduceOps, UnaryOps # noqa: F401
-from tinygrad.codegen.uopgraph import constant_folder
+from tinygrad.ops import UOps, UOp, PatternMatcher, UPat, BinaryOps, TernaryOps, ReduceOps, UnaryOps, _match # noqa: F401
+from tinygrad.codegen.uopgraph import constant_folder, expander, reducer, float4_folding
 
 class TestPatternMatcher(TestUOps):
   def test_simple_match(self):
@@ -181,5 +181,40 @@ class TestPatternMatcher(TestUOps):
       for pat,_ in rules:
         self._assert_eq_upat(pat, eval(str(pat)))
 
+class TestCompiledPatternMatcher(unittest.TestCase):
+  # the generated rewrite must fire the same pattern with the same match as trying every UPat in order with _match
+  def test_same_matches(self):
+    from tinygrad import Tensor
+    seen = []
+    def record(self, uop):
+      seen.append(uop)
+      return rewrite(self, uop)
+    rewrite, PatternMatcher.rewrite = PatternMatcher.rewrite, record
+    try:
+      for t in [Tensor.empty(4, 9) @ Tensor.empty(9, 5), Tensor.empty(1, 3, 8, 8).conv2d(Tensor.empty(4, 3, 3, 3), padding=1).relu(),
+                Tensor.empty(16, 33).softmax(),
+                (Tensor.arange(40).reshape(5, 8).cumsum(1) < 20).where(1, -1).max(0), Tensor.empty(64).exp2().cast(dtypes.int8)]:
+        t.realize()
+    finally: PatternMatcher.rewrite = rewrite
+    # every pattern returns which pattern and which uops it matched, some fall through to the next pattern
+    def fxn(j): return lambda **kw: None if j % 3 == 0 else (j, sorted((k, id(v)) for k,v in kw.items()))
+    pats = [(p, fxn(j)) for j,(p,_) in enumerate((constant_folder+expander+reducer+float4_folding).patterns)]
+    pm, ref = PatternMatcher(pats), PatternMatcher(pats)
+    for u in seen:
+      want = None
+      for p,f in itertools.chain(ref.pdict[(u.op, u.arg)], ref.pdict[(u.op, None)]):
+        if (matches := _match(u, p, {})) and (want:=f(**matches[0])) is not None: break
+      self.assertEqual(pm.rewrite(u), want)
+    self.assertGreater(len(seen), 1000)
+
+  def test_commutative_fallthrough(self):
+    x = UOp(UOps.CONST, dtypes.int, arg=3)
+    calls = []
+    pm = PatternMatcher([(UPat(UOps.ALU, BinaryOps.ADD, [UPat(name="a"), UPat(UOps.CONST, name="b")]), lambda a,b: calls.append((a,b))),
+                         (UPat(UOps.ALU, BinaryOps.ADD, name="y"), lambda y: y)])
+    add = x + x
+    self.assertIs(pm.rewrite(add), add)
+    self.assertEqual(calls, [(x, x)])
+
 if __name__ == '__main__':
   unittest.main(verbosity=2)
@@ -1,6 +1,6 @@
 import unittest, struct, contextlib, tempfile, pathlib, json, time, atexit, random
 from tinygrad import Device, Tensor, dtypes, TinyJit
-from tinygrad.helpers import CI, getenv, Context, ProfileLogger
+from tinygrad.helpers import CI, getenv, Context, ProfileLogger, host_profile_stats, _host_profile_finalize
 from tinygrad.device import Buffer, BufferOptions, HCQCompiled
 from tinygrad.engine.schedule import create_schedule
 from tinygrad.engine.realize import get_runner
@@ -216,5 +216,29 @@ class TestProfiler(unittest.TestCase):
 
     print(f"total avg delay is {sum(avg_diff) / len(avg_diff)} us")
 
+class TestHostProfiler(unittest.TestCase):
+  def test_host_spans(self):
+    ProfileLogger.mjson, ProfileLogger.actors = [], {}
+    host_profile_stats.clear()
+    _, tmp = tempfile.mkstemp()
+    with Context(PROFILE=1, PROFILEPATH=tmp):
+      a = Tensor.rand(16, 16).realize()
+      (a @ a).relu().realize()
+      Tensor.empty(4, device="PYTHON").to(Device.DEFAULT).realize()
+      _host_profile_finalize()
+      atexit.unregister(_host_profile_finalize)
+    profile = json.loads(pathlib.Path(tmp).read_text())
+    pathlib.Path(tmp).unlink()
+
+    pids, tids = helper_profile_parse_pids(profile)
+    self.assertIn("schedule", tids.values())
+    kernels = [x for x in profile['traceEvents'] if x.get('ph') == 'X' and tids[x['tid']] == "kernel"]
+    matmul = [x for x in kernels if "matmul" in x['args'].get('metadata', "")]
+    self.assertEqual(len(matmul), 1)
+    helper_validate_node(matmul[0], profile=profile, pid_name=Device.DEFAULT, tid_name="kernel")
+    self.assertGreater(float(matmul[0]['args']['GFLOPS']), 0)
+    self.assertTrue(any(tids[x['tid']] == "copy" for x in profile['traceEvents'] if x.get('ph') == 'X'))
+    self.assertEqual(host_profile_stats[("lower", matmul[0]['name'])][0], 1)
+
 if __name__ == "__main__":
   unittest.main()
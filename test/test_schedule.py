@@ -1585,5 +1585,84 @@ class TestIndexing(unittest.TestCase):
       ref = Tensor(X).interpolate(size=(2, 2), mode="linear").numpy()
     np.testing.assert_allclose(ref, compare, atol=1e-5, rtol=1e-6)
 
+# numpy data, the fused kernels shouldn't depend on the rng's state
+def _rand(*shape) -> Tensor: return Tensor(np.random.rand(*shape).astype(np.float32)).realize()
+
+class TestHorizontalFusion(unittest.TestCase):
+  def test_fuse_elementwise(self):
+    a, b, c = _rand(4, 8), _rand(16), _rand(3, 5, 7)
+    outs = [a*2+1, b.exp(), (c+1).sqrt()]
+    with Context(FUSE_HORIZONTAL=1): run_schedule(check_schedule(outs, 1))
+    np.testing.assert_allclose(outs[0].numpy(), a.numpy()*2+1)
+    np.testing.assert_allclose(outs[1].numpy(), np.exp(b.numpy()), rtol=1e-6)
+    np.testing.assert_allclose(outs[2].numpy(), np.sqrt(c.numpy()+1), rtol=1e-6)
+
+  def test_fuse_same_reduce_size(self):
+    a, b, c = _rand(4, 8), _rand(6, 8), _rand(2, 4, 2)
+    outs = [a.sum(1), b.max(1), c.sum((1, 2)), a.sum(0)]
+    # the first three reduce 8 elements, a.sum(0) reduces 4
+    with Context(FUSE_HORIZONTAL=1): run_schedule(check_schedule(outs, 2))
+    np.testing.assert_allclose(outs[0].numpy(), a.numpy().sum(1), rtol=1e-6)
+    np.testing.assert_allclose(outs[1].numpy(), b.numpy().max(1))
+    np.testing.assert_allclose(outs[2].numpy(), c.numpy().sum((1, 2)), rtol=1e-6)
+    np.testing.assert_allclose(outs[3].numpy(), a.numpy().sum(0), rtol=1e-6)
+
+  def test_dependent_not_fused(self):
+    a = _rand(16)
+    b = (a+1).contiguous()
+    with Context(FUSE_HORIZONTAL=1): check_schedule([b, (b*2).contiguous()], 2)
+
+  def test_size_bound(self):
+    a, b = _rand(16), _rand(4096)
+    with Context(FUSE_HORIZONTAL=1): check_schedule([a+1, b+1], 2)
+
+class TestMultiReduceFusion(unittest.TestCase):
+  def test_sequential(self):
+    x, y = _rand(4, 32), _rand(4, 32)
+    out = (y + x.sum(axis=-1, keepdim=True)).sum(axis=-1)
+    with Context(FUSE_MULTIREDUCE=1): run_schedule(check_schedule(out, 1))
+    np.testing.assert_allclose(out.numpy(), (y.numpy() + x.numpy().sum(axis=-1, keepdims=True)).sum(axis=-1), atol=1e-4, rtol=1e-4)
+
+  def test_softmax(self):
+    x = _rand(4, 12, 64, 64)
+    out = x.softmax()
+    # max and sum(exp) are one kernel that stores both, the division is the second
+    with Context(FUSE_MULTIREDUCE=1): sched = check_schedule(out, 2)
+    self.assertEqual(len([u for u in sched[0].ast.sparents if u.op is UOps.REDUCE_AXIS]), 2)
+    self.assertEqual(len(sched[0].outputs), 2)
+    run_schedule(sched)
+    expected = (x_exp:=np.exp(x.numpy()-x.numpy().max(-1, keepdims=True)))/x_exp.sum(-1, keepdims=True)
+    np.testing.assert_allclose(out.numpy(), expected, atol=1e-4, rtol=1e-4)
+
+  def test_layernorm(self):
+    layer = nn.LayerNorm([10, 10])
+    layer.weight, layer.bias = _rand(10, 10), _rand(10, 10)
+    x = _rand(20, 5, 10, 10)
+    out = layer(x)
+    with Context(FUSE_MULTIREDUCE=1): run_schedule(check_schedule(out, 2))
+    y = (x.numpy() - x.numpy().mean(layer.axis, keepdims=True))
+    expected = y / np.sqrt((y*y).mean(layer.axis, keepdims=True) + layer.eps)
+    np.testing.assert_allclose(out.numpy(), expected * layer.weight.numpy() + layer.bias.numpy(), atol=1e-4, rtol=1e-4)
+
+  def test_matmul_chain_not_fused(self):
+    # the first matmul changes along the second one's reduce axis, fusing would recompute it for every output
+    a, b, c = _rand(16, 16), _rand(16, 16), _rand(16, 16)
+    with Context(FUSE_MULTIREDUCE=1): check_schedule((a@b)@c, 2)
+
+  def test_read_after_reduce_not_fused(self):
+    x = _rand(32)
+    r0 = x.mean(axis=0, keepdim=True)
+    out = r0 + (x - r0).sum(axis=0).div(2)
+    with Context(FUSE_MULTIREDUCE=1): run_schedule(check_schedule(out, 2))
+    np.testing.assert_allclose(out.numpy(), x.numpy().mean() + (x.numpy() - x.numpy().mean()).sum()/2, atol=1e-5, rtol=1e-5)
+
+  def test_reduce_chain_of_three(self):
+    t = _rand(8, 32)
+    out = (t - (t - t.mean(-1, keepdim=True)).max(-1, keepdim=True)).sum(-1)
+    # the mean is fused into the max, the sum reads the max from memory
+    with Context(FUSE_MULTIREDUCE=1): run_schedule(check_schedule(out, 2))
+    tn = t.numpy()
+    np.testing.assert_allclose(out.numpy(), (tn - (tn - tn.mean(-1, keepdims=True)).max(-1, keepdims=True)).sum(-1), atol=1e-4, rtol=1e-4)
+
 if __name__ == '__main__':
   unittest.main(verbosity=2)
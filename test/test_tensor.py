@@ -395,6 +395,19 @@ class TestTinygrad(unittest.TestCase):
     assert t.shape == (6,)
     np.testing.assert_equal(t.numpy(), list(data))
 
+  def test_tensor_list_lazy_copy(self):
+    # lists and bytes are packed into host memory, the copy to the device is scheduled
+    for data in [[[1, 2], [3, 4]], [1.5, 2.5], b"abc123"]:
+      self.assertEqual(len(Tensor(data, device=Device.DEFAULT).schedule()), 1)
+      np.testing.assert_equal(Tensor(data, device=Device.DEFAULT).numpy(), np.array(list(data) if isinstance(data, bytes) else data))
+
+  def test_tensor_empty_nested_list(self):
+    for data in [[[]], [[],[]]]:
+      for dtype in [dtypes.bool, dtypes.half, dtypes.float, dtypes.int8]:
+        t = Tensor(data, dtype=dtype)
+        self.assertEqual((t.shape, t.dtype), (np.array(data).shape, dtype))
+        self.assertEqual(t.numpy().shape, np.array(data).shape)
+
   def test_tensor_copy(self):
     x = copy.deepcopy(Tensor.ones((3,3,3)))
     np.testing.assert_allclose(x.numpy(), np.ones((3,3,3)))
@@ -1,6 +1,7 @@
 from tinygrad.tensor import Tensor
+from tinygrad.device import Device, MallocAllocator, BufferOptions
 import numpy as np
-import pickle
+import pickle, gc
 import unittest
 
 class TestToNumpy(unittest.TestCase):
@@ -13,5 +14,76 @@ class TestToNumpy(unittest.TestCase):
     assert out.shape == (1,3,4096)
     assert (out==1).all()
 
+@unittest.skipUnless(Device[Device.DEFAULT].allocator is MallocAllocator, "zero copy needs a CPU device")
+class TestZeroCopyNumpy(unittest.TestCase):
+  def test_from_numpy(self):
+    a = np.arange(12, dtype=np.float32).reshape(3, 4)
+    t = Tensor.from_numpy(a, copy=False)
+    a[0, 0] = 100
+    np.testing.assert_equal((t+1).numpy(), a+1)
+    t.assign(t*2).realize()
+    np.testing.assert_equal(a[0], [200, 2, 4, 6])
+
+  def test_from_numpy_pins(self):
+    t = Tensor.from_numpy(np.arange(8, dtype=np.int32), copy=False)
+    gc.collect()
+    np.testing.assert_equal(t.numpy(), np.arange(8))
+
+  def test_from_numpy_needs_copy(self):
+    a = np.arange(16, dtype=np.float32).reshape(4, 4)
+    ro = np.arange(4, dtype=np.float32)
+    ro.flags.writeable = False
+    for x in [a.T, a[:, 1:], ro, np.zeros((0,), np.float32)]:
+      with self.assertRaises(ValueError): Tensor.from_numpy(x, copy=False)
+      np.testing.assert_equal(Tensor.from_numpy(x).numpy(), x)
+
+  def test_numpy_view(self):
+    t = (Tensor.arange(6) * 2).reshape(2, 3)
+    v = t.numpy(copy=False)
+    np.testing.assert_equal(v, [[0, 2, 4], [6, 8, 10]])
+    v[1, 2] = -1
+    self.assertEqual(t.sum().item(), 19)
+    t.assign(Tensor.ones(2, 3, dtype=t.dtype)).realize()
+    np.testing.assert_equal(v, np.ones((2, 3)))
+
+  def test_numpy_view_outlives_tensor(self):
+    t = Tensor.arange(4).contiguous().realize()
+    v = t.numpy(copy=False)
+    del t
+    gc.collect()
+    Tensor.full((4,), 7).contiguous().realize()
+    np.testing.assert_equal(v, np.arange(4))
+
+  def test_numpy_view_of_buffer_view(self):
+    t = Tensor.arange(8).contiguous().realize()
+    s = t[2:].contiguous().realize()
+    self.assertIsNotNone(s.lazydata.base.realized._base)
+    v = s.numpy(copy=False)
+    del t, s
+    gc.collect()
+    # the base buffer isn't reused while the array points into it
+    Tensor.full((8,), 7).contiguous().realize()
+    np.testing.assert_equal(v, np.arange(2, 8))
+
+  def test_numpy_view_keeps_options(self):
+    t = Tensor.arange(4).contiguous().realize()
+    buf = t.lazydata.base.realized
+    buf.options = BufferOptions(host=True)
+    t.numpy(copy=False)
+    self.assertEqual(buf.options, BufferOptions(host=True, nolru=True))
+
+  def test_numpy_view_const(self):
+    np.testing.assert_equal(Tensor.ones(4).numpy(copy=False), np.ones(4))
+
+  def test_numpy_view_needs_copy(self):
+    t = Tensor.arange(6).reshape(2, 3).realize()
+    with self.assertRaises(ValueError): t.T.numpy(copy=False)
+    with self.assertRaises(ValueError): t[:, 1:].numpy(copy=False)
+
+  def test_roundtrip(self):
+    a = np.random.rand(5, 7).astype(np.float32)
+    v = Tensor.from_numpy(a, copy=False).numpy(copy=False)
+    self.assertTrue(np.shares_memory(a, v))
+
 if __name__ == '__main__':
   unittest.main()
\ No newline at end of file
@@ -317,6 +317,30 @@ class TestLocalAccess(unittest.TestCase):
     sres = uop(uops, UOps.LOAD, dtypes.int32, (smem, ofs))
     self.assertEqual(_test_uops_result(dtypes.int32, uops, sres), 42)
 
+class TestPythonVecProgram(unittest.TestCase):
+  # the vectorized emulator must write exactly the same bytes as the per thread one
+  def _compare(self, out:Tensor):
+    from tinygrad.runtime.ops_python import PythonProgram, PythonVecProgram
+    for si in create_schedule([out.lazydata]):
+      ei = lower_schedule_item(si)
+      if isinstance(ei.prg, CompiledRunner):
+        rets = []
+        for prg in (PythonProgram, PythonVecProgram):
+          bufs = [memoryview(bytearray(b.ensure_allocated().as_buffer())) for b in si.bufs]
+          prg(ei.prg.p.function_name, ei.prg.lib)(*bufs, global_size=tuple(ei.prg.p.global_size), local_size=tuple(ei.prg.p.local_size))
+          rets.append([bytes(b) for b in bufs])
+        self.assertEqual(rets[0], rets[1])
+      ei.run()
+
+  def test_matmul(self): self._compare(Tensor.rand(17, 9, device="PYTHON") @ Tensor.rand(9, 13, device="PYTHON"))
+  def test_group_reduce(self): self._compare(Tensor.rand(3, 2048, device="PYTHON").sum(1))
+  def test_softmax(self): self._compare(Tensor.rand(4, 33, device="PYTHON").softmax(-1))
+  def test_conv_pad(self): self._compare(Tensor.rand(1, 2, 7, 7, device="PYTHON").conv2d(Tensor.rand(3, 2, 3, 3, device="PYTHON"), padding=1))
+  def test_int(self):
+    x = Tensor.arange(-20, 20, device="PYTHON")
+    self._compare((x.div(3, upcast=False) * x.cast(dtypes.uint8) - x.cast(dtypes.int8).maximum(-3)).cast(dtypes.float32).sqrt())
+  def test_big_matmul(self): self._compare(Tensor.rand(64, 64, device="PYTHON") @ Tensor.rand(64, 64, device="PYTHON"))
+
 @unittest.skipUnless(getenv("PTX"), "This only tests assembly backends")
 class TestAssembly(unittest.TestCase):
   def test_bitshift_left(self):
@@ -352,6 +376,29 @@ class TestUOpCompare(unittest.TestCase):
     mul = UOp(UOps.ALU, dtypes.float, (a, b), BinaryOps.MUL)
     assert (add < mul) or (mul < add), "add and mul with same src should have an order"
 
+class TestUOpKey(unittest.TestCase):
+  def test_deep_key(self):
+    a = UOp.const(dtypes.int, 0)
+    for i in range(5000): a = a + UOp.const(dtypes.int, i)
+    b = UOp.const(dtypes.int, 0)
+    for i in range(5000): b = b + UOp.const(dtypes.int, i)
+    self.assertEqual(a.key, b.key)
+    self.assertNotEqual(a.key, (a + 1).key)
+
+  def test_intern(self):
+    def graph(c=2.0): return (UOp(UOps.CONST, dtypes.float, (), c) * 3.0).alu(UnaryOps.SQRT)
+    a, b = graph().intern(), graph().intern()
+    self.assertIs(a, b)
+    self.assertIs(graph().intern().src[0], a.src[0])
+    self.assertIsNot(graph(-0.0).intern(), graph(0.0).intern())
+    self.assertIsNot(UOp(UOps.CONST, dtypes.int, (), 1).intern(), UOp(UOps.CONST, dtypes.int, (), True).intern())
+    self.assertIsNot(UOp(UOps.CAST, dtypes.float, (b,)).intern(), UOp(UOps.CAST, PtrDType(dtypes.float), (b,)).intern())
+
+  def test_intern_schedule(self):
+    with Context(UOP_INTERN=1):
+      asts = [create_schedule([(Tensor.empty(4, 4) + 1).sum(0).lazydata])[-1].ast for _ in range(2)]
+    self.assertIs(asts[0], asts[1])
+
 class TestUOpStr(TestEqUOps):
   def test_uop_str(self):
     a = UOp(UOps.CONST, dtypes.float, (), 2.0) + UOp(UOps.CONST, dtypes.float, (), 3.0)
@@ -1,7 +1,10 @@
 import unittest
-from tinygrad import Tensor, GlobalCounters
+from unittest.mock import patch
+import numpy as np
+from tinygrad import Tensor, GlobalCounters, dtypes
 from tinygrad.ops import UOps
-from tinygrad.helpers import Timing, CI, Profiling, WINO, DEBUG, getenv
+from tinygrad.helpers import Timing, CI, Profiling, WINO, DEBUG, getenv, Context
+from tinygrad.tensor import _conv_algos
 from tinygrad.codegen.kernel import Kernel
 from tinygrad.engine.schedule import create_schedule
 
@@ -69,5 +72,39 @@ class TestWinograd(unittest.TestCase):
     self.assertLess(ops_ratio, 2.6)  # TODO: there's issues with factorization now
     self.assertLess(mem_ratio, 10)
 
+class TestConvAlgo(unittest.TestCase):
+  def test_algos_match_direct(self):
+    for xs, ws, kwargs in [((2,4,9,11), (6,4,3,3), {}), ((2,4,9,11), (6,2,3,3), {"groups":2, "padding":1}),
+                           ((1,3,10,10), (4,3,5,3), {"stride":2, "padding":(1,2)}), ((1,4,8,8), (4,4,3,3), {"dilation":2}),
+                           ((1,2,7), (3,2,3), {"padding":1})]:
+      x, w = Tensor.randn(*xs).realize(), Tensor.randn(*ws).realize()
+      with Context(CONV_ALGO="direct"): ref = x.conv2d(w, **kwargs).numpy()
+      for algo in ["im2col", "winograd", "winograd2"]:
+        with Context(CONV_ALGO=algo): np.testing.assert_allclose(x.conv2d(w, **kwargs).numpy(), ref, atol=1e-4, rtol=1e-4, err_msg=algo)
+
+  def test_search(self):
+    x, w = Tensor.randn(1,4,10,10).realize(), Tensor.randn(4,4,3,3).realize()
+    with Context(CONV_ALGO="search", BEAM=0):
+      out = x.conv2d(w, padding=1).numpy()
+      self.assertEqual(len(chosen:=[v for k,v in _conv_algos.items() if k.startswith("((1, 4, 10, 10), (4, 4, 3, 3)")]), 1)
+      self.assertIn(chosen[0], ["direct", "im2col", "winograd", "winograd2"])
+      # the second call uses the cached choice
+      np.testing.assert_allclose(x.conv2d(w, padding=1).numpy(), out, atol=1e-4, rtol=1e-4)
+    with Context(CONV_ALGO="direct"): np.testing.assert_allclose(x.conv2d(w, padding=1).numpy(), out, atol=1e-4, rtol=1e-4)
+
+  def test_default_searches_big_layers(self):
+    with Context(CONV_ALGO="", WINO=0), patch("tinygrad.tensor._search_conv_algo", return_value="direct") as search:
+      # small layers aren't worth timing
+      Tensor.empty(1,4,9,9).conv2d(Tensor.empty(4,4,3,3))
+      search.assert_not_called()
+      Tensor.empty(1,64,56,56).conv2d(Tensor.empty(64,64,3,3), padding=1)
+      self.assertEqual(search.call_args.args[2], ["direct", "im2col", "winograd", "winograd2"])
+      Tensor.empty(1,64,56,56, dtype=dtypes.int32).conv2d(Tensor.empty(64,64,3,3, dtype=dtypes.int32), padding=1)
+      self.assertEqual(search.call_args.args[2], ["direct", "im2col"])
+      # CONV_ALGO and WINO still override it
+      with Context(CONV_ALGO="im2col"): Tensor.empty(1,64,56,56).conv2d(Tensor.empty(64,64,3,3), padding=1)
+      with Context(WINO=1): Tensor.empty(1,64,56,56).conv2d(Tensor.empty(64,64,3,3), padding=1)
+      self.assertEqual(search.call_count, 2)
+
 if __name__ == '__main__':
   unittest.main(verbosity=2)
@@ -0,0 +1,75 @@
+import unittest, random, os, multiprocessing
+import numpy as np
+from tinygrad.nn.datasets import DataLoader
+
+class _Squares:
+  def __len__(self): return 10
+  def __getitem__(self, i): return np.full((2, 3), i, dtype=np.float32), i*i
+
+class _Broken(_Squares):
+  def __getitem__(self, i):
+    if i == 7: raise ValueError("bad sample")
+    return super().__getitem__(i)
+
+class _Crashing(_Squares):
+  def __getitem__(self, i):
+    if i == 7 and multiprocessing.parent_process() is not None: os._exit(3)
+    return super().__getitem__(i)
+
+def _noisy_collate(samples):
+  return np.stack([s[0] for s in samples]) + np.random.rand(len(samples), 1, 1).astype(np.float32) + random.random()
+
+class TestDataLoader(unittest.TestCase):
+  def _epoch(self, dl): return [tuple(t.numpy() for t in b) if isinstance(b, tuple) else b.numpy() for b in dl]
+
+  def test_in_order(self):
+    for workers in [0, 2]:
+      dl = DataLoader(_Squares(), batch_size=4, num_workers=workers)
+      batches = self._epoch(dl)
+      self.assertEqual(len(batches), len(dl))
+      np.testing.assert_equal([b[1] for b in batches], [[0, 1, 4, 9], [16, 25, 36, 49], [64, 81]])
+      np.testing.assert_equal(batches[2][0], np.broadcast_to(np.array([8, 9], dtype=np.float32).reshape(2, 1, 1), (2, 2, 3)))
+      dl.close()
+
+  def test_drop_last(self):
+    dl = DataLoader(_Squares(), batch_size=4, num_workers=1, drop_last=True)
+    self.assertEqual([b[1].shape for b in self._epoch(dl)], [(4,), (4,)])
+    dl.close()
+
+  def test_shuffle_seed(self):
+    dl = DataLoader(_Squares(), batch_size=3, shuffle=True, seed=1, num_workers=2, prefetch=2)
+    e1, e2 = [np.concatenate([b[1] for b in self._epoch(dl)]) for _ in range(2)]
+    self.assertEqual(sorted(e1.tolist()), [i*i for i in range(10)])
+    self.assertNotEqual(e1.tolist(), e2.tolist())
+    dl.close()
+    dl2 = DataLoader(_Squares(), batch_size=3, shuffle=True, seed=1, num_workers=0)
+    np.testing.assert_equal(np.concatenate([b[1] for b in self._epoch(dl2)]), e1)
+
+  def test_seeded_collate(self):
+    runs = []
+    for workers in [1, 3]:
+      dl = DataLoader(_Squares(), batch_size=2, collate_fn=_noisy_collate, seed=3, num_workers=workers)
+      runs.append(self._epoch(dl))
+      dl.close()
+    np.testing.assert_equal(runs[0], runs[1])
+
+  def test_abandoned_epoch(self):
+    dl = DataLoader(_Squares(), batch_size=1, num_workers=2, prefetch=4)
+    for i,b in enumerate(dl):
+      if i == 1: break
+    np.testing.assert_equal(np.concatenate([b[1] for b in self._epoch(dl)]), [i*i for i in range(10)])
+    dl.close()
+
+  def test_worker_error(self):
+    dl = DataLoader(_Broken(), batch_size=2, num_workers=2)
+    with self.assertRaises(RuntimeError): self._epoch(dl)
+    dl.close()
+
+  def test_worker_died(self):
+    dl = DataLoader(_Crashing(), batch_size=2, num_workers=2)
+    with self.assertRaisesRegex(RuntimeError, "exited unexpectedly"): self._epoch(dl)
+    self.assertEqual(dl.procs, [])
+    dl.close()
+
+if __name__ == "__main__":
+  unittest.main()
@@ -1,9 +1,11 @@
-import pathlib, tempfile, unittest
+import os, pathlib, tempfile, threading, unittest
+from unittest.mock import patch
 import numpy as np
 from tinygrad import Tensor, Device, dtypes
 from tinygrad.dtype import DType
 from tinygrad.nn.state import safe_load, safe_save, get_state_dict, torch_load
 from tinygrad.helpers import Timing, fetch, temp, CI
+from tinygrad.device import Buffer
 from test.helpers import is_dtype_supported
 
 def compare_weights_both(url):
@@ -33,6 +35,19 @@ class TestTorchLoad(unittest.TestCase):
   # pytorch tar format
   def test_load_resnet(self): compare_weights_both('https://download.pytorch.org/models/resnet50-19c8e357.pth')
 
+  def test_load_strided(self):
+    import torch
+    base = torch.arange(120, dtype=torch.float32).reshape(2, 3, 4, 5)
+    tensors = {"t": base[0, 0].T, "permuted": base.permute(3, 1, 0, 2), "sliced": base[:, 1:, ::2, 1::3], "expanded": base[0, 0, 0].expand(4, 5),
+               "bf16": base.to(torch.bfloat16).permute(2, 0, 1, 3), "contiguous": base[1]}
+    torch.save(tensors, fn:=temp("strided.pth"))
+    loaded = torch_load(fn)
+    for k,v in tensors.items():
+      self.assertEqual(loaded[k].shape, v.shape)
+      # the permuted bf16 weight is copied to the device as bytes and permuted there, check it as uint16
+      if v.dtype == torch.bfloat16: np.testing.assert_equal(loaded[k].bitcast(dtypes.uint16).numpy(), v.view(torch.int16).numpy().view(np.uint16))
+      else: np.testing.assert_equal(loaded[k].numpy(), v.numpy())
+
 test_fn = pathlib.Path(__file__).parents[2] / "weights/LLaMA/7B/consolidated.00.pth"
 #test_size = test_fn.stat().st_size
 test_size = 1024*1024*1024*2
@@ -161,6 +176,49 @@ class TestSafetensors(unittest.TestCase):
       safe_save(get_state_dict(ones), path)
       np.testing.assert_equal(ones.numpy(), list(safe_load(path).values())[0].numpy())
 
+  def test_save_chunked(self):
+    ts = {"a": Tensor.randn(1000, 37).realize(), "b": Tensor.arange(10).reshape(2, 5) + 1, "empty": Tensor.empty(0),
+          "t": Tensor.randn(3, 3).T, "i8": Tensor.ones(17, dtype=dtypes.int8)}
+    ref = {k:v.numpy() for k,v in ts.items()}
+    for chunk_size in [64, 1000, 1<<20]:
+      safe_save(ts, fn:=temp(f"chunked_{chunk_size}.safetensors"), chunk_size=chunk_size, workers=3)
+      for k,v in safe_load(fn).items(): np.testing.assert_equal(v.numpy(), ref[k])
+
+  def test_save_chunked_no_views(self):
+    # the PYTHON allocator has no offset, so chunks that split a buffer can't be copied out through a view
+    ts = {"a": Tensor.ones(3, device="PYTHON").contiguous().realize(), "b": Tensor.arange(100, device="PYTHON").realize()}
+    ref = {k:v.numpy() for k,v in ts.items()}
+    for background in [False, True]:
+      ret = safe_save(ts, fn:=temp("no_views.safetensors"), background=background, chunk_size=64)
+      if ret is not None: ret.result()
+      for k,v in safe_load(fn).items(): np.testing.assert_equal(v.numpy(), ref[k])
+
+  def test_save_background(self):
+    w = Tensor.randn(256, 256).realize()
+    ref = w.numpy()
+    handle = safe_save({"w": w}, fn:=temp("background.safetensors"), background=True, chunk_size=4096)
+    # the weights were snapshotted, so updating them doesn't change the checkpoint
+    w.assign(w + 1).realize()
+    self.assertEqual(handle.result(), fn)
+    np.testing.assert_equal(safe_load(fn)["w"].numpy(), ref)
+
+  def test_save_error_cleanup(self):
+    ts = {"a": Tensor.randn(1000).realize(), "b": Tensor.randn(1000).realize()}
+    copyout, calls = Buffer.copyout, []
+    def failing_copyout(buf, mv):
+      # fail on the second copyout, after the first chunk was already submitted
+      calls.append(len(mv))
+      if len(calls) > 1: raise RuntimeError("copyout failed")
+      return copyout(buf, mv)
+    for background in [False, True]:
+      fds = len(os.listdir("/proc/self/fd"))
+      calls.clear()
+      with patch.object(Buffer, "copyout", failing_copyout):
+        with self.assertRaises(RuntimeError): safe_save(ts, temp("error.safetensors"), background=background, chunk_size=256)
+      # the file is closed and the pool's threads are gone
+      self.assertEqual(len(os.listdir("/proc/self/fd")), fds)
+      self.assertFalse([t for t in threading.enumerate() if t.name.startswith("safe_save")])
+
   def test_load_supported_types(self):
     import torch
     from safetensors.torch import save_file
@@ -0,0 +1,34 @@
+import unittest
+import numpy as np
+from tinygrad import Tensor, GlobalCounters
+from tinygrad.tensor import _einsum_plan
+
+class TestEinsumPlan(unittest.TestCase):
+  def test_chain(self):
+    # (0,1) first makes a 2x2 intermediate, anything else a 100x100 one
+    self.assertIn(_einsum_plan(("ij", "jk", "kl"), "il", (("i", 2), ("j", 100), ("k", 2), ("l", 100))), [((0, 1), 2), (2, (0, 1))])
+    self.assertIn(_einsum_plan(("ij", "jk", "kl"), "il", (("i", 100), ("j", 2), ("k", 100), ("l", 2))), [(0, (1, 2)), ((1, 2), 0)])
+
+  def test_greedy(self):
+    inputs = tuple(a+b for a,b in zip("abcdefgh", "bcdefghi"))
+    plan = _einsum_plan(inputs, "ai", tuple((c, 4) for c in "abcdefghi"))
+    def leaves(n): return [n] if isinstance(n, int) else leaves(n[0]) + leaves(n[1])
+    self.assertEqual(sorted(leaves(plan)), list(range(8)))
+
+  def test_chain_flops(self):
+    xs = [np.random.rand(64, 64).astype(np.float32) for _ in range(4)]
+    GlobalCounters.reset()
+    out = Tensor.einsum("ij,jk,kl,lm->im", *[Tensor(x) for x in xs]).numpy()
+    # three 64x64 matmuls, not one product over every letter
+    self.assertLessEqual(GlobalCounters.global_ops, 3*2*64**3)
+    np.testing.assert_allclose(out, xs[0] @ xs[1] @ xs[2] @ xs[3], rtol=1e-4)
+
+  def test_cached(self):
+    a, b, c = Tensor.rand(3, 4), Tensor.rand(4, 5), Tensor.rand(5, 6)
+    Tensor.einsum("ij,jk,kl->il", a, b, c)
+    hits = _einsum_plan.cache_info().hits
+    Tensor.einsum("ij,jk,kl->il", a, b, c)
+    self.assertEqual(_einsum_plan.cache_info().hits, hits+1)
+
+if __name__ == '__main__':
+  unittest.main()
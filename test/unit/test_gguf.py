@@ -0,0 +1,58 @@
+import unittest, tempfile, pathlib
+import numpy as np
+import gguf
+from tinygrad import Tensor, dtypes
+from tinygrad.nn.state import gguf_load, ggml_blocks
+
+class TestGGUF(unittest.TestCase):
+  def setUp(self):
+    self.fn, self.rng = pathlib.Path(tempfile.mkdtemp()) / "test.gguf", np.random.default_rng(0)
+    self.writer = gguf.GGUFWriter(self.fn, "llama")
+  def tearDown(self): self.fn.unlink(missing_ok=True)
+  def _load(self):
+    self.writer.write_header_to_file()
+    self.writer.write_kv_data_to_file()
+    self.writer.write_tensors_to_file()
+    self.writer.close()
+    return gguf_load(str(self.fn))
+
+  def test_metadata(self):
+    self.writer.add_uint32("test.u32", 7)
+    self.writer.add_float32("test.f32", 0.5)
+    self.writer.add_bool("test.bool", True)
+    self.writer.add_array("test.floats", [1.5, 2.5])
+    self.writer.add_array("test.strs", ["a", "bé"])
+    kv, _ = self._load()
+    self.assertEqual(kv["general.architecture"], "llama")
+    self.assertEqual([kv[f"test.{k}"] for k in ["u32", "f32", "bool", "floats", "strs"]], [7, 0.5, True, [1.5, 2.5], ["a", "bé"]])
+
+  def test_native_on_disk(self):
+    ref = {"f32": self.rng.standard_normal((4, 5)).astype(np.float32), "f16": self.rng.standard_normal((2, 3)).astype(np.float16),
+           "i32": np.arange(6, dtype=np.int32).reshape(3, 2)}
+    for k,v in ref.items(): self.writer.add_tensor(k, v)
+    _, sd = self._load()
+    for k,v in ref.items():
+      self.assertTrue(sd[k].device.startswith("DISK"))
+      np.testing.assert_equal(sd[k].numpy(), v)
+
+  def test_dequantize(self):
+    ref = {}
+    for typ,(_,nbytes) in ggml_blocks.items():
+      raw = self.rng.integers(0, 256, size=(4, nbytes*3), dtype=np.uint8)
+      # random bytes make fine quants but the f16 scales and mins must be finite
+      fp16 = {2:[0], 3:[0, 2], 6:[0], 7:[0, 2], 8:[0], 12:[0, 2], 13:[0, 2], 14:[208]}[typ]
+      for blk in range(3):
+        for a in fp16: raw[:, blk*nbytes+a:blk*nbytes+a+2] = self.rng.uniform(-1, 1, (4, 1)).astype(np.float16).view(np.uint8)
+      self.writer.add_tensor(name:=gguf.GGMLQuantizationType(typ).name, raw, raw_shape=raw.shape, raw_dtype=gguf.GGMLQuantizationType(typ))
+      ref[name] = gguf.quants.dequantize(raw, gguf.GGMLQuantizationType(typ))
+    _, sd = self._load()
+    for k,v in ref.items():
+      self.assertEqual(sd[k].dtype, dtypes.float32)
+      self.assertEqual(sd[k].shape, v.shape, k)
+      np.testing.assert_allclose(sd[k].numpy(), v, rtol=1e-5, atol=1e-5, err_msg=k)
+
+  def test_bad_magic(self):
+    with self.assertRaises(ValueError): gguf_load(Tensor(list(b"GGML" + bytes(20)), dtype=dtypes.uint8))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,60 @@
+import unittest, json
+from tinygrad import Tensor, TinyJit, Device, dtypes
+from tinygrad.device import Buffer
+from tinygrad.helpers import Metrics, METRICS, Context
+
+class TestMetrics(unittest.TestCase):
+  def test_registry(self):
+    m = Metrics()
+    m.inc("calls_total", kernel="a")
+    m.inc("calls_total", 2, kernel="a")
+    m.peak("peak_bytes", 10)
+    m.peak("peak_bytes", 4)
+    m.add("used_bytes", 5, device="X")
+    m.add("used_bytes", -2, device="X")
+    for v in [5e-6, 2e-3, 20.0]: m.observe("latency_seconds", v)
+    snap = m.snapshot()
+    self.assertEqual(snap['tinygrad_calls_total{kernel="a"}'], 3)
+    self.assertEqual(snap['tinygrad_peak_bytes'], 10)
+    self.assertEqual(snap['tinygrad_used_bytes{device="X"}'], 3)
+    self.assertEqual(snap['tinygrad_latency_seconds_bucket{le="1e-05"}'], 1)
+    self.assertEqual(snap['tinygrad_latency_seconds_bucket{le="10"}'], 2)
+    self.assertEqual(snap['tinygrad_latency_seconds_bucket{le="+Inf"}'], 3)
+    self.assertEqual(snap['tinygrad_latency_seconds_count'], 3)
+    m.inc("calls_total", kernel="b")
+    self.assertEqual(Metrics.diff(snap, m.snapshot()), {'tinygrad_calls_total{kernel="b"}': 1})
+    prom = m.prometheus()
+    self.assertIn("# TYPE tinygrad_latency_seconds histogram\n", prom)
+    self.assertIn('# TYPE tinygrad_calls_total counter\ntinygrad_calls_total{kernel="a"} 3\n', prom)
+    self.assertEqual(json.loads(m.json())['tinygrad_used_bytes{device="X"}'], 3)
+
+  def test_runtime_metrics(self):
+    @TinyJit
+    def f(x:Tensor) -> Tensor: return (x*2+1).sum().realize()
+    before = METRICS.snapshot()
+    with Context(KERNEL_METRICS=1):
+      for _ in range(5): f(Tensor.ones(64).contiguous().realize())
+    diff = Metrics.diff(before, METRICS.snapshot())
+    self.assertEqual(diff["tinygrad_jit_captures_total"], 1)
+    self.assertEqual(diff["tinygrad_jit_replays_total"], 3)
+    self.assertGreater(diff['tinygrad_method_cache_total{result="hit"}'], 0)
+    self.assertGreaterEqual(METRICS.snapshot()[f'tinygrad_mem_peak_bytes{{device="{Device.DEFAULT}"}}'], 64*4)
+    self.assertTrue(any(k.startswith("tinygrad_kernel_seconds_count") for k in diff))
+
+  def test_kernel_metrics_off(self):
+    before = METRICS.snapshot()
+    (Tensor.ones(16).contiguous()*3).realize()
+    self.assertFalse(any(k.startswith(("tinygrad_kernel_calls_total", "tinygrad_kernel_seconds")) for k in Metrics.diff(before, METRICS.snapshot())))
+
+  def test_allocator_metrics_by_device(self):
+    # the LRU cache series use the same device label as the Buffer ones
+    before, cached = METRICS.snapshot(), METRICS.get("mem_cached_bytes", device=Device.DEFAULT)
+    b = Buffer(Device.DEFAULT, 1234, dtypes.float32).allocate()
+    del b
+    self.assertEqual(METRICS.get("mem_cached_bytes", device=Device.DEFAULT)-cached, 1234*4)
+    Buffer(Device.DEFAULT, 1234, dtypes.float32).allocate()
+    diff = Metrics.diff(before, METRICS.snapshot())
+    self.assertEqual(diff[f'tinygrad_allocator_alloc_total{{device="{Device.DEFAULT}",result="hit"}}'], 1)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,44 @@
+import unittest, os
+import numpy as np
+from tinygrad.tensor import Tensor
+from tinygrad.device import Device
+from tinygrad.dtype import dtypes
+from tinygrad.ops import ReduceOps
+from tinygrad.nn.distributed import ProcessGroup, launch
+
+def _collectives(pg:ProcessGroup, n:int):
+  ws, rank = pg.world_size, pg.rank
+  t = Tensor.arange(n, dtype=dtypes.float32).reshape(-1, 2) + rank
+  np.testing.assert_allclose(pg.all_reduce(t).numpy(), sum(np.arange(n, dtype=np.float32).reshape(-1, 2) + r for r in range(ws)))
+  np.testing.assert_allclose(pg.all_reduce(t, ReduceOps.MAX).numpy(), np.arange(n, dtype=np.float32).reshape(-1, 2) + ws - 1)
+  np.testing.assert_equal(pg.all_reduce(Tensor([rank+1]*3, dtype=dtypes.int32)).numpy(), [ws*(ws+1)//2]*3)
+  np.testing.assert_allclose(pg.broadcast(t, root=ws-1).numpy(), np.arange(n, dtype=np.float32).reshape(-1, 2) + ws - 1)
+  np.testing.assert_equal(pg.all_gather(Tensor([[rank, rank]]), dim=0).numpy(), [[r, r] for r in range(ws)])
+
+def _failing(pg:ProcessGroup):
+  if pg.rank == 1: raise RuntimeError("rank 1 failed")
+  pg.barrier()
+
+def _fork_opens_device(pg:ProcessGroup):
+  # a rank may open devices, a process it forks shares its device state and may not
+  Device["CLANG"]
+  if (pid:=os.fork()) == 0:
+    try: Device["CLANG:7"]
+    except AssertionError: os._exit(0)
+    os._exit(1)
+  assert os.waitpid(pid, 0)[1] == 0, "forked child of a rank opened a device"
+
+class TestProcessGroup(unittest.TestCase):
+  def test_collectives(self): launch(_collectives, 3, 64)
+
+  def test_collectives_multiple_pieces(self):
+    # 100 floats don't fit in 64 byte slots, so every collective goes through several pieces
+    launch(_collectives, 2, 100, slot_size=64)
+
+  def test_failing_rank(self):
+    with self.assertRaises(RuntimeError): launch(_failing, 2)
+
+  def test_forked_child_of_rank(self): launch(_fork_opens_device, 1)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -308,8 +308,9 @@ class Kernel:
     return TensorCoreOptions(axes=(s0, s1, s2), axes_exist=(True, True), axis_pads=axis_pads)
 
   def _apply_tc_opt(self, use_tensor_cores:int, axis:int, opt_level:int) -> bool:
-    if use_tensor_cores and self.opts.has_local and self.reduceop is not None and self.reduceop.arg[0] is ReduceOps.SUM:
+    if use_tensor_cores and self.reduceop is not None and self.reduceop.arg[0] is ReduceOps.SUM:
       for tc in self.opts.tensor_cores:
+        if tc.threads and not self.opts.has_local: continue
         tensor_core_opts = [self._create_tc_opts(reduceop, tc, axis, opt_level) for reduceop in self.reduceops]
         # can only fuse reduces with the same tc options
         assert all_same(tensor_core_opts)
@@ -321,7 +322,10 @@ class Kernel:
         try:
           for axis, dim in tc_opts.axis_pads: self.apply_opt(Opt(OptOps.PADTO, axis, dim), append_opt=False) # PADTO might fail
         except KernelOptError: continue
-        if self.opts.device in {"AMD", "HIP"}:
+        if not tc.threads:
+          # no threads, M=K=1 and the N elements of a row of C are one vector register
+          self.apply_opt(Opt(OptOps.UPCAST, tc_opts.axes[0], tc.dims[0]), append_opt=False)
+        elif self.opts.device in {"AMD", "HIP"}:
           # NOTE: AMD requires locals first
           self.apply_opt(Opt(OptOps.UNROLL, tc_opts.axes[2]-self.first_reduce, tc.dims[2]), append_opt=False)
           for (tc_dim, tc_amt) in tc.threads: self.apply_opt(Opt(OptOps.LOCAL, tc_opts.axes[tc_dim], tc_amt), append_opt=False)
@@ -367,6 +371,10 @@ class Kernel:
       if (tc_opts:=self.tensor_core_opts) is not None:
         if extra_opts is not None:
           for opt in extra_opts: self.apply_opt(opt)
+        elif self.tensor_core and not self.tensor_core.threads:
+          # block rows of the cpu microkernel, every row is a broadcast of A times the vector of B into its own accumulator
+          if tc_opts.axes_exist[1] and (rows:=[x for x in [8,4,2] if self.full_shape[tc_opts.axes[1]] % x == 0]):
+            self.apply_opt(Opt(OptOps.UPCAST, tc_opts.axes[1], rows[0]))
         else:
           # hand-coded TC opts
           def late_upcast_tc(tc_dim: int):
@@ -573,6 +581,8 @@ class Kernel:
         upcasted_axis.add(xb_choices[0][2])
       else: break
 
+    # a multireduce kernel loops over the axes of each reduce in turn, the ones before the last are unrolled below too
+    inner_reduce_axes = list(range(self.first_reduce, self.first_upcast-1)) if len(self.reduceops) > 1 else []
     # if last dim is small(ish) and it's a reduce dim, upcast the reduce (loop unrolling). no simplify needed since it's just an upcast.
     if self.first_reduce < self.first_upcast and (prod(self.full_shape[self.first_upcast:]) <= 4 or not any(r for _,_,r in self.upcasted_axis(self.full_buf_index))) and (self.upcasted == 0 or prod(self.full_shape[-self.upcasted:]) < 64):  # noqa: E501
       if (s:=self.full_unupcasted_shape[-1]) <= 32 and isinstance(s, int):  # NOTE: cannot loop unroll symbolic axis
@@ -586,12 +596,23 @@ class Kernel:
             self.apply_opt(Opt(OptOps.UNROLL, len(self.full_unupcasted_shape)-1-self.first_reduce, splits))
             break
 
-    # if nothing at all is upcasted and it's easy to, do an upcast
+    for axis in inner_reduce_axes[::-1]:
+      if axis < self.first_upcast and isinstance(s:=self.full_shape[axis], int) and s > 1 and s % 4 == 0:
+        self.apply_opt(Opt(OptOps.UNROLL, axis-self.first_reduce, 4))
+
+    # if nothing at all is upcasted and it's easy to, do an upcast, as wide as the vectors of the target
     # TODO: this is breaking the tests
-    for splits in [4]:
+    itemsize = cast(DType, self.bufs[0].src[2].dtype).itemsize if self.bufs[0].op is UOps.STORE else 4
+    for splits in [x for x in [16, 8] if self.opts.vector_bytes is not None and x*itemsize <= self.opts.vector_bytes] + [4]:
       if self.upcasted == 0 and self.full_unupcasted_shape and self.full_unupcasted_shape[-1] % splits == 0:
         self.apply_opt(Opt(OptOps.UPCAST, len(self.full_unupcasted_shape)-1, splits))
 
+    # with wide vector registers, widen a float4 upcast of the output's unit stride axis to fill one
+    if self.opts.vector_bytes is not None and self.upcasted == 1 and self.full_shape[-1] == 4 and (strides:=self.sts[0].real_strides())[-1] == 1:
+      for axis in [i for i in range(self.first_reduce) if strides[i] == 4 and isinstance(self.full_shape[i], int)][:1]:
+        for amt in [x for x in [4, 2] if 4*x*itemsize <= self.opts.vector_bytes and cast(int, self.full_shape[axis]) % x == 0][:1]:
+          self.apply_opt(Opt(OptOps.UPCAST, axis, amt))
+
     # **** local groups ****
 
     if self.opts.has_local:
@@ -618,12 +639,15 @@ class Kernel:
 
   kernel_cnt: Final[DefaultDict[str, int]] = defaultdict(int)
   @functools.cached_property
-  def name(self) -> str:
+  def base_name(self) -> str:
     # kernel name (before late upcast)
-    name = ("r" if self.reduceop else ("C" if all(x.op in BUFFER_UOPS for x in self.ast.parents) else "E")) + \
+    return ("r" if self.reduceop else ("C" if all(x.op in BUFFER_UOPS for x in self.ast.parents) else "E")) + \
                  (f"{len(self.ast.src)}_" if len(self.ast.src) > 1 else "_") + \
                  colored('_', 'BLACK').join([colored(str(x), c) for x,c in zip(self.full_shape, self.colors())])
-
+  @functools.cached_property
+  def name(self) -> str: return Kernel.unique_name(self.base_name)
+  @staticmethod
+  def unique_name(name:str) -> str:
     # name the function something unique
     Kernel.kernel_cnt[(function_name := to_function_name(name))] += 1
     suffix = f"{'n'+str(Kernel.kernel_cnt[function_name]-1)}" if Kernel.kernel_cnt[function_name] > 1 else ""
@@ -661,7 +685,11 @@ class Kernel:
                                          [y + (wd if x == 0 else tcd) for x,y in pattern_2] + list(range(tcd+len(tcd_expand), len(new_shape)))
             return st1.reshape(new_shape).simplify().permute(tuple(permaxis)).reshape(st1.shape).simplify()
 
-          if self.opts.device in {"AMD", "HIP"}:
+          if not tc.threads:
+            # A is a single element broadcast over the N of B and C
+            reduce_axes, upcast_axes = [], [[], [(0, tc.dims[0])], [(0, tc.dims[0])]]
+            fix_st1, fix_st2 = None, None
+          elif self.opts.device in {"AMD", "HIP"}:
             reduce_axes, upcast_axes = [0], [[(0, 16)], [(0, 16)], [(1, 8)]]
             # https://gpuopen.com/learn/wmma_on_rdna3/
             fix_st1 = functools.partial(fix_st, (8,2,2), (16,8), (16,2,4), ((1,2), (0,2), (1,1), (0,1)), ((1,0), (0,0)))
@@ -760,6 +788,11 @@ class Kernel:
     return Program(ansiname, src, self.opts.device, self.uops, mem_estimate=mem_bytes,
                    global_size=[1,1,1] if self.opts.has_local else None, local_size=[1,1,1] if self.opts.has_local else None)
 
+def _is_broadcast(x:UOp, shape:Tuple[sint, ...], out_shape:Tuple[sint, ...]) -> bool:
+  axes = [i for i,(s,o) in enumerate(zip(shape, out_shape)) if s != o]
+  if len(shape) != len(out_shape) or any(out_shape[i] != 1 for i in axes): return False
+  return all(u.arg.real_strides()[i] == 0 for u in x.sparents if u.op is UOps.ST_IDX for i in axes)
+
 # the living definition of UOps.ST_IDX and UOps.ST_VALID
 def verify_ast(ast:UOp) -> Dict[UOp, ShapeTracker]:
   assert ast.op is UOps.SINK and all(x.op is UOps.STORE for x in ast.src), "must be SINK"
@@ -779,6 +812,8 @@ def verify_ast(ast:UOp) -> Dict[UOp, ShapeTracker]:
       st = op.arg if op.op in {UOps.ST_IDX, UOps.ST_VALID} else sts[op.src[-1]]
       for x in (op.src[1:] if op.op in BUFFER_UOPS else op.src):
         if sts[x].shape != st.shape:
+          # a multireduce kernel stores an inner reduce that doesn't change along the later reduce's axes
+          if op.op is UOps.STORE and x is op.src[2] and _is_broadcast(x, sts[x].shape, st.shape): continue
           if prod(sts[x].shape) == prod(st.shape): raise AssertionError(f"found implicit reshape {x.op} {op.op} {sts[x].shape} != {st.shape}")
           raise AssertionError(f"found implicit expand {x.op} {sts[x].shape} != {op.op} {st.shape} {prod(sts[x].shape)} != {prod(st.shape)}")
     sts[op] = st
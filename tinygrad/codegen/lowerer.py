@@ -110,10 +110,10 @@ class IndependentLowerer:
       if x.arg[0] is ReduceOps.WMMA:
         upcast_axes = x.arg[1][-2]
         wmma_sz = [prod(x[1] for x in l) for l in upcast_axes]
-        ret = UOp(UOps.WMMA, dtype=cast(DType, x.dtype).vec(wmma_sz[2]), src=(
-          UOp(UOps.CONTRACT, dtype=cast(DType, in_uops[0].dtype).vec(wmma_sz[0]), src=(in_uops[0],), arg=upcast_axes[0]),
-          UOp(UOps.CONTRACT, dtype=cast(DType, in_uops[1].dtype).vec(wmma_sz[1]), src=(in_uops[1],), arg=upcast_axes[1]),
-          UOp.const(cast(DType, x.dtype).vec(wmma_sz[2]), 0.0)), arg=x.arg[1])
+        # a size 1 source (a cpu tensor core broadcasting A) is a scalar
+        ret = UOp(UOps.WMMA, dtype=cast(DType, x.dtype).vec(wmma_sz[2]), src=tuple(
+          UOp(UOps.CONTRACT, dtype=cast(DType, u.dtype).vec(sz), src=(u,), arg=axes) if sz > 1 else u
+          for u,sz,axes in zip(in_uops, wmma_sz, upcast_axes))+(UOp.const(cast(DType, x.dtype).vec(wmma_sz[2]), 0.0),), arg=x.arg[1])
         return UOp(UOps.EXPAND, x.dtype, tuple(UOp(UOps.GEP, x.dtype, (ret,), i) for i in range(wmma_sz[2])), arg=upcast_axes[2])
       # NOTE: always using ridxs is fine here
       reduce_range, reduce_expand = partition([self.ridxs[i] for i in x.arg[1]], lambda y: y.op is UOps.RANGE)
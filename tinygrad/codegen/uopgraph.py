@@ -3,14 +3,14 @@ from typing import Optional, Tuple, Dict, List, Set, Union, cast, TYPE_CHECKING,
 import functools, itertools, heapq, math, operator
 from collections import defaultdict
 from tinygrad.dtype import dtypes, PtrDType, ImageDType, DType
-from tinygrad.ops import UnaryOps, BinaryOps, exec_alu, UOp, NOp, UOps, UPat, PatternMatcher, END_FOR_UOP, type_verify, print_uops
+from tinygrad.ops import UnaryOps, BinaryOps, Op, exec_alu, UOp, NOp, UOps, UPat, PatternMatcher, END_FOR_UOP, type_verify, print_uops
 from tinygrad.helpers import DEBUG, getenv, flatten, dedup, TRANSCENDENTAL, prod, CI, all_same, partition
 from tinygrad.codegen.transcendental import xexp2, xlog2, xsin, TRANSCENDENTAL_SUPPORTED_DTYPES
 if TYPE_CHECKING: from tinygrad.renderer import Renderer
 
 # ***** float4/image store handling *****
 
-def fold_expanded(ex, buf):
+def fold_expanded(ex, buf, vector_bytes:Optional[int]=None):
   if buf.dtype != PtrDType(dtypes.float) and buf.dtype != PtrDType(dtypes.half) and not isinstance(buf.dtype, ImageDType): return None
   new_srcs = dedup(list(ex.src))
   old_new_srcs = new_srcs[:]
@@ -30,10 +30,13 @@ def fold_expanded(ex, buf):
     offsets_rootsrc[root_src][arg] = i
 
   # then rewrite everything we can
+  if is_image: fold_lengths = [4]
+  elif vector_bytes is not None: fold_lengths = [x for x in [16,8,4,2] if x*buf.dtype.itemsize <= vector_bytes]
+  else: fold_lengths = [8,4,2] if buf.dtype == PtrDType(dtypes.half) and getenv("ALLOW_HALF8") else [4,2]
   used = set()
   for rootsrc, offsets in offsets_rootsrc.items():
     for o in offsets:
-      for fold_length in [4] if is_image else ([8,4,2] if buf.dtype == PtrDType(dtypes.half) and getenv("ALLOW_HALF8") else [4,2]):
+      for fold_length in fold_lengths:
         if all((rootsrc,o+i) not in used and o+i in offsets for i in range(fold_length)):
           load_1 = new_srcs[offsets[o]]
           new_src = list(load_1.src)
@@ -80,12 +83,16 @@ def fix_unfoldable_image_load(load:UOp, buf:UOp):
   return functools.reduce(lambda ret, i: id4.ne(i).where(ret, UOp(UOps.GEP, load.dtype, (vec_load,), i)),
                           range(4), UOp.const(load.dtype, float('nan')))
 
-float4_folding = PatternMatcher([
-  (UPat(UOps.EXPAND, src=UPat(UOps.LOAD, src=(UPat(name="buf"), UPat()), allow_any_len=True), name="ex"), fold_expanded),
-  (UPat({UOps.BARRIER, UOps.SINK}, src=UPat(UOps.STORE, src=(UPat(name="buf"), UPat(), UPat()), allow_any_len=True), name="ex"), fold_expanded),
-  (UPat(UOps.VECTORIZE, src=UPat(UOps.REDUCE), name="vec"), vectorize_reduce),
-  (UPat(UOps.VECTORIZE, src=UPat({UOps.ALU, UOps.CAST, UOps.BITCAST}), name="vec"), vectorize_alu),
-])
+@functools.lru_cache(None)
+def vector_folding(vector_bytes:Optional[int]=None) -> PatternMatcher:
+  fold = functools.partial(fold_expanded, vector_bytes=vector_bytes)
+  return PatternMatcher([
+    (UPat(UOps.EXPAND, src=UPat(UOps.LOAD, src=(UPat(name="buf"), UPat()), allow_any_len=True), name="ex"), fold),
+    (UPat({UOps.BARRIER, UOps.SINK}, src=UPat(UOps.STORE, src=(UPat(name="buf"), UPat(), UPat()), allow_any_len=True), name="ex"), fold),
+    (UPat(UOps.VECTORIZE, src=UPat(UOps.REDUCE), name="vec"), vectorize_reduce),
+    (UPat(UOps.VECTORIZE, src=UPat({UOps.ALU, UOps.CAST, UOps.BITCAST}), name="vec"), vectorize_alu),
+  ])
+float4_folding = vector_folding()
 
 # ***** mod *****
 
@@ -151,7 +158,8 @@ def div_folding(x:UOp, c:int) -> Optional[UOp]:
 
 # ***** transcendental *****
 
-def transcendental_folding(ops):
+@functools.lru_cache(None)
+def transcendental_folding(ops:Tuple[UnaryOps, ...]):
   return PatternMatcher([(UPat(UOps.ALU, dtype=TRANSCENDENTAL_SUPPORTED_DTYPES, src=(UPat(name="d"),), arg=k), cast(Callable, v))
                          for k,v in ((UnaryOps.EXP2, xexp2), (UnaryOps.LOG2, xlog2), (UnaryOps.SIN, xsin)) if k not in ops])
 
@@ -172,7 +180,10 @@ def threefry2x32(x: UOp, seed: UOp):
 
 # ***** main rewriter *****
 
-def reduce_before_expand(reduce, expand, x):
+def reduce_before_expand(reduce, expand):
+  # only an expand of every element of one float vector, in order
+  if (x:=expand.src[0].src[0] if expand.src[0].op is UOps.GEP else None) is None or x.dtype.count != len(expand.src) or \
+    any(s.op is not UOps.GEP or s.dtype != dtypes.float or s.src[0] is not x or s.arg != i for i,s in enumerate(expand.src)): return None
   # if the expand is being reduced, you can't push it through
   # NOTE: could do a partial push here in some cases
   expands = flatten([x.arg for x in reduce.src[1:] if x.op is UOps.EXPAND])
@@ -206,18 +217,15 @@ constant_folder = PatternMatcher([
   (UPat(UOps.ALU, BinaryOps.MUL, dtype=dtypes.bool, name="x"), lambda x: UOp(x.op, x.dtype, x.src, BinaryOps.AND)),
   # VECTORIZE/GEP
   (NOp(UOps.GEP, src=(NOp(UOps.VECTORIZE, name="cast"),), name="gep"), lambda gep, cast: cast.src[gep.arg]),
-  *[(NOp(UOps.VECTORIZE, dtypes.float.vec(i), tuple(NOp(UOps.GEP, dtypes.float,
-                         src=(NOp.var('x', dtype=dtypes.float.vec(i)),), arg=j) for j in range(i))), lambda x: x) for i in [2, 4, 8, 16]],
-  *[(NOp(UOps.VECTORIZE, dtypes.half.vec(i), tuple(NOp(UOps.GEP, dtypes.half,
-                         src=(NOp.var('x', dtype=dtypes.half.vec(i)),), arg=j) for j in range(i))), lambda x: x) for i in [2, 4, 8, 16]],
+  (NOp(UOps.VECTORIZE, name="vec"), lambda vec: x if (x:=vec.src[0].src[0] if vec.src[0].op is UOps.GEP else None) is not None and \
+    x.dtype == vec.dtype and all(s.op is UOps.GEP and s.src[0] is x and s.arg == i for i,s in enumerate(vec.src)) else None),
   # tensor core with a 0 input is acc
   *[(NOp(UOps.WMMA, src=(NOp(UOps.VECTORIZE, src=tuple(NOp.const(None, 0.0) for _ in range(i))), NOp.var(), NOp.var('acc'))),
      lambda acc: acc) for i in [2, 4, 8]],
   *[(NOp(UOps.WMMA, src=(NOp.var(), NOp(UOps.VECTORIZE, src=tuple(NOp.const(None, 0.0) for _ in range(i))), NOp.var('acc'))),
      lambda acc: acc) for i in [2, 4, 8]],
   # tensor core cleanups
-  *[(NOp(UOps.REDUCE, src=(NOp(UOps.EXPAND, src=tuple(NOp(UOps.GEP, dtypes.float, src=(NOp.var('x'),), arg=i) for i in range(j)), name="expand"),)
-    ,name="reduce", allow_any_len=True), reduce_before_expand) for j in [2,4,8]],
+  (NOp(UOps.REDUCE, src=(NOp(UOps.EXPAND, name="expand"),), name="reduce", allow_any_len=True), reduce_before_expand),
   (NOp.var("add") + NOp(UOps.WMMA, name="wmma"),
     lambda add, wmma: UOp(wmma.op, wmma.dtype, (wmma.src[0], wmma.src[1], wmma.src[2]+add), wmma.arg)),
   # threefry
@@ -442,8 +450,11 @@ def do_contract(con:UOp):
     srcs.append(UOp(UOps.VECTORIZE, con.dtype, tuple(lsrcs)))
   return srcs[0] if len(srcs) == 1 else UOp(UOps.EXPAND, con.dtype, tuple(srcs), new_ex_args)
 
-def no_vectorized_alu(alu):
+def no_vectorized_alu(alu, vector_alus:Tuple[Op, ...]=()):
   if alu.dtype.count == 1: return None
+  # keep it a vector op if the renderer has one and no source has to be gathered from scalars first (const broadcasts are fine)
+  if alu.op is UOps.ALU and alu.arg in vector_alus and dtypes.is_float(alu.dtype) and \
+    all(s.op is not UOps.VECTORIZE or all(x.op is UOps.CONST for x in s.src) for s in alu.src): return None
   alus = tuple(UOp(alu.op, alu.dtype.scalar(),
                    tuple(UOp(UOps.GEP, s.dtype.scalar(), (s,), i) for s in alu.src), alu.arg) for i in range(alu.dtype.count))
   return UOp(UOps.VECTORIZE, alu.dtype, alus)
@@ -483,15 +494,18 @@ def delete_redundant_gates(root:UOp) -> Optional[UOp]:
   if len(root.src) == 3 or (gate:=find_gate(root)) is None or gate.src[0] is not root.src[3]: return None
   return UOp(UOps.STORE, root.dtype, root.src[:3], root.arg)
 
-reducer = PatternMatcher([
-  (NOp(UOps.REDUCE, name="root"), do_reduce),
-  # no ALU on vectorized dtypes
-  (UPat({UOps.ALU, UOps.CAST, UOps.BITCAST}, name="alu"), no_vectorized_alu),
-  # delete_redundant_gates (after expand, is this still needed?)
-  (NOp(UOps.STORE, name="root"), delete_redundant_gates),
-  # late fixup of unfoldable image loads
-  (UPat(UOps.LOAD, src=(UPat(name="buf"), UPat()), allow_any_len=True, name="load"), fix_unfoldable_image_load),
-])
+@functools.lru_cache(None)
+def vector_reducer(vector_alus:Tuple[Op, ...]=()) -> PatternMatcher:
+  return PatternMatcher([
+    (NOp(UOps.REDUCE, name="root"), do_reduce),
+    # no ALU on vectorized dtypes, except the ones the renderer has vector instructions for
+    (UPat({UOps.ALU, UOps.CAST, UOps.BITCAST}, name="alu"), functools.partial(no_vectorized_alu, vector_alus=vector_alus)),
+    # delete_redundant_gates (after expand, is this still needed?)
+    (NOp(UOps.STORE, name="root"), delete_redundant_gates),
+    # late fixup of unfoldable image loads
+    (UPat(UOps.LOAD, src=(UPat(name="buf"), UPat()), allow_any_len=True, name="load"), fix_unfoldable_image_load),
+  ])
+reducer = vector_reducer()
 
 # *** uop graph ***
 
@@ -517,26 +531,29 @@ def graph_rewrite(sink:UOp, pm:PatternMatcher) -> UOp:
     return found
   return __inner_rewrite(sink)
 
+pyint_to_int32 = PatternMatcher([(UPat({UOps.CONST, UOps.ALU, UOps.SPECIAL, UOps.RANGE}, dtype=dtypes.pyint, name="x"),
+  lambda x: UOp(x.op, dtypes.int32, x.src, x.arg))])
+
 linearize_cnt = 0
 def linearize_uop(sink_in:Union[UOp, List[UOp]], opts:Optional[Renderer]=None, extra_pm:Optional[PatternMatcher]=None, skip_check=False) -> List[UOp]:
   global linearize_cnt, acc_number
   sink: UOp = sink_in if isinstance(sink_in, UOp) else UOp(UOps.SINK, None, tuple(sink_in))
   assert sink.op is UOps.SINK, f"sink isn't sink, it's {sink.op}"
-  folder = constant_folder + transcendental_folding({} if TRANSCENDENTAL >= 2 or opts is None else opts.code_for_op.keys())
+  # NOTE: the matchers are cached so their compiled rewrite functions are reused across kernels
+  folder = constant_folder + transcendental_folding(tuple() if TRANSCENDENTAL >= 2 or opts is None else tuple(opts.code_for_op.keys()))
 
   # do graph rewrite
   acc_number = 0
   sink = graph_rewrite(sink, folder)
 
   # rewrite pyint to int32
-  sink = graph_rewrite(sink, PatternMatcher([(UPat({UOps.CONST, UOps.ALU, UOps.SPECIAL, UOps.RANGE}, dtype=dtypes.pyint, name="x"),
-    lambda x: UOp(x.op, dtypes.int32, x.src, x.arg))]))
+  sink = graph_rewrite(sink, pyint_to_int32)
 
   # expand
   linearize_cnt += 1
   if linearize_cnt != getenv("DEBUG_EXPAND", 0):
-    sink = graph_rewrite(sink, folder+expander+float4_folding if opts is not None and opts.supports_float4 else folder+expander)
-    sink = graph_rewrite(sink, folder+expander+reducer)
+    sink = graph_rewrite(sink, folder+expander+vector_folding(opts.vector_bytes) if opts is not None and opts.supports_float4 else folder+expander)
+    sink = graph_rewrite(sink, folder+expander+vector_reducer(opts.vector_alus if opts is not None else ()))
 
   # for PTX only
   if extra_pm: sink = graph_rewrite(sink, folder+extra_pm)
@@ -5,12 +5,14 @@ from collections import defaultdict
 from typing import List, Optional, Dict, Tuple, Any, cast, Protocol, Type
 import importlib, inspect, functools, pathlib, os, ctypes, atexit, time, contextlib, array
 from tinygrad.helpers import SAVE_SCHEDULE, getenv, diskcache_get, diskcache_put, DEBUG, GlobalCounters, flat_mv, from_mv, ProfileLogger, PROFILE
+from tinygrad.helpers import METRICS
 from tinygrad.dtype import DType, ImageDType
 from tinygrad.renderer import Renderer
 
 # **************** Device ****************
 
 class _Device:
+  spawned_pid: Optional[int] = None
   def __init__(self) -> None: self._devices: List[str] = [x.stem[len("ops_"):].upper() for x in (pathlib.Path(__file__).parent/"runtime").iterdir() if x.stem.startswith("ops_")]  # noqa: E501
   @functools.lru_cache(maxsize=None)  # this class is a singleton, pylint: disable=method-cache-max-size-none
   def _canonicalize(self, device:str) -> str: return (device.split(":", 1)[0].upper() + ((":"+device.split(":", 1)[1]) if ':' in device else '')).replace(":0", "")   # noqa: E501
@@ -19,8 +21,9 @@ class _Device:
   def __getitem__(self, ix:str) -> Compiled: return self.__get_canonicalized_item(self.canonicalize(ix))
   @functools.lru_cache(maxsize=None)  # this class is a singleton, pylint: disable=method-cache-max-size-none
   def __get_canonicalized_item(self, ix:str) -> Compiled:
-    assert ((cpn:=multiprocessing.current_process().name) == "MainProcess") or ix.split(":")[0] in ["DISK", "NPY"], \
-      f"can only open device {ix} from parent, not {cpn}"
+    # a forked child would share the parent's device state, the ranks launch() spawns start fresh and mark themselves with their pid
+    assert ((cpn:=multiprocessing.current_process().name) == "MainProcess") or self.spawned_pid == os.getpid() or \
+      ix.split(":")[0] in ["DISK", "NPY"], f"can only open device {ix} from parent or a spawned child, not {cpn}"
     x = ix.split(":")[0].upper()
     ret = [cls for cname, cls in inspect.getmembers(importlib.import_module(f'tinygrad.runtime.ops_{x.lower()}')) if (cname.lower() == x.lower() + "device") and x in self._devices][0](ix)  # noqa: E501
     if DEBUG >= 1: print(f"opened device {ix} from pid:{os.getpid()}")
@@ -84,7 +87,10 @@ class Buffer:
       self._buf: Any = self.allocator.offset(self.base._buf, self.nbytes, self.offset)
     else:
       self._buf = opaque if opaque is not None else self.allocator.alloc(self.nbytes, self.options)
-      if not self.device.startswith("DISK"): GlobalCounters.mem_used += self.nbytes
+      if not self.device.startswith("DISK"):
+        GlobalCounters.mem_used += self.nbytes
+        METRICS.add("mem_allocated_bytes", self.nbytes, device=self.device)
+        METRICS.peak("mem_peak_bytes", METRICS.get("mem_allocated_bytes", device=self.device), device=self.device)
     return self
   def __reduce__(self):
     buf = None
@@ -100,7 +106,9 @@ class Buffer:
   def __del__(self):
     if not hasattr(self, '_buf'): return
     if self._base is None:
-      if not self.device.startswith("DISK"): GlobalCounters.mem_used -= self.nbytes
+      if not self.device.startswith("DISK"):
+        GlobalCounters.mem_used -= self.nbytes
+        METRICS.add("mem_allocated_bytes", -self.nbytes, device=self.device)
       self.allocator.free(self._buf, self.nbytes, self.options)
   def __repr__(self):
     return f"<buf real:{hasattr(self, '_buf')} device:{self.device} size:{self.size} dtype:{self.dtype}" + \
@@ -145,19 +153,28 @@ class LRUAllocator(Allocator):  # pylint: disable=abstract-method
   The LRU Allocator is responsible for caching buffers.
   It ensures that buffers are not freed until it is absolutely necessary, optimizing performance.
   """
-  def __init__(self): self.cache: Dict[Tuple[int, Optional[BufferOptions]], Any] = defaultdict(list)
+  def __init__(self):
+    self.cache: Dict[Tuple[int, Optional[BufferOptions]], Any] = defaultdict(list)
+    # the device its metrics are labelled with, set when a device opens it
+    self.dname = ""
   def alloc(self, size:int, options:Optional[BufferOptions]=None):
-    if len(c := self.cache[(size, options)]): return c.pop()
+    METRICS.inc("allocator_alloc_total", device=self.dname, result="hit" if len(c := self.cache[(size, options)]) else "miss")
+    if len(c):
+      METRICS.add("mem_cached_bytes", -size, device=self.dname)
+      return c.pop()
     try: return super().alloc(size, options)
     except (RuntimeError, MemoryError):
       self.free_cache()
       return super().alloc(size, options)
   def free_cache(self):
     for (sz,options),opaques in self.cache.items():
+      METRICS.add("mem_cached_bytes", -sz*len(opaques), device=self.dname)
       for opaque in opaques: super().free(opaque, sz, options)
       opaques.clear()
   def free(self, opaque:Any, size:int, options:Optional[BufferOptions]=None):
-    if getenv("LRU", 1) and (options is None or not options.nolru): self.cache[(size, options)].append(opaque)
+    if getenv("LRU", 1) and (options is None or not options.nolru):
+      METRICS.add("mem_cached_bytes", size, device=self.dname)
+      self.cache[(size, options)].append(opaque)
     else: super().free(opaque, size, options)
 
 class _MallocAllocator(LRUAllocator):
@@ -179,13 +196,17 @@ class Compiler:
   def compile_cached(self, src:str) -> bytes:
     if self.cachekey is None or (lib := diskcache_get(self.cachekey, src)) is None:
       assert not getenv("ASSERT_COMPILE"), f"tried to compile with ASSERT_COMPILE set\n{src}"
+      METRICS.inc("compile_total", compiler=type(self).__name__, result="miss")
       lib = self.compile(src)
       if self.cachekey is not None: diskcache_put(self.cachekey, src, lib)
+    else: METRICS.inc("compile_total", compiler=type(self).__name__, result="hit")
     return lib
 
 class Compiled:
   def __init__(self, device:str, allocator:Allocator, renderer:Optional[Renderer], compiler:Optional[Compiler], runtime, graph=None):
     self.dname, self.allocator, self.compiler, self.runtime, self.graph = device, allocator, compiler or Compiler(), runtime, graph
+    # CLANG and LLVM share the host MallocAllocator and its cache, it's labelled with the first of them that's opened
+    if isinstance(allocator, LRUAllocator) and not allocator.dname: allocator.dname = device
     self.renderer = renderer or Renderer()
   def synchronize(self):
     """
@@ -0,0 +1,134 @@
+from typing import List, Dict, Tuple, Union, Any, cast
+from tinygrad.helpers import dedup, flatten, round_up
+from tinygrad.device import Buffer
+from tinygrad.ops import UOps
+from tinygrad.engine.realize import ExecItem, CompiledRunner, BufferCopy, EmptyOp, ViewOp
+from tinygrad.engine.jit import TinyJit, CapturedJit
+from tinygrad.nn.state import get_parameters
+from tinygrad.renderer.cstyle import ClangRenderer
+
+ALIGN = 64
+
+def _c_ident(x:Union[int, str]) -> str: return "".join(c if c.isalnum() else "_" for c in str(x))
+
+def export_c(jit:Union[TinyJit, CapturedJit], name:str="net", threads:int=1) -> Tuple[str, bytes]:
+  """
+  Exports a CLANG `TinyJit` capture as one C translation unit and a weights blob, so the model runs without Python.
+
+  Buffers the jit reads before it writes them are weights and live in the blob. Weights the jit also writes (like a kv cache) are copied
+  into the arena by init, the others are used in place, so the blob must be 64 byte aligned and outlive the model.
+  Intermediate buffers keep the offsets the jit's memory planner gave them, inside one statically sized arena.
+  With `threads > 1` kernels that don't depend on each other run on a pthread pool. The C API is
+
+  ```c
+  struct net *net_init(const unsigned char *weights);  // NULL if out of memory
+  void net_run(struct net *n, float *input0, ..., float *output0, ..., int var_i, ...);
+  void net_free(struct net *n);
+  ```
+
+  where the inputs are the jit's Tensor arguments, the outputs the Tensors it returns and the ints its symbolic variables by name.
+  """
+  captured = jit.captured if isinstance(jit, TinyJit) else jit
+  assert captured is not None, "run the jit at least twice before exporting it"
+  items: List[Tuple[int, ExecItem]] = [(j,ei) for j,ei in enumerate(captured.jit_cache) if not isinstance(ei.prg, (EmptyOp, ViewOp))]
+  devices = [b.device for _,ei in items for b in ei.bufs if b is not None] + [x[3] for x in captured.expected_st_vars_dtype_device]
+  if not all(isinstance(ei.prg, (CompiledRunner, BufferCopy)) for _,ei in items) or any(d.split(":")[0] != "CLANG" for d in devices):
+    raise NotImplementedError(f"can only export CLANG kernels and copies, not {[ei.prg.display_name for _,ei in items]} on {dedup(devices)}")
+  render_dtype = ClangRenderer().render_dtype
+  def outs(ei:ExecItem) -> List[int]: return ei.prg.p.outs if isinstance(ei.prg, CompiledRunner) else [0]
+  def ins(ei:ExecItem) -> List[int]:
+    # an output can be read by the same kernel (assign), without uops every buffer might be
+    if not isinstance(ei.prg, CompiledRunner): return [1]
+    if ei.prg.p.uops is None: return list(range(len(ei.bufs)))
+    return [u.src[0].arg for u in ei.prg.p.uops if u.op is UOps.LOAD and u.src[0].op is UOps.DEFINE_GLOBAL]
+
+  # the jit cache has None for inputs, inputs that are views of other inputs come after the named ones
+  inputs = [(render_dtype(x[2]), f"input{_c_ident(nm)}") for nm,x in zip(captured.expected_names, captured.expected_st_vars_dtype_device)]
+  outputs: List[Buffer] = dedup([cast(Buffer, lb.base.realized).base for t in get_parameters(captured.ret) for lb in t.lazydata.lbs])
+  def key(j:int, i:int) -> Any:
+    if (b:=captured.jit_cache[j].bufs[i]) is not None: return b.base
+    idx = captured.input_replace[(j,i)]
+    return idx if idx < len(inputs) else captured.extra_view_inputs[idx-len(inputs)][0]
+
+  # every other base buffer is a weight (read before it's written) or scratch
+  written: Dict[Buffer, None] = {}
+  weights: Dict[Buffer, None] = {}
+  for j,ei in items:
+    for i in range(len(ei.bufs)):
+      if not isinstance(b:=key(j, i), Buffer) or b in outputs: continue
+      if i in ins(ei) and b not in written: weights[b] = None
+      if i in outs(ei): written[b] = None
+
+  # the blob holds every weight, the arena holds the weights that get written followed by the scratch buffers
+  blob, blob_off, arena_off, arena_size, init = bytearray(), {}, {}, 0, []
+  for b in weights:
+    blob_off[b] = len(blob)
+    blob += b.as_buffer()
+    blob += bytes(round_up(b.nbytes, ALIGN) - b.nbytes)
+    if b in written:
+      arena_off[b], arena_size = arena_size, arena_size + round_up(b.nbytes, ALIGN)
+      init.append(f"  memcpy(n->arena+{arena_off[b]}, weights+{blob_off[b]}, {b.nbytes});")
+  for b in written:
+    if b not in weights: arena_off[b], arena_size = arena_size, arena_size + round_up(b.nbytes, ALIGN)
+
+  def ref(j:int, i:int) -> str:
+    if (b:=captured.jit_cache[j].bufs[i]) is None:
+      if (idx:=captured.input_replace[(j,i)]) < len(inputs): return f"n->{inputs[idx][1]}"
+      base, offset, _, _, dtype = captured.extra_view_inputs[idx-len(inputs)]
+      return f"({render_dtype(dtype)}*)((unsigned char*)n->{inputs[base][1]}+{offset})"
+    if b.base in outputs: ptr = f"n->output{outputs.index(b.base)}"
+    else: ptr = f"n->arena+{arena_off[b.base]}" if b.base in arena_off else f"weights+{blob_off[b.base]}"
+    return f"({render_dtype(b.dtype)}*)(" + (f"(unsigned char*){ptr}+{b.offset})" if b.offset else f"{ptr})")
+
+  # a kernel runs a level after every kernel that wrote what it touches, and after every kernel that read what it writes
+  levels: List[int] = []
+  last_write: Dict[Any, int] = {}
+  last_read: Dict[Any, int] = {}
+  for j,ei in items:
+    keys = [(i in outs(ei), key(j, i)) for i in range(len(ei.bufs))]
+    levels.append(lvl:=max([0] + [last_write.get(k, -1)+1 for _,k in keys] + [last_read.get(k, -1)+1 for w,k in keys if w]))
+    for w,k in keys:
+      if w: last_write[k] = lvl
+      else: last_read[k] = max(last_read.get(k, 0), lvl)
+  order = sorted(range(len(items)), key=lambda x: levels[x])
+  level_starts = [c for c,x in enumerate(order) if c == 0 or levels[x] != levels[order[c-1]]] + [len(order)]
+
+  calls = []
+  for c,x in enumerate(order):
+    j, ei = items[x]
+    if isinstance(ei.prg, CompiledRunner):
+      args = [ref(j, i) for i in range(len(ei.bufs))] + [f"n->var_{v.expr}" for v in ei.prg.p.vars]
+      calls.append(f"    case {c}: {ei.prg.p.function_name}({', '.join(args)}); break;")
+    else: calls.append(f"    case {c}: memcpy({ref(j, 0)}, {ref(j, 1)}, {cast(Buffer, ei.bufs[0]).nbytes}); break;")
+
+  variables = sorted(dedup(flatten([ei.prg.p.vars for _,ei in items if isinstance(ei.prg, CompiledRunner)])), key=lambda v: v.expr)
+  params = [(f"{t} *", nm) for t,nm in inputs] + [(f"{render_dtype(b.dtype)} *", f"output{i}") for i,b in enumerate(outputs)] + \
+           [("int ", f"var_{v.expr}") for v in variables]
+  pool = threads > 1
+  src = ["// exported by tinygrad", "#include <stdlib.h>", "#include <string.h>"] + (["#include <pthread.h>"] if pool else [])
+  src += dedup([ei.prg.p.src for _,ei in items if isinstance(ei.prg, CompiledRunner)])
+  src += [f"struct {name} {{", "  unsigned char *arena;", "  const unsigned char *weights;"] + [f"  {t}{nm};" for t,nm in params]
+  if pool: src += ["  int quit;", "  pthread_barrier_t barrier;", f"  pthread_t threads[{threads-1}];",
+                   f"  struct {name}_worker {{ struct {name} *n; int tid; }} workers[{threads-1}];"]
+  src += ["};", f"static const int {name}_levels[] = {{{', '.join(map(str, level_starts))}}};",
+          f"static void {name}_kernel(struct {name} *n, int k) {{", "  const unsigned char *weights = n->weights;",
+          "  switch (k) {", *calls, "  }", "}",
+          f"static void {name}_work(struct {name} *n, int tid) {{", f"  for (int l = 0; l < {len(level_starts)-1}; l++) {{",
+          f"    for (int k = {name}_levels[l]+tid; k < {name}_levels[l+1]; k += {threads}) {name}_kernel(n, k);",
+          *(["    pthread_barrier_wait(&n->barrier);"] if pool else []), "  }", "}"]
+  if pool: src += [f"static void *{name}_worker(void *arg) {{", f"  struct {name}_worker *w = arg;", "  for (;;) {",
+                   "    pthread_barrier_wait(&w->n->barrier);", "    if (w->n->quit) return NULL;", f"    {name}_work(w->n, w->tid);", "  }", "}"]
+  src += [f"struct {name} *{name}_init(const unsigned char *weights) {{", f"  struct {name} *n = calloc(1, sizeof(struct {name}));",
+          f"  if (n == NULL || (n->arena = aligned_alloc({ALIGN}, {max(arena_size, ALIGN)})) == NULL) {{ free(n); return NULL; }}",
+          "  n->weights = weights;", *init]
+  if pool: src += [f"  pthread_barrier_init(&n->barrier, NULL, {threads});", f"  for (int i = 0; i < {threads-1}; i++) {{",
+                   "    n->workers[i].n = n, n->workers[i].tid = i+1;",
+                   f"    pthread_create(&n->threads[i], NULL, {name}_worker, &n->workers[i]);", "  }"]
+  src += ["  return n;", "}", f"void {name}_run({', '.join([f'struct {name} *n'] + [t+nm for t,nm in params])}) {{"]
+  src += [f"  n->{nm} = {nm};" for _,nm in params] + (["  pthread_barrier_wait(&n->barrier);"] if pool else [])
+  src += [f"  {name}_work(n, 0);", "}", f"void {name}_free(struct {name} *n) {{"]
+  if pool: src += ["  n->quit = 1;", "  pthread_barrier_wait(&n->barrier);",
+                   f"  for (int i = 0; i < {threads-1}; i++) pthread_join(n->threads[i], NULL);",
+                   "  pthread_barrier_destroy(&n->barrier);"]
+  src += ["  free(n->arena);", "  free(n);", "}"]
+  return "\n".join(src), bytes(blob)
@@ -1,8 +1,10 @@
-from typing import List, Dict, Optional, cast, Generator, Tuple, Union
-import time, pprint
+from typing import List, Dict, Optional, cast, Generator, Tuple, Union, Any
+import time, pprint, functools, hashlib, pickle, pathlib, re, multiprocessing, multiprocessing.pool, signal
 from collections import defaultdict
 from dataclasses import dataclass, replace
 from tinygrad.helpers import colored, getenv, DEBUG, GlobalCounters, ansilen, BEAM, NOOPT, all_int, CAPTURING, Metadata, Context, TRACEMETA, dedup
+from tinygrad.helpers import PROFILE, METRICS, cpu_profile, ansistrip, ContextVar, CACHELEVEL, VERSION, diskcache_get, diskcache_put, to_function_name
+from tinygrad.helpers import PARALLEL_CODEGEN, KERNEL_METRICS
 from tinygrad.ops import MetaOps, UOps, UOp
 from tinygrad.dtype import dtypes
 from tinygrad.device import Device, Buffer
@@ -69,6 +71,8 @@ class Runner:
   def __init__(self, display_name:str, dname:str, op_estimate:sint=0, mem_estimate:sint=0, lds_estimate:Optional[sint]=None):
     self.first_run, self.display_name, self.dname, self.op_estimate, self.mem_estimate, self.lds_estimate = \
       True, display_name, dname, op_estimate, mem_estimate, mem_estimate if lds_estimate is None else lds_estimate
+  @functools.cached_property
+  def name(self) -> str: return ansistrip(self.display_name)
   @property
   def device(self): return Device[self.dname]
   def exec(self, rawbufs:List[Buffer], var_vals:Optional[Dict[Variable, int]]=None) -> Optional[float]:
@@ -80,7 +84,8 @@ class CompiledRunner(Runner):
   def __init__(self, p:Program, precompiled:Optional[bytes]=None):
     if DEBUG >= 4: print(p.src)
     self.p:Program = p
-    self.lib:bytes = precompiled if precompiled is not None else Device[p.dname].compiler.compile_cached(p.src)
+    with cpu_profile(p.function_name, subactor="compile"):
+      self.lib:bytes = precompiled if precompiled is not None else Device[p.dname].compiler.compile_cached(p.src)
     self.clprg = Device[p.dname].runtime(p.function_name, self.lib)
     super().__init__(p.name, p.dname, p.op_estimate, p.mem_estimate, p.lds_estimate)
 
@@ -146,15 +151,102 @@ class BufferXfer(BufferCopy):
 
 # **************** method cache ****************
 
+# **************** Program cache ****************
+
+# a Program is a function of the codegen source, the renderer, the knobs below and the ast, so the applied opts don't need to be in the key
+_PROGRAM_IGNORE_CTX = {"DEBUG", "CAPTURING", "TRACEMETA", "GRAPH", "SAVE_SCHEDULE", "PROFILE", "PROFILEPATH", "JIT"}
+_PROGRAM_ENV = ("ALLOW_HALF8", "EXPAND_SSA", "MERGE_VIEW", "DISABLE_LOOP_COLLAPSE", "NOLOCALS", "MV", "MV_BLOCKSIZE", "MV_THREADS_PER_ROW",
+                "MV_ROWS_PER_THREAD", "BEAM_ESTIMATE", "BEAM_COMPARE", "BEAM_PADTO", "BEAM_UOPS_MAX", "BEAM_UPCAST_MAX", "BEAM_LOCAL_MAX")
+
+# the renderer options codegen reads, the code of the renderer class is covered by the version
+_RENDERER_FIELDS = ("device", "suffix", "supports_float4", "vector_bytes", "vector_alus", "has_local", "has_shared", "global_max", "local_max",
+                    "shared_max", "tensor_cores")
+
+@functools.lru_cache(None)
+def _codegen_version() -> str:
+  # any change to the code that goes from an ast to a Program invalidates the cache
+  root = pathlib.Path(__file__).parent.parent
+  files = sorted([*(root/"codegen").glob("*.py"), *(root/"renderer").glob("*.py"), *(root/"shape").glob("*.py"), root/"ops.py", root/"dtype.py",
+                  root/"engine"/"realize.py", root/"engine"/"search.py"])
+  return hashlib.sha256(b"".join(f.read_bytes() for f in files) + str(VERSION).encode()).hexdigest()
+
+def _program_key(renderer:Renderer, dname:str, ast:UOp) -> Dict[str, str]:
+  ctx = sorted((k, v.value) for k,v in ContextVar._cache.items() if k not in _PROGRAM_IGNORE_CTX)
+  ident = (type(renderer).__module__, type(renderer).__name__, dname, [(k, repr(getattr(renderer, k))) for k in _RENDERER_FIELDS])
+  return {"ast": ast.key.hex(), "version": _codegen_version(),
+          "opts": hashlib.sha256(repr((ident, ctx, [getenv(x, "") for x in _PROGRAM_ENV])).encode()).hexdigest()}
+
+def _rename_program(prg:Program, name:str) -> Program:
+  return replace(prg, name=name, src=re.sub(rf"\b{prg.function_name}\b", to_function_name(name), prg.src))
+
+# DEBUG>=3 prints from get_kernel and linearize, so it can't be served from the cache
+def _plain_lowering() -> bool: return logkerns is None and DEBUG < 3 and not getenv("FUZZ_UOPS") and not getenv("RUN_PROCESS_REPLAY")
+
+def _cached_program(renderer:Renderer, dname:str, ast:UOp) -> Optional[Program]:
+  if CACHELEVEL < 1: return None
+  # the entry is checked against its digest, a truncated or foreign entry is a miss and gets overwritten
+  if (entry:=diskcache_get("program", _program_key(renderer, dname, ast))) is not None and isinstance(entry, tuple) and len(entry) == 2 and \
+      hashlib.sha256(entry[1]).digest() == entry[0] and isinstance(prg:=pickle.loads(entry[1]), Program):
+    METRICS.inc("program_cache_total", result="hit")
+    return prg
+  METRICS.inc("program_cache_total", result="miss")
+  return None
+
+def _base_program(renderer:Renderer, dname:str, ast:UOp, check_cache=True) -> Program:
+  # the Program named without the process unique suffix, from the disk cache if it's there
+  if check_cache and (prg:=_cached_program(renderer, dname, ast)) is not None: return prg
+  prg = (k:=get_kernel(renderer, ast)).to_program(name_override=k.base_name)
+  if CACHELEVEL >= 1: diskcache_put("program", _program_key(renderer, dname, ast), (hashlib.sha256(blob:=pickle.dumps(prg)).digest(), blob))
+  return prg
+
+def get_program(renderer:Renderer, dname:str, ast:UOp) -> Program:
+  if not _plain_lowering(): return get_kernel(renderer, ast).to_program()
+  return _rename_program(prg:=_base_program(renderer, dname, ast), Kernel.unique_name(prg.name))
+
+# **************** parallel codegen ****************
+
+codegen_pool: Optional[multiprocessing.pool.Pool] = None
+def _init_codegen_worker(): signal.signal(signal.SIGINT, signal.SIG_IGN)
+def _codegen_worker(x:Tuple[Renderer, str, UOp, List[Tuple[str, Any]]]) -> Optional[Program]:
+  renderer, dname, ast, ctx = x
+  # a kernel that fails here is lowered again in the main process, where its error has the schedule item's context
+  try:
+    with Context(**{k:v for k,v in ctx if k in ContextVar._cache}): return _base_program(renderer, dname, ast, check_cache=False)
+  except Exception: return None
+
+def codegen_schedule(schedule:List[ScheduleItem]):
+  """Lowers the kernels of `schedule` that aren't in the method cache on `PARALLEL_CODEGEN` worker processes."""
+  global codegen_pool
+  if not PARALLEL_CODEGEN or BEAM >= 1 or not _plain_lowering(): return
+  todo: Dict[Tuple[str, bytes, int, int, bool], Tuple[str, UOp]] = {}
+  for si in schedule:
+    if si.ast.op is not UOps.SINK: continue
+    if (bkey:=((dname:=si.outputs[0].device).split(":")[0], si.ast.key, BEAM.value, NOOPT.value, True)) not in method_cache:
+      todo.setdefault(bkey, (dname, si.ast))
+  # disk cache hits are read here, only the misses are worth sending to the workers
+  prgs = {bkey:_cached_program(Device[dname].renderer, dname.split(":")[0], ast) for bkey,(dname,ast) in todo.items()}
+  if len(misses:=[bkey for bkey,prg in prgs.items() if prg is None]) >= 2:
+    if codegen_pool is None: codegen_pool = multiprocessing.get_context("spawn").Pool(PARALLEL_CODEGEN.value, _init_codegen_worker)
+    ctx = [(k, v.value) for k,v in ContextVar._cache.items()]
+    args = [(Device[(dname:=todo[bkey][0])].renderer, dname.split(":")[0], todo[bkey][1], ctx) for bkey in misses]
+    prgs.update(zip(misses, codegen_pool.map(_codegen_worker, args)))
+  elif misses: prgs[misses[0]] = _base_program(Device[(dname:=todo[misses[0]][0])].renderer, dname.split(":")[0], todo[misses[0]][1], False)
+  # names are given in schedule order, so they match lowering the kernels one at a time
+  for bkey,prg in prgs.items():
+    if prg is not None: method_cache[bkey] = CompiledRunner(replace(_rename_program(prg, Kernel.unique_name(prg.name)), dname=todo[bkey][0]))
+
 method_cache: Dict[Tuple[str, bytes, int, int, bool], CompiledRunner] = {}
 def get_runner(dname:str, ast:UOp) -> CompiledRunner:
   ckey = (dname, ast.key, BEAM.value, NOOPT.value, False)
-  if cret:=method_cache.get(ckey): return cret
+  if cret:=method_cache.get(ckey):
+    METRICS.inc("method_cache_total", result="hit")
+    return cret
   bkey = (dname.split(":")[0], ast.key, BEAM.value, NOOPT.value, True)
+  METRICS.inc("method_cache_total", result="miss" if bkey not in method_cache else "device_hit")
   if bret:=method_cache.get(bkey):
     method_cache[ckey] = ret = CompiledRunner(replace(bret.p, dname=dname), bret.lib)
   else:
-    prg: Program = get_kernel(Device[dname].renderer, ast).to_program()
+    prg: Program = get_program(Device[dname].renderer, dname.split(":")[0], ast)
     if getenv("FUZZ_UOPS"):
       from test.external.fuzz_uops import UOpsFuzzerRunner
       return UOpsFuzzerRunner(replace(prg, dname=dname))
@@ -170,7 +262,20 @@ class ExecItem:
   metadata: Optional[List[Metadata]] = None
   def run(self, var_vals:Optional[Dict[Variable, int]]=None, wait=False, jit=False, do_update_stats=True) -> Optional[float]:
     bufs = [cast(Buffer, x) for x in self.bufs] if jit else [cast(Buffer, x).ensure_allocated() for x in self.bufs]
-    et = self.prg(bufs, var_vals if var_vals is not None else {}, wait=wait or DEBUG >= 2)
+    # NOTE: this is the host side time, on backends that run asynchronously it only covers the launch
+    st = time.perf_counter() if KERNEL_METRICS else 0.0
+    # nothing profiler related is built per launch without PROFILE
+    if PROFILE:
+      prof: Dict[str, Any] = {"metadata": ", ".join(map(repr, self.metadata or [])), "ops": int(sym_infer(self.prg.op_estimate, var_vals)),
+                              "mem": int(sym_infer(self.prg.mem_estimate, var_vals))}
+      with cpu_profile(self.prg.name, self.prg.dname, "copy" if isinstance(self.prg, BufferCopy) else "kernel", **prof):
+        et = self.prg(bufs, var_vals if var_vals is not None else {}, wait=wait or DEBUG >= 2)
+    else: et = self.prg(bufs, var_vals if var_vals is not None else {}, wait=wait or DEBUG >= 2)
+    # per kernel series cost a label lookup per launch and grow with the number of kernels, so they are opt in
+    if KERNEL_METRICS:
+      METRICS.inc("kernel_calls_total", device=self.prg.dname, kernel=self.prg.name)
+      # NOTE: without wait this is host side time
+      METRICS.observe("kernel_seconds", et if et is not None else time.perf_counter()-st, device=self.prg.dname, kernel=self.prg.name)
     if do_update_stats:
       GlobalCounters.kernel_count += 1
       GlobalCounters.global_ops += (op_est:=sym_infer(self.prg.op_estimate, var_vals))
@@ -196,16 +301,21 @@ def lower_schedule_item(si:ScheduleItem) -> ExecItem:
     kernel_type = BufferCopy
     if hasattr(Device[out.device].allocator, 'transfer') and out.device.split(":")[0] == si.inputs[0].device.split(":")[0]:
       kernel_type = BufferXfer
-    return ExecItem(kernel_type(arg, out.device, si.inputs[0].device), list(si.bufs))
+    return ExecItem(kernel_type(arg, out.device, si.inputs[0].device), list(si.bufs), si.metadata)
   if op is MetaOps.CUSTOM: return ExecItem(CustomOp(arg), list(si.bufs))
   if op is MetaOps.EMPTY: return ExecItem(EmptyOp(out), list(si.bufs))
   if op is MetaOps.VIEW: return ExecItem(ViewOp(out), list(si.bufs))
   raise RuntimeError(f"don't know how to lower {si.ast}")
 
 def lower_schedule(schedule:List[ScheduleItem]) -> Generator[ExecItem, None, None]:
+  codegen_schedule(schedule)
   while len(schedule):
     si = schedule.pop(0)
-    try: yield lower_schedule_item(si)
+    try:
+      with cpu_profile("lower", subactor="lower") as ev:
+        ei = lower_schedule_item(si)
+        if ev is not None: ev["name"] = ei.prg.name
+      yield ei
     except Exception as e:
       if DEBUG >= 2:
         print(f"error lowering {si.ast.op}")
@@ -1,11 +1,11 @@
 import sys, pickle, atexit, importlib, contextlib
 from collections import defaultdict, deque
 from dataclasses import dataclass, field
-from typing import Tuple, List, Dict, Optional, Set, DefaultDict, get_args
+from typing import Tuple, List, Dict, Optional, Set, DefaultDict, Deque, cast, get_args
 from tinygrad.ops import MetaOps, ReduceOps, UNSAFE_PAD_OPS, UnaryOps, UOp, UOps
 from tinygrad.engine.graph import log_lazybuffer, realized_lazybuffer
-from tinygrad.helpers import GRAPH, DEBUG, MULTIOUTPUT, SAVE_SCHEDULE, FUSE_CONV_BW, FUSE_ARANGE, \
-                             GlobalCounters, colored, prod, dedup, all_int, merge_dicts, getenv, Metadata
+from tinygrad.helpers import GRAPH, DEBUG, MULTIOUTPUT, SAVE_SCHEDULE, FUSE_CONV_BW, FUSE_ARANGE, FUSE_HORIZONTAL, FUSE_MULTIREDUCE, \
+                             GlobalCounters, colored, prod, dedup, all_int, merge_dicts, getenv, Metadata, UOP_INTERN
 from tinygrad.shape.symbolic import Variable, sint
 from tinygrad.dtype import ConstType, ImageDType, PtrDType, dtypes
 from tinygrad.lazy import LazyBuffer
@@ -144,6 +144,19 @@ def _recurse_reduceops(buf:LazyBuffer, st:ShapeTracker, realizes:Dict[LazyBuffer
     return (buf, st)
   return cache.setdefault((buf, st), top_reduce)
 
+def _inner_reduces(outs:List[LazyBuffer], realizes:Dict[LazyBuffer, None]) -> Dict[LazyBuffer, None]:
+  """the outputs that are read by a reduce of another output in the same kernel"""
+  inner: Dict[LazyBuffer, None] = {}
+  queue, seen = deque((out, False) for out in outs), set()
+  while queue:
+    if (x:=queue.popleft()) in seen: continue
+    seen.add(x)
+    buf, below_reduce = x
+    if below_reduce and buf in outs: inner[buf] = None
+    if buf.realized is not None or (buf in realizes and buf not in outs): continue
+    queue.extend((s.base, below_reduce or isinstance(buf.op, ReduceOps)) for s in buf.srcs)
+  return inner
+
 def _lower_lazybuffer(outs:List[LazyBuffer], realizes:Dict[LazyBuffer, None]) -> LBScheduleItem:
   """describe the computation for a LazyBuffer with UOp + inputs + var_vals"""
   if (out:=outs[0]).op is MetaOps.COPY and getenv("USE_COPY_KERNEL") and out.device.split(":")[0] == out.srcs[0].device.split(":")[0]:
@@ -152,11 +165,14 @@ def _lower_lazybuffer(outs:List[LazyBuffer], realizes:Dict[LazyBuffer, None]) ->
     wr = UOp(UOps.STORE, None, (UOp(UOps.DEFINE_GLOBAL, PtrDType(out.dtype), (), 0), idx, rd, valid))
     return LBScheduleItem(UOp(UOps.SINK, None, (wr,)), outs, [x.base for x in out.srcs])
   if out.op in {MetaOps.CUSTOM, MetaOps.COPY, MetaOps.EMPTY, MetaOps.VIEW}:
-    return LBScheduleItem(UOp(UOps.EXT, out.dtype, (), (out.op, out.arg)), outs, [x.base for x in out.srcs])
+    return LBScheduleItem(UOp(UOps.EXT, out.dtype, (), (out.op, out.arg)), outs, [x.base for x in out.srcs],
+                          metadata=[out.metadata] if out.metadata else [])
   # push through all movementops between reduceops
   reduce_info: Dict[Tuple[LazyBuffer, ShapeTracker], Tuple[ShapeTracker, Tuple[int, ...]]] = {}
   seen_ops: Dict[Tuple[LazyBuffer, ShapeTracker], Optional[Tuple[LazyBuffer, ShapeTracker]]] = {}
-  for out in outs: _recurse_reduceops(out, out.st, realizes, outs, reduce_info, seen_ops)
+  inner = _inner_reduces(outs, realizes)
+  for out in outs:
+    if out not in inner: _recurse_reduceops(out, out.st, realizes, outs, reduce_info, seen_ops)
   # pad all reduceops to the max of each dimension
   shape_dims = [sorted(dedup(dims)) for dims in zip(*[input_st.shape for input_st,_ in reduce_info.values()])]
   for i,dims in enumerate(shape_dims):
@@ -171,9 +187,14 @@ def _lower_lazybuffer(outs:List[LazyBuffer], realizes:Dict[LazyBuffer, None]) ->
   cache: Dict[Tuple[LazyBuffer, ShapeTracker], UOp] = {}
   ast: List[UOp] = []
   inputs: Dict[LazyBuffer, int] = {}
+  srcs: Dict[LazyBuffer, UOp] = {}
+  out_st = ShapeTracker.from_shape(ShapeTracker.reduce(*deque(reduce_info.values(), 1).pop()) if reduce_info else outs[0].shape)
+  for out in outs:
+    if out not in inner: srcs[out] = _recursive_uop(out, out_st, tuple(outs), var_vals, inputs, realizes, assign_targets, reduce_info, cache)
+  # a reduce read by a later reduce of this kernel is stored from inside it, it doesn't depend on the later reduce's axes
+  for out in inner: srcs[out] = next(u for (b,_),u in cache.items() if b is out)
   for i, out in enumerate(outs):
-    output_st = ShapeTracker.from_shape(ShapeTracker.reduce(*deque(reduce_info.values(), 1).pop()) if reduce_info else out.shape)
-    src = _recursive_uop(out, output_st, tuple(outs), var_vals, inputs, realizes, assign_targets, reduce_info, cache=cache)
+    src, output_st = srcs[out], out_st
     if out.op is MetaOps.ASSIGN and out.arg:
       assert out.arg[0].shape == out.shape, f"ASSIGN must not override output shape {out.arg[0].shape} != {out.shape}"
       output_st = out.arg[0].reshape(output_st.shape)
@@ -181,7 +202,9 @@ def _lower_lazybuffer(outs:List[LazyBuffer], realizes:Dict[LazyBuffer, None]) ->
     if vv: var_vals.update(vv)
     ubuf = UOp(UOps.DEFINE_GLOBAL, out.dtype if isinstance(out.dtype, ImageDType) else PtrDType(out.dtype), (), i)
     ast.append(UOp(UOps.STORE, None, (ubuf, UOp(UOps.ST_IDX, dtypes.pyint, (), output_st), src, UOp(UOps.ST_VALID, dtypes.bool, (), output_st))))
-  return LBScheduleItem(UOp(UOps.SINK, None, tuple(ast)), outs, list(inputs), var_vals,
+  sink = UOp(UOps.SINK, None, tuple(ast))
+  # with UOP_INTERN, identical kernels across schedules share one AST and hash their key once
+  return LBScheduleItem(sink.intern() if UOP_INTERN else sink, outs, list(inputs), var_vals,
                         dedup([x[0].metadata for x in cache if x[0].metadata and x[0] not in inputs]))
 
 # *** DAG creation: decide which LazyBuffers should realize ***
@@ -260,6 +283,35 @@ def _get_isolated_children(r:LazyBuffer, reduce_for_op:Dict[LazyBuffer, LazyBuff
   for tr in group: _recursive_group(tr, tr.st, tr, children, realizes, reduce_for_op, descendants, cache={})
   return merge_dicts([group, {} if any(tr in group for tr in descendants) else descendants])
 
+def _multireduce_readers(tr:LazyBuffer, children:DefaultDict[LazyBuffer, Dict[LazyBuffer, None]],
+                         realizes:Dict[LazyBuffer, None]) -> Optional[Tuple[Dict[LazyBuffer, None], Dict[LazyBuffer, None]]]:
+  """the reduces that read tr with nothing realized in between, and the realized buffers that read it without a reduce.
+  None if a reduce doesn't read it as one value per reduce, expanded along the reduce axes"""
+  reduces: Dict[LazyBuffer, None] = {}
+  stores: Dict[LazyBuffer, None] = {}
+  queue, seen = deque((c, tr.st+s.st) for c in children[tr] for s in c.srcs if s.base is tr), set()
+  while queue:
+    if (x:=queue.popleft()) in seen: continue
+    seen.add(x)
+    c, st = x
+    if isinstance(c.op, ReduceOps):
+      if any(st.real_strides()[i] != 0 for i in c.arg): return None
+      reduces[c] = None
+    elif c in realizes: stores[c] = None
+    else: queue.extend((cc, st+s.st) for cc in children[c] for s in cc.srcs if s.base is c)
+  return reduces, stores
+
+def _reads_any(buf:LazyBuffer, targets:Dict[LazyBuffer, None], allbufs:Dict[LazyBuffer, None], stored_by:Dict[LazyBuffer, LazyBuffer]) -> bool:
+  """if buf depends on any of targets, a buffer stored by a multireduce kernel depends on everything its later reduce does"""
+  queue, seen = deque([buf]), set()
+  while queue:
+    if (x:=queue.popleft()) in seen: continue
+    seen.add(x)
+    if x in targets: return True
+    queue.extend(s.base for s in x.srcs if s.base in allbufs)
+    if x in stored_by: queue.append(stored_by[x])
+  return False
+
 SCHEDULES: List[Tuple[DefaultDict[LBScheduleItem, List[LBScheduleItem]], DefaultDict[LBScheduleItem, int]]] = []
 def _graph_schedule(outs:List[LazyBuffer], seen:Set[LazyBuffer]) -> \
   Tuple[DefaultDict[LBScheduleItem, List[LBScheduleItem]],  # this is the graph
@@ -328,6 +380,30 @@ def _graph_schedule(outs:List[LazyBuffer], seen:Set[LazyBuffer]) -> \
       top_reduce = reduceop.base.srcs[0].base
       if len(children[top_reduce]) == 1: del realizes[top_reduce]
 
+  # fuse a reduce into the next reduce over the same axis, it's stored by that kernel if something else reads it
+  if FUSE_MULTIREDUCE:
+    fused: Dict[LazyBuffer, Tuple[LazyBuffer, LazyBuffer, Dict[LazyBuffer, None]]] = {}
+    for tr,r in merge_dicts([{r:r for r in allbufs if isinstance(r.op, ReduceOps)}, reduce_for_op]).items():
+      if tr not in realizes or tr.forced_realize or isinstance(tr.op, MetaOps) or any(x.base is tr for x in outs): continue
+      if (readers:=_multireduce_readers(tr, children, realizes)) is None: continue
+      reduces, stores = readers
+      if len(reduces) != 1 or (r2:=next(iter(reduces))).srcs[0].shape != r.srcs[0].shape or r2.arg != r.arg: continue
+      # the kernel of the later reduce can't also read it after the reduce
+      if stores and (not MULTIOUTPUT or any(x is r2 or reduce_for_op.get(x) is r2 for x in stores)): continue
+      fused[tr] = (r, r2, stores)
+    stored_by: Dict[LazyBuffer, LazyBuffer] = {}
+    for tr,(r,r2,stores) in fused.items():
+      # only one reduce deep, lowering can't nest a reduce that already has another one fused into it
+      if any(r is x[1] for x in fused.values()): continue
+      if not stores:
+        del realizes[tr]
+        continue
+      # chains of reduces stay in one kernel only if nothing in the middle is stored
+      if any(t in fused for t,rop in merge_dicts([{r2:r2}, reduce_for_op]).items() if rop is r2): continue
+      # the kernels that read it can't be inputs of the kernel that stores it
+      if _reads_any(r2, stores, allbufs, stored_by): continue
+      reduce_for_op[tr] = stored_by[tr] = r2
+
   for r in reduce_of_const:
     group = {tr:None for tr,rop in reduce_for_op.items() if rop is r}
     if DEBUG_ARANGE:=(getenv("DEBUG_ARANGE")): print(f"checking {r} {group=}")
@@ -380,6 +456,60 @@ def _graph_schedule(outs:List[LazyBuffer], seen:Set[LazyBuffer]) -> \
     SCHEDULES.append((graph, in_degree))
   return graph, in_degree
 
+# *** horizontal fusion: independent small kernels run as one ***
+
+def _hfuse_dims(lsi:LBScheduleItem) -> Optional[Tuple[int, int, int]]:
+  """(output size, reduce size, number of reduce axes) of a kernel that can be fused horizontally, None if it can't"""
+  if lsi.ast.op is not UOps.SINK or lsi.var_vals or any(isinstance(x.dtype, ImageDType) for x in lsi.outputs+lsi.inputs): return None
+  shapes = dedup(u.arg.shape for u in lsi.ast.sparents if u.op in {UOps.ST_IDX, UOps.ST_VALID})
+  axes = dedup(u.arg[1] for u in lsi.ast.sparents if u.op is UOps.REDUCE_AXIS)
+  if not all(all_int(x) for x in shapes) or len(axes) > 1: return None
+  full = max(shapes, key=prod)
+  # the reduce axes are permuted to the end by the scheduler, they are flattened into one
+  k = len(axes[0]) if axes else 0
+  if axes and axes[0] != tuple(range(len(full)-k, len(full))): return None
+  if any(x != full and x != full[:len(full)-k]+(1,)*k for x in shapes): return None
+  return prod(full[:len(full)-k]), prod(full[len(full)-k:]), k
+
+def _hfuse(group:List[LBScheduleItem], dims:List[Tuple[int, int, int]]) -> LBScheduleItem:
+  """one kernel for the group, where each kernel owns a slice of the output axis and is masked out everywhere else"""
+  total = sum(n for n,_,_ in dims)
+  outputs = [x for lsi in group for x in lsi.outputs]
+  inputs = dedup([x for lsi in group for x in lsi.inputs])
+  stores: List[UOp] = []
+  for lsi,(n,_,k) in zip(group, dims):
+    off, out_off = sum(d[0] for d in dims[:group.index(lsi)]), sum(len(x.outputs) for x in group[:group.index(lsi)])
+    bufs = {**{i:out_off+i for i in range(len(lsi.outputs))}, **{len(lsi.outputs)+i:len(outputs)+inputs.index(x) for i,x in enumerate(lsi.inputs)}}
+    cache: Dict[UOp, UOp] = {}
+    def fix(u:UOp) -> UOp:
+      if u in cache: return cache[u]
+      arg = u.arg
+      if u.op is UOps.DEFINE_GLOBAL: arg = bufs[u.arg]
+      if u.op is UOps.REDUCE_AXIS: arg = (u.arg[0], (1,))
+      if u.op in {UOps.ST_IDX, UOps.ST_VALID}:
+        st = u.arg.reshape((n, prod(u.arg.shape[len(u.arg.shape)-k:])) if k else (n,))
+        arg = st.pad(((off, total-off-n),) + ((0, 0),)*(k != 0)).simplify()
+      return cache.setdefault(u, UOp(u.op, u.dtype, tuple(fix(x) for x in u.src), arg))
+    stores.extend(fix(x) for x in lsi.ast.src)
+  sink = UOp(UOps.SINK, None, tuple(stores))
+  return LBScheduleItem(sink.intern() if UOP_INTERN else sink, outputs, inputs, merge_dicts([x.var_vals for x in group]),
+                        dedup([m for x in group for m in x.metadata]))
+
+def _hfuse_group(lsi:LBScheduleItem, queue:Deque[LBScheduleItem], hfuse_dims:Dict[LBScheduleItem, Optional[Tuple[int, int, int]]]) \
+    -> List[LBScheduleItem]:
+  """take the kernels in the queue (which don't depend on each other) that can run with lsi, bounded by the work of the fused kernel"""
+  def dims(x:LBScheduleItem): return hfuse_dims[x] if x in hfuse_dims else hfuse_dims.setdefault(x, _hfuse_dims(x))
+  if (d0:=dims(lsi)) is None: return [lsi]
+  group, total = [lsi], d0[0]
+  for x in list(queue):
+    if (d:=dims(x)) is None or x.outputs[0].device != lsi.outputs[0].device or d[1] != d0[1] or (d[2] == 0) != (d0[2] == 0): continue
+    # every kernel in the group runs (masked) over the whole fused output axis
+    if (len(group)+1) * (total+d[0]) * d0[1] > getenv("FUSE_HORIZONTAL_MAX", 4096): continue
+    group.append(x)
+    total += d[0]
+    queue.remove(x)
+  return group
+
 # *** DAG ordering: breadth first search ***
 
 def create_schedule_with_vars(outs:List[LazyBuffer], seen:Optional[Set[LazyBuffer]]=None) -> Tuple[List[ScheduleItem], Dict[Variable, int]]:
@@ -393,8 +523,13 @@ def create_schedule_with_vars(outs:List[LazyBuffer], seen:Optional[Set[LazyBuffe
   schedule: List[ScheduleItem] = []
   var_vals: Dict[Variable, int] = {}
   kernel_number = GlobalCounters.kernel_count
+  hfuse_dims: Dict[LBScheduleItem, Optional[Tuple[int, int, int]]] = {}
+  unfused = 0
   while queue:
     lsi = queue.popleft()
+    group = _hfuse_group(lsi, queue, hfuse_dims) if FUSE_HORIZONTAL else [lsi]
+    if len(group) > 1: lsi = _hfuse(group, [cast(Tuple[int, int, int], hfuse_dims[x]) for x in group])
+    unfused += len(group)
     for buf in lsi.outputs: seen.add(buf)
     if GRAPH:
       kernel_number += 1
@@ -403,14 +538,15 @@ def create_schedule_with_vars(outs:List[LazyBuffer], seen:Optional[Set[LazyBuffe
     for out in lsi.outputs: del out.srcs  # can only schedule once
     schedule.append(si:=ScheduleItem(lsi.ast, tuple(x.buffer for x in lsi.outputs+lsi.inputs if x.size != 0), lsi.metadata))
     if logops and si.ast.op is UOps.SINK and not any(i.device.startswith("DISK:") for i in si.inputs): logops.write(str(si.ast)+"\n")
-    for x in graph[lsi]:
+    for x in (x for g in group for x in graph[g]):
       in_degree[x] -= 1
       if in_degree[x] == 0: queue.append(x)
 
   # confirm everything was scheduled correctly
-  if any(degree != 0 for degree in in_degree.values()) or len(in_degree) != len(schedule):
-    raise RuntimeError(f"cycle detected in graph, prescheduled {len(in_degree)} but only scheduled {len(schedule)}")
+  if any(degree != 0 for degree in in_degree.values()) or len(in_degree) != unfused:
+    raise RuntimeError(f"cycle detected in graph, prescheduled {len(in_degree)} but only scheduled {unfused}")
   if DEBUG >= 1 and len(schedule) >= 10: print(f"scheduled {len(schedule)} kernels")
+  if DEBUG >= 1 and unfused != len(schedule): print(f"horizontal fusion: {unfused} -> {len(schedule)} kernels")
   return schedule, var_vals
 
 def create_schedule(outs:List[LazyBuffer], seen:Optional[Set[LazyBuffer]]=None) -> List[ScheduleItem]:
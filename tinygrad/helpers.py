@@ -1,6 +1,6 @@
 from __future__ import annotations
 import os, functools, platform, time, re, contextlib, operator, hashlib, pickle, sqlite3, cProfile, pstats, tempfile, pathlib, string, ctypes, sys
-import itertools, urllib.request, subprocess, shutil, math, json, contextvars
+import itertools, urllib.request, subprocess, shutil, math, json, contextvars, atexit, bisect
 from dataclasses import dataclass
 from typing import Dict, Tuple, Union, List, ClassVar, Optional, Iterable, Any, TypeVar, TYPE_CHECKING, Callable, Sequence
 if TYPE_CHECKING:  # TODO: remove this and import TypeGuard from typing once minimum python supported version is 3.10
@@ -107,9 +107,14 @@ DEBUG, IMAGE, BEAM, NOOPT, JIT = ContextVar("DEBUG", 0), ContextVar("IMAGE", 0),
 WINO, THREEFRY, CAPTURING, TRACEMETA = ContextVar("WINO", 0), ContextVar("THREEFRY", 0), ContextVar("CAPTURING", 1), ContextVar("TRACEMETA", 1)
 GRAPH, GRAPHPATH, SAVE_SCHEDULE, RING = ContextVar("GRAPH", 0), getenv("GRAPHPATH", "/tmp/net"), ContextVar("SAVE_SCHEDULE", 0), ContextVar("RING", 1)
 MULTIOUTPUT, PROFILE, PROFILEPATH = ContextVar("MULTIOUTPUT", 1), ContextVar("PROFILE", 0), ContextVar("PROFILEPATH", temp("tinygrad_profile.json"))
+KERNEL_METRICS = ContextVar("KERNEL_METRICS", 0)
 USE_TC, TC_OPT, TRANSCENDENTAL = ContextVar("TC", 1), ContextVar("TC_OPT", 0), ContextVar("TRANSCENDENTAL", 1)
-FUSE_ARANGE, FUSE_CONV_BW = ContextVar("FUSE_ARANGE", 0), ContextVar("FUSE_CONV_BW", 0)
+FUSE_ARANGE, FUSE_CONV_BW, FUSE_HORIZONTAL = ContextVar("FUSE_ARANGE", 0), ContextVar("FUSE_CONV_BW", 0), ContextVar("FUSE_HORIZONTAL", 0)
+FUSE_MULTIREDUCE = ContextVar("FUSE_MULTIREDUCE", 0)
+PARALLEL_CODEGEN = ContextVar("PARALLEL_CODEGEN", 0)
 SPLIT_REDUCEOP, ARANGE_DIFF = ContextVar("SPLIT_REDUCEOP", 1), ContextVar("ARANGE_DIFF", 0)
+UOP_INTERN, CONV_ALGO = ContextVar("UOP_INTERN", 0), ContextVar("CONV_ALGO", "")
+ALLREDUCE, ALLREDUCE_GROUP, DEFER_ALLREDUCE = ContextVar("ALLREDUCE", ""), ContextVar("ALLREDUCE_GROUP", 0), ContextVar("DEFER_ALLREDUCE", 0)
 
 @dataclass(frozen=True)
 class Metadata:
@@ -132,6 +137,64 @@ class GlobalCounters:
   @staticmethod
   def reset(): GlobalCounters.global_ops, GlobalCounters.global_mem, GlobalCounters.time_sum_s, GlobalCounters.kernel_count = 0,0,0.0,0
 
+class Metrics:
+  """
+  Registry of runtime metrics, each a name with labels. `inc` counts, `add`/`set`/`peak` move gauges and `observe` fills a histogram.
+
+  `snapshot` flattens everything with Prometheus names, which `diff`, `prometheus` and `json` work on.
+  """
+  buckets: ClassVar[Tuple[float, ...]] = tuple(10.0**(e/2) for e in range(-12, 3))  # 1 us to 10 s
+  global_counters: ClassVar[Tuple[str, ...]] = ("global_ops", "global_mem", "time_sum_s", "kernel_count", "mem_used")
+  def __init__(self, prefix:str="tinygrad_"):
+    self.prefix = prefix
+    self.reset()
+  def reset(self):
+    self.types: Dict[str, str] = {}
+    self.values: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], float] = {}
+    self.hists: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], List[float]] = {}  # bucket counts with +Inf last, then sum and count
+  def _key(self, typ:str, name:str, labels:Dict[str, Any]):
+    self.types.setdefault(name, typ)
+    return (name, tuple(sorted(labels.items())))
+  def inc(self, name:str, value:float=1, **labels):
+    k = self._key("counter", name, labels)
+    self.values[k] = self.values.get(k, 0) + value
+  def add(self, name:str, value:float, **labels):
+    k = self._key("gauge", name, labels)
+    self.values[k] = self.values.get(k, 0) + value
+  def set(self, name:str, value:float, **labels): self.values[self._key("gauge", name, labels)] = value
+  def peak(self, name:str, value:float, **labels):
+    k = self._key("gauge", name, labels)
+    self.values[k] = max(self.values.get(k, value), value)
+  def get(self, name:str, **labels) -> float: return self.values.get((name, tuple(sorted(labels.items()))), 0)
+  def observe(self, name:str, value:float, **labels):
+    if (h:=self.hists.get(k:=self._key("histogram", name, labels))) is None: h = self.hists[k] = [0]*(len(self.buckets)+3)
+    h[bisect.bisect_left(self.buckets, value)] += 1
+    h[-2], h[-1] = h[-2]+value, h[-1]+1
+
+  def snapshot(self) -> Dict[str, float]:
+    """All metrics as {'name{label="value"}': value}, histograms as cumulative buckets, sum and count, plus the GlobalCounters."""
+    def fmt(name:str, labels) -> str: return self.prefix+name+("{"+",".join(f'{k}="{v}"' for k,v in labels)+"}" if labels else "")
+    ret = {fmt(name, labels):v for (name, labels),v in self.values.items()}
+    for (name, labels),h in self.hists.items():
+      for b,cnt in zip([f"{b:g}" for b in self.buckets]+["+Inf"], itertools.accumulate(h[:-2])): ret[fmt(name+"_bucket", labels+(("le", b),))] = cnt
+      ret[fmt(name+"_sum", labels)], ret[fmt(name+"_count", labels)] = h[-2], h[-1]
+    ret.update({fmt(k, ()):getattr(GlobalCounters, k) for k in self.global_counters})
+    return ret
+  @staticmethod
+  def diff(before:Dict[str, float], after:Dict[str, float]) -> Dict[str, float]:
+    """What changed between two snapshots."""
+    return {k:v-before.get(k, 0) for k,v in after.items() if v != before.get(k, 0)}
+  def prometheus(self, snapshot:Optional[Dict[str, float]]=None) -> str:
+    """The Prometheus text exposition format of a snapshot, the current one by default."""
+    snapshot, lines = self.snapshot() if snapshot is None else snapshot, []
+    for name,typ in {**self.types, **{k:"gauge" for k in self.global_counters}}.items():
+      series = [f"{k} {v:g}" for k,v in snapshot.items() if k.split("{")[0] in {self.prefix+name+x for x in ("", "_bucket", "_sum", "_count")}]
+      if series: lines += [f"# TYPE {self.prefix}{name} {typ}"] + series
+    return "\n".join(lines) + "\n"
+  def json(self, snapshot:Optional[Dict[str, float]]=None) -> str: return json.dumps(self.snapshot() if snapshot is None else snapshot)
+
+METRICS = Metrics()
+
 # **************** timer and profiler ****************
 
 class Timing(contextlib.ContextDecorator):
@@ -198,6 +261,49 @@ class ProfileLogger:
       with open(PROFILEPATH.value, "w") as f: f.write(json.dumps({"traceEvents": self.mjson}))
       print(f"Saved profile to {PROFILEPATH.value}. Use https://ui.perfetto.dev/ to open it.")
 
+# *** host side profiling, works on every backend ***
+
+_host_profile_logger: Optional[ProfileLogger] = None
+# (kind, name) -> [calls, total us, ops, bytes, metadata]
+host_profile_stats: Dict[Tuple[str, str], List] = {}
+
+def _host_profile_finalize():
+  global _host_profile_logger
+  print_host_profile()
+  _host_profile_logger = None  # the last ProfileLogger to go writes PROFILEPATH
+
+@contextlib.contextmanager
+def cpu_profile(name:str, actor:str="HOST", subactor:str="python", metadata:str="", ops:int=0, mem:int=0):
+  """Records the time spent in the block as a span in the PROFILE=1 trace and in the per op summary. Yields a dict to rename the span."""
+  global _host_profile_logger
+  if not PROFILE:
+    yield None
+    return
+  ev, st = {"name": name}, time.perf_counter_ns()
+  try: yield ev
+  finally:
+    et = time.perf_counter_ns()
+    if _host_profile_logger is None:
+      atexit.register(_host_profile_finalize)
+      _host_profile_logger = ProfileLogger()
+    args: Dict[str, Any] = {"metadata": metadata} if metadata else {}
+    if ops: args["GFLOPS"] = lambda dur: f"{ops/(dur*1e3):.2f}"
+    if mem: args["GB/s"] = lambda dur: f"{mem/(dur*1e3):.2f}"
+    _host_profile_logger.add_event(ev["name"], st/1e3, et/1e3, actor, subactor, args)
+    stat = host_profile_stats.setdefault((subactor, ev["name"]), [0, 0.0, 0, 0, {}])
+    stat[0], stat[1], stat[2], stat[3] = stat[0]+1, stat[1]+(et-st)/1e3, stat[2]+ops, stat[3]+mem
+    if metadata: stat[4][metadata] = None
+
+def print_host_profile(top:Optional[int]=None):
+  """Prints the spans recorded by cpu_profile grouped by kind and name, the most expensive first. `top` defaults to PROFILE_TOP (30)."""
+  if not host_profile_stats: return
+  if top is None: top = getenv("PROFILE_TOP", 30)
+  total = sum(x[1] for x in host_profile_stats.values())
+  print(f"{'kind':10s} {'name':40s} {'calls':>6s} {'total ms':>10s} {'%':>6s} {'avg us':>10s} {'GFLOPS':>9s} {'GB/s':>8s}  metadata")
+  for (kind, name), (cnt, tm, ops, mem, meta) in sorted(host_profile_stats.items(), key=lambda x: -x[1][1])[:top]:
+    perf = f"{ops/(tm*1e3):9.2f} {mem/(tm*1e3):8.2f}" if ops or mem else " "*18
+    print(f"{kind:10s} {name[:40]:40s} {cnt:6d} {tm/1e3:10.2f} {tm/total*100:5.1f}% {tm/cnt:10.2f} {perf}  {', '.join(list(meta)[:4])}")
+
 # *** universal database cache ***
 
 _cache_dir: str = getenv("XDG_CACHE_HOME", os.path.expanduser("~/Library/Caches" if OSX else "~/.cache"))
@@ -290,6 +396,17 @@ def cpu_objdump(lib):
     pathlib.Path(f.name).write_bytes(lib)
     print(subprocess.check_output(['objdump', '-d', f.name]).decode('utf-8'))
 
+@functools.lru_cache(None)
+def cpu_vector_bytes() -> int:
+  # width of the host's widest vector registers: 64 with AVX-512, 32 with AVX/AVX2, else 16 (SSE, NEON)
+  if (ret:=getenv("CPU_VECTOR_BYTES")): return ret
+  if platform.machine().lower() not in {"x86_64", "amd64"}: return 16
+  try:
+    if OSX: flags = subprocess.check_output(["sysctl", "-n", "machdep.cpu.features", "machdep.cpu.leaf7_features"]).decode().lower().split()
+    else: flags = next(l for l in pathlib.Path("/proc/cpuinfo").read_text().splitlines() if l.startswith("flags")).split()
+  except (OSError, subprocess.CalledProcessError, StopIteration): return 16
+  return 64 if "avx512f" in flags else 32 if "avx" in flags or "avx1.0" in flags else 16
+
 # *** ctypes helpers
 
 # TODO: make this work with read only memoryviews (if possible)
@@ -1,29 +1,30 @@
 from __future__ import annotations
-from typing import Optional, Union, Any, Tuple, List, Dict
-import functools, itertools, operator
-from tinygrad.helpers import all_same, all_int, dedup, prod, DEBUG, RING, getenv
-from tinygrad.dtype import DType, ConstType
+from typing import Optional, Union, Any, Tuple, List, Dict, Callable, cast
+import functools, itertools, operator, math
+from tinygrad.helpers import all_same, all_int, dedup, prod, DEBUG, RING, ALLREDUCE, ALLREDUCE_GROUP, DEFER_ALLREDUCE, getenv, diskcache_get
+from tinygrad.helpers import _METADATA, Metadata
+from tinygrad.dtype import DType, ConstType, dtypes
 from tinygrad.ops import BinaryOps, MetaOps, UnaryOps, TernaryOps, ReduceOps
 from tinygrad.lazy import LazyBuffer
 from tinygrad.shape.shapetracker import sint
 
-def all_reduce(op: ReduceOps, lbs: List[LazyBuffer]) -> List[LazyBuffer]:
-  assert all_int(lbs[0].shape), f"does not support symbolic shape {lbs[0].shape}"
-  assert all_same([lb.shape[0] for lb in lbs]), "allreduce with uneven shards is undefined"
-  bop = {ReduceOps.SUM:BinaryOps.ADD, ReduceOps.MAX:BinaryOps.MAX}[op]
-
-  n_lbs, dim = len(lbs), prod(lbs[0].shape)
-  # Ring allreduce doesn't provide a benefit with only 2 nodes or where number of elements is less than 256k (empirically)
-  # so just fallback to naive allreduce to save on kernel dispatch, chunking and reassembling chunks.
-  use_ring = (RING >= 2 or (n_lbs > 2 and dim > getenv("RING_ALLREDUCE_THRESHOLD", 256_000) and RING >= 1))
-  if DEBUG >= 2: print(f"{'RING ALLREDUCE' if use_ring else 'NAIVE ALLREDUCE'} {n_lbs}x{dim} | {lbs[0].dtype}")
-  if not use_ring:
-    return [functools.reduce(lambda x,y: x.e(bop, y), [x.copy_to_device(lb.device) for x in lbs]) for lb in lbs]
+def _chunks(dim:int, n_lbs:int) -> List[Tuple[int, int]]:
   factor = max(f for f in [32, 16, 8, 4, 2, 1] if dim % f == 0)
   base, left = (dim // factor) // n_lbs, (dim // factor) % n_lbs
   c_lens = [(base + 1) * factor if i < left else base * factor for i in range(n_lbs)]
   acc = 0
-  chunks = [(acc, (acc := acc + i)) for i in c_lens if i > 0]
+  return [(acc, (acc := acc + i)) for i in c_lens if i > 0]
+
+def _assemble(chunked:List[List[LazyBuffer]], chunks:List[Tuple[int, int]], shape:Tuple[sint, ...]) -> List[LazyBuffer]:
+  pads = [((s,prod(shape)-e),) for s,e in chunks]
+  return [functools.reduce(lambda x,y: x.e(BinaryOps.ADD, y), [c.pad(pads[i]) for i,c in enumerate(lb_c)]).reshape(shape) for lb_c in chunked]
+
+def naive_all_reduce(bop:BinaryOps, lbs:List[LazyBuffer]) -> List[LazyBuffer]:
+  return [functools.reduce(lambda x,y: x.e(bop, y), [x.copy_to_device(lb.device) for x in lbs]) for lb in lbs]
+
+def ring_all_reduce(bop:BinaryOps, lbs:List[LazyBuffer]) -> List[LazyBuffer]:
+  n_lbs, dim = len(lbs), cast(int, prod(lbs[0].shape))
+  chunks = _chunks(dim, n_lbs)
   chunked = [[lb.reshape((dim,)).shrink(((s,e),)) for s,e in chunks] for lb in lbs]
 
   # Scatter-reduce step
@@ -39,18 +40,124 @@ def all_reduce(op: ReduceOps, lbs: List[LazyBuffer]) -> List[LazyBuffer]:
       chunked[r][i] = chunked[s][i].copy_to_device(chunked[r][i].device, force=True)
 
   # Assemble chunks back
-  pads = [((s,dim-e),) for s,e in chunks]
-  return [functools.reduce(lambda x,y: x.e(BinaryOps.ADD, y), [c.pad(pads[i]) for i,c in enumerate(lb_c)]).reshape(lbs[0].shape) for lb_c in chunked]
+  return _assemble(chunked, chunks, lbs[0].shape)
+
+def tree_all_reduce(bop:BinaryOps, lbs:List[LazyBuffer]) -> List[LazyBuffer]:
+  # reduce up a binary tree to the first device, then broadcast back down it. log2(n) steps, but every step moves the whole buffer
+  lbs, step = list(lbs), 1
+  while step < len(lbs):
+    for i in range(0, len(lbs)-step, 2*step): lbs[i] = lbs[i].e(bop, lbs[i+step].copy_to_device(lbs[i].device, force=True))
+    step *= 2
+  while (step := step // 2) >= 1:
+    for i in range(0, len(lbs)-step, 2*step): lbs[i+step] = lbs[i].copy_to_device(lbs[i+step].device, force=True)
+  return lbs
+
+def halving_doubling_all_reduce(bop:BinaryOps, lbs:List[LazyBuffer]) -> List[LazyBuffer]:
+  n_lbs, dim = len(lbs), cast(int, prod(lbs[0].shape))
+  # recursive halving needs a power of two devices and one chunk per device
+  if n_lbs & (n_lbs-1) != 0 or len(chunks:=_chunks(dim, n_lbs)) != n_lbs: return ring_all_reduce(bop, lbs)
+  chunked = [[lb.reshape((dim,)).shrink(((s,e),)) for s,e in chunks] for lb in lbs]
+  owned = [(0, n_lbs)] * n_lbs
+
+  # Reduce-scatter by recursive halving: exchange half of the owned chunks with the partner at distance d, keep the other half
+  d = n_lbs // 2
+  while d >= 1:
+    owned = [(lo, (lo+hi)//2) if i & d == 0 else ((lo+hi)//2, hi) for i,(lo,hi) in enumerate(owned)]
+    for i in range(n_lbs):
+      for c in range(*owned[i]): chunked[i][c] = chunked[i][c].e(bop, chunked[i^d][c].copy_to_device(lbs[i].device, force=True))
+    d //= 2
+
+  # Allgather by recursive doubling: exchange the owned chunks with the partner at distance d
+  d = 1
+  while d < n_lbs:
+    for i in range(n_lbs):
+      for c in range(*owned[i^d]): chunked[i][c] = chunked[i^d][c].copy_to_device(lbs[i].device, force=True)
+    owned = [(min(owned[i][0], owned[i^d][0]), max(owned[i][1], owned[i^d][1])) for i in range(n_lbs)]
+    d *= 2
+
+  return _assemble(chunked, chunks, lbs[0].shape)
+
+def hierarchical_all_reduce(bop:BinaryOps, lbs:List[LazyBuffer], group_size:int) -> List[LazyBuffer]:
+  # reduce each group of devices onto its first device, all-reduce across those leaders, then broadcast back inside the groups
+  groups = [list(range(i, min(i+group_size, len(lbs)))) for i in range(0, len(lbs), group_size)]
+  leaders = [functools.reduce(lambda x,y: x.e(bop, y), [lbs[i].copy_to_device(lbs[g[0]].device) for i in g]) for g in groups]
+  algo = select_all_reduce(leaders[0].device, len(leaders), leaders[0].size, leaders[0].dtype.itemsize, flat=True)
+  leaders = ALL_REDUCE_ALGORITHMS[algo](bop, leaders)
+  return [leaders[gi].copy_to_device(lbs[i].device, force=True) if i != g[0] else leaders[gi] for gi,g in enumerate(groups) for i in g]
+
+def _hierarchical_group_size(n_lbs:int) -> int:
+  # devices of a group are neighbors in the device list. without ALLREDUCE_GROUP, use the biggest divisor of n_lbs up to sqrt(n_lbs)
+  if ALLREDUCE_GROUP: return ALLREDUCE_GROUP.value
+  return max(g for g in range(1, int(math.sqrt(n_lbs))+1) if n_lbs % g == 0)
+
+ALL_REDUCE_ALGORITHMS: Dict[str, Callable[[BinaryOps, List[LazyBuffer]], List[LazyBuffer]]] = {
+  "naive": naive_all_reduce, "ring": ring_all_reduce, "tree": tree_all_reduce, "halving_doubling": halving_doubling_all_reduce,
+  "hierarchical": lambda bop, lbs: hierarchical_all_reduce(bop, lbs, _hierarchical_group_size(len(lbs)))}
+
+_tuning_tables: Dict[Tuple[str, int], Optional[List[Tuple[int, str]]]] = {}
+def all_reduce_tuning_table(device:str, n_lbs:int) -> Optional[List[Tuple[int, str]]]:
+  """the (max nbytes, algorithm) table written by test/external/external_benchmark_multitensor_allreduce.py for n_lbs devices of this type"""
+  if (key:=(device.split(":")[0], n_lbs)) not in _tuning_tables: _tuning_tables[key] = diskcache_get("allreduce_tuning", {"device":key[0], "n":n_lbs})
+  return _tuning_tables[key]
+
+def select_all_reduce(device:str, n_lbs:int, dim:int, itemsize:int, flat=False) -> str:
+  if ALLREDUCE.value: algo = cast(str, ALLREDUCE.value)
+  elif RING >= 2: algo = "ring"
+  elif RING < 1 or n_lbs <= 2: algo = "naive"
+  elif ALLREDUCE_GROUP and 1 < ALLREDUCE_GROUP.value < n_lbs: algo = "hierarchical"
+  elif (table:=all_reduce_tuning_table(device, n_lbs)) is not None: algo = next((algo for sz, algo in table if dim*itemsize <= sz), table[-1][1])
+  # Ring allreduce doesn't provide a benefit with only 2 nodes or where number of elements is less than 256k (empirically)
+  # so just fallback to naive allreduce to save on kernel dispatch, chunking and reassembling chunks.
+  else: algo = "ring" if dim > getenv("RING_ALLREDUCE_THRESHOLD", 256_000) else "naive"
+  # the group leaders of a hierarchical all-reduce use a flat algorithm
+  return ("naive" if n_lbs <= 2 else "ring") if flat and algo == "hierarchical" else algo
+
+def all_reduce(op: ReduceOps, lbs: List[LazyBuffer]) -> List[LazyBuffer]:
+  assert all_int(lbs[0].shape), f"does not support symbolic shape {lbs[0].shape}"
+  assert all_same([lb.shape[0] for lb in lbs]), "allreduce with uneven shards is undefined"
+  bop = {ReduceOps.SUM:BinaryOps.ADD, ReduceOps.MAX:BinaryOps.MAX}[op]
+  algo = select_all_reduce(lbs[0].device, len(lbs), prod(lbs[0].shape), lbs[0].dtype.itemsize)
+  if DEBUG >= 2: print(f"{algo.upper()} ALLREDUCE {len(lbs)}x{prod(lbs[0].shape)} | {lbs[0].dtype}")
+  return ALL_REDUCE_ALGORITHMS[algo](bop, lbs)
+
+def bucketed_all_reduce(op:ReduceOps, parts:List[List[LazyBuffer]], bucket_size:int) -> List[List[LazyBuffer]]:
+  """all-reduce many tensors over the same devices, packing them into flat buckets of at most bucket_size bytes with one all_reduce each"""
+  assert all(all_int(lbs[0].shape) for lbs in parts), "does not support symbolic shape"
+  # gradients are produced back to front, so fill (and reduce) the buckets in that order
+  buckets: List[List[int]] = []
+  for i in reversed(range(len(parts))):
+    if buckets and parts[(b:=buckets[-1])[0]][0].dtype == parts[i][0].dtype and \
+      sum(parts[j][0].size for j in b+[i]) * parts[i][0].dtype.itemsize <= bucket_size: b.append(i)
+    else: buckets.append([i])
+  ret: Dict[int, List[LazyBuffer]] = {}
+  for bi, bucket in enumerate(buckets):
+    sizes, n_lbs = [parts[i][0].size for i in bucket], len(parts[bucket[0]])
+    offsets, dim = list(itertools.accumulate(sizes, initial=0)), sum(sizes)
+    if DEBUG >= 2: print(f"ALLREDUCE BUCKET {bi}: {len(bucket)} tensors, {dim*parts[bucket[0]][0].dtype.itemsize} bytes on {n_lbs} devices")
+    # tag the bucket so its copies are attributed to it
+    token = _METADATA.set(Metadata(f"allreduce_bucket_{bi}", "", backward=True))
+    flat = [functools.reduce(lambda x,y: x.e(BinaryOps.ADD, y), [parts[i][d].reshape((sz,)).pad(((st, dim-st-sz),))
+                                                               for i,sz,st in zip(bucket, sizes, offsets)]) for d in range(n_lbs)]
+    reduced = all_reduce(op, flat)
+    _METADATA.reset(token)
+    for i,sz,st in zip(bucket, sizes, offsets): ret[i] = [r.shrink(((st, st+sz),)).reshape(lb.shape) for r,lb in zip(reduced, parts[i])]
+  return [ret[i] for i in range(len(parts))]
 
 def to_sharded(lbs:List[LazyBuffer], axis:int, bounds: Tuple[Tuple[int, int], ...]) -> List[LazyBuffer]:
   if DEBUG >= 3 and lbs[0].shape[axis] % len(lbs) != 0: print(f"multi axis uneven: {lbs[0].shape=} {axis=} {len(lbs)=}, bounds={bounds}")
   return [lb.shrink(tuple((0,s) if a != axis else bound for a,s in enumerate(lb.shape))) for i, (bound, lb) in enumerate(zip(bounds, lbs))]
 
+def _exact_cast(src:DType, dst:DType) -> bool:
+  if dtypes.is_float(src): return dtypes.is_float(dst) and dst.itemsize > src.itemsize and dst != dtypes.bfloat16
+  return dtypes.is_int(src) and dtypes.is_int(dst) and dst.itemsize > src.itemsize and (dtypes.is_unsigned(src) or not dtypes.is_unsigned(dst))
+
 class MultiLazyBuffer:
   def __init__(self, lbs:List[LazyBuffer], axis:Optional[int], real:Optional[List[bool]]=None):
     assert all(isinstance(x, LazyBuffer) for x in lbs) and len(lbs), "all lbs must be LazyBuffers, and we need at least one of them"
     assert all_same([x.dtype for x in lbs]), f"all multilazybuffer needs same dtype, getting {[x.dtype for x in lbs]}"
     self.lbs, self.axis, self.dtype, self.device, self.real = lbs, axis, lbs[0].dtype, tuple(x.device for x in lbs), real or [True]*len(lbs)
+    # with DEFER_ALLREDUCE, an all-reduced buffer also keeps its per device parts so the all-reduce can be redone in a bucket
+    self.unreduced: Optional[Tuple[ReduceOps, List[LazyBuffer]]] = None
     if axis is not None:
       splits = list(itertools.accumulate([lb.shape[axis] for lb in lbs], initial=0))
       self.bounds = tuple(zip(splits, splits[1:]))
@@ -66,6 +173,11 @@ class MultiLazyBuffer:
 
   def __repr__(self): return f"<MLB {self.axis=} {self.real=} {chr(10)}{chr(10).join([f'{x.device} {x.st}' for x in self.lbs])}>"
 
+  def _track_unreduced(self, ret:MultiLazyBuffer, fxn:Callable[[LazyBuffer], LazyBuffer]) -> MultiLazyBuffer:
+    # movement ops (pads add zeros) commute with the all-reduce, so they are applied to the parts too
+    if self.unreduced is not None: ret.unreduced = (self.unreduced[0], [fxn(x) for x in self.unreduced[1]])
+    return ret
+
   @staticmethod
   def from_sharded(lb:LazyBuffer, devices:Tuple[str, ...], axis:Optional[int], bounds:Optional[Tuple[Tuple[int, int], ...]]):
     assert (axis is None) == (bounds is None), "must specify bounds iff axis is specified"
@@ -90,7 +202,12 @@ class MultiLazyBuffer:
   # passthroughs
   def is_realized(self) -> bool: return all(lb.base.realized is not None for lb, r in zip(self.lbs, self.real) if r is True)
   def cast(self, dtype:DType, bitcast:bool=False, allow_buffer_view=True):
-    return MultiLazyBuffer([x.cast(dtype, bitcast, allow_buffer_view) for x in self.lbs], self.axis, self.real)
+    ret = MultiLazyBuffer([x.cast(dtype, bitcast, allow_buffer_view) for x in self.lbs], self.axis, self.real)
+    # a sum of casts isn't the cast of a sum (rounding, overflow, truncation, even when widening the all-reduce adds in the narrower dtype)
+    # a max commutes with a cast to a dtype that holds every value of the source exactly, a cast to the same dtype commutes with both
+    if bitcast or self.unreduced is None or (dtype != self.dtype and (self.unreduced[0] is not ReduceOps.MAX or not _exact_cast(self.dtype, dtype))):
+      return ret
+    return self._track_unreduced(ret, lambda x: x.cast(dtype))
   def const(self, val:ConstType) -> MultiLazyBuffer: return MultiLazyBuffer([x.const(val) for x in self.lbs], self.axis, self.real)
   def assign(self, x:MultiLazyBuffer): return MultiLazyBuffer([s.assign(d) for s,d in zip(self.lbs, x.lbs)], self.axis, self.real)
   def contiguous(self): return MultiLazyBuffer([x.contiguous() for x in self.lbs], self.axis, self.real)
@@ -114,13 +231,20 @@ class MultiLazyBuffer:
     new_real_lbs:Dict[int,LazyBuffer] = {i:lsrcs[0].e(op, *lsrcs[1:], arg=arg) for i,(lsrcs,r) in enumerate(zip(zip(*srcs), new_real)) if r}
     # NOTE: const dtype should match real
     real_dtype = next(iter(new_real_lbs.values())).dtype
-    return MultiLazyBuffer([new_real_lbs.get(i, lsrcs[0].const(0).cast(real_dtype)) for i,lsrcs in enumerate(zip(*srcs))], axis, new_real)
+    ret = MultiLazyBuffer([new_real_lbs.get(i, lsrcs[0].const(0).cast(real_dtype)) for i,lsrcs in enumerate(zip(*srcs))], axis, new_real)
+    # the sum of two summed all-reduces is the all-reduce of the summed parts (gradient accumulation)
+    if op is BinaryOps.ADD and all(x.unreduced is not None and x.unreduced[0] is ReduceOps.SUM for x in msrcs):
+      ret.unreduced = (ReduceOps.SUM, [a.e(op, b) for a,b in zip(*[cast(Tuple[ReduceOps, List[LazyBuffer]], x.unreduced)[1] for x in msrcs])])
+    return ret
 
   def r(self, op:ReduceOps, axis:Tuple[int, ...]) -> MultiLazyBuffer:
     if self.axis is not None and self.axis in axis:
       # all-reduce on sharded axes
       reduced_parts = [(x if r else x.const(0)).r(op, axis) for x,r in zip(self.lbs, self.real)]
-      if all(self.real): return MultiLazyBuffer(all_reduce(op, reduced_parts), None)
+      if all(self.real):
+        ret = MultiLazyBuffer(all_reduce(op, reduced_parts), None)
+        if DEFER_ALLREDUCE: ret.unreduced = (op, reduced_parts)
+        return ret
       return MultiLazyBuffer(reduced_parts, None, self.real)
     # reduce on non sharded axes, piecewise is fine. if axis is None this is also correct
     return MultiLazyBuffer([x.r(op, axis) for x in self.lbs], self.axis, self.real)
@@ -131,7 +255,7 @@ class MultiLazyBuffer:
     return tuple(lb.shape[self.axis] if a == self.axis else s for a,s in enumerate(shape))
 
   def reshape(self, arg:Tuple[sint, ...]):
-    if self.axis is None: return MultiLazyBuffer([x.reshape(arg) for x in self.lbs], None, self.real)
+    if self.axis is None: return self._track_unreduced(MultiLazyBuffer([x.reshape(arg) for x in self.lbs], None, self.real), lambda x: x.reshape(arg))
     assert prod(self.shape) == prod(arg), "reshape must maintain prod(shape)"
     arg_acc:List[sint] = list(itertools.accumulate(arg, operator.mul, initial=1))
     # new_axis is the last one that preserves prod(prior to new_axis) and must not move items between shards
@@ -152,16 +276,18 @@ class MultiLazyBuffer:
       assert arg[self.axis] == (sum(lb.shape[self.axis] for i,lb in enumerate(self.lbs) if i < self.real.index(True)), \
                                 sum(lb.shape[self.axis] for i,lb in enumerate(self.lbs) if i > self.real.index(True))), "can only pad to whole axis"
       return MultiLazyBuffer([x if r else x.const(0) for x,r in zip(self.lbs, self.real)], self.axis)
-    return MultiLazyBuffer([x.pad(arg) for x in self.lbs], self.axis, self.real)
+    return self._track_unreduced(MultiLazyBuffer([x.pad(arg) for x in self.lbs], self.axis, self.real), lambda x: x.pad(arg))
 
   def expand(self, arg:Tuple[sint, ...]):
     # NOTE: this assert isn't needed, sharded axis can have dim 1
     assert self.axis is None or arg[self.axis] == self.shape[self.axis], f"expand not supported on sharded axis {arg=}"
-    return MultiLazyBuffer([x.expand(self._shape_to_single_shard(arg, x)) for x in self.lbs], self.axis, self.real)
+    return self._track_unreduced(MultiLazyBuffer([x.expand(self._shape_to_single_shard(arg, x)) for x in self.lbs], self.axis, self.real),
+                                 lambda x: x.expand(arg))
 
   def permute(self, arg:Tuple[int, ...]):
     # all permutes supported!
-    return MultiLazyBuffer([x.permute(arg) for x in self.lbs], arg.index(self.axis) if self.axis is not None else None, self.real)
+    return self._track_unreduced(MultiLazyBuffer([x.permute(arg) for x in self.lbs], arg.index(self.axis) if self.axis is not None else None,
+                                                 self.real), lambda x: x.permute(arg))
 
   def shrink(self, arg:Tuple[Tuple[sint, sint], ...]):
     assert self.axis is None or arg[self.axis] == (0, self.shape[self.axis]) or arg[self.axis] in self.bounds, f"shrinking not supported for {arg=}"
@@ -170,9 +296,9 @@ class MultiLazyBuffer:
       idx = self.bounds.index(arg[self.axis])
       # zero out other lbs to not create lb reference
       return MultiLazyBuffer([lb if i==idx else lb.const(0) for i,lb in enumerate(self.lbs)], self.axis, [i==idx for i in range(len(self.lbs))])
-    return MultiLazyBuffer([x.shrink(tuple((0, x.shape[self.axis]) if a == self.axis else s for a,s in enumerate(arg))) for x in self.lbs],
-                           self.axis, self.real)
+    return self._track_unreduced(MultiLazyBuffer([x.shrink(tuple((0, x.shape[self.axis]) if a == self.axis else s for a,s in enumerate(arg)))
+                                                  for x in self.lbs], self.axis, self.real), lambda x: x.shrink(arg))
 
   def stride(self, arg:Tuple[int, ...]):
     assert self.axis is None or arg[self.axis] == 1, "flipping not supported on sharded axis"
-    return MultiLazyBuffer([x.stride(arg) for x in self.lbs], self.axis, self.real)
+    return self._track_unreduced(MultiLazyBuffer([x.stride(arg) for x in self.lbs], self.axis, self.real), lambda x: x.stride(arg))
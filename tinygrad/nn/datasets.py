@@ -1,8 +1,137 @@
-import gzip
-from tinygrad.tensor import Tensor
-from tinygrad.helpers import fetch
+import gzip, random, traceback, multiprocessing, queue
+import multiprocessing.shared_memory as shared_memory
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple, cast
+import numpy as np
+from tinygrad.tensor import Tensor, _from_np_dtype
+from tinygrad.dtype import dtypes
+from tinygrad.helpers import fetch, prod, round_up
 
 def _fetch_mnist(file, offset): return Tensor(gzip.open(fetch("https://storage.googleapis.com/cvdf-datasets/mnist/"+file)).read()[offset:])
 def mnist():
   return _fetch_mnist("train-images-idx3-ubyte.gz", 0x10).reshape(-1, 1, 28, 28), _fetch_mnist("train-labels-idx1-ubyte.gz", 8), \
          _fetch_mnist("t10k-images-idx3-ubyte.gz", 0x10).reshape(-1, 1, 28, 28), _fetch_mnist("t10k-labels-idx1-ubyte.gz", 8)
+
+def default_collate(samples:List[Any]) -> Tuple[np.ndarray, ...]:
+  """Stacks a list of samples, each an array-like or a tuple of array-likes, into one numpy array per field."""
+  if not isinstance(samples[0], tuple): return (np.stack([np.asarray(s) for s in samples]),)
+  return tuple(np.stack([np.asarray(s[i]) for s in samples]) for i in range(len(samples[0])))
+
+def _loader_worker(dataset, collate_fn:Callable, name:str, slot_nbytes:int, layout, q_in, q_out, seed:Optional[int]):
+  shm = shared_memory.SharedMemory(name=name)
+  mem = cast(memoryview, shm.buf)
+  while (task := q_in.get()) is not None:
+    slot, batch, indices = task
+    try:
+      # reseed for deterministic augmentations in collate_fn
+      if seed is not None:
+        random.seed(seed * 2**20 + batch)
+        np.random.seed((seed * 2**20 + batch) % 2**32)
+      out = collate_fn([dataset[i] for i in indices])
+      for x,(off,shape,dtype) in zip(out if isinstance(out, tuple) else (out,), layout):
+        x = np.ascontiguousarray(x, dtype=dtype)
+        assert x.shape[1:] == shape[1:] and x.shape[0] <= shape[0], f"collate_fn returned shape {x.shape}, expected {shape}"
+        mem[(st:=slot*slot_nbytes+off):st+x.nbytes] = x.reshape(-1).view(np.uint8).data
+      q_out.put((slot, batch, None))
+    except Exception: q_out.put((slot, batch, traceback.format_exc()))
+  del mem
+  shm.close()
+
+class DataLoader:
+  """
+  Iterates over batches of a map-style `dataset`, any object with `__len__` and `__getitem__`, as tuples of Tensors on `device`.
+
+  `collate_fn` turns a list of samples into a tuple of numpy arrays with the batch on axis 0.
+  `num_workers` processes run it ahead of the consumer and write the batches into a ring of `prefetch` shared memory `disk:shm:` slots.
+  Only indices and slot numbers go through the queues. With `num_workers=0` batches are collated in the calling process.
+  Every iteration is one epoch. With `shuffle` the order is drawn from `seed` and the epoch number, so runs with the same seed match.
+
+  ```python
+  for X, Y in DataLoader(dataset, batch_size=64, shuffle=True, seed=42): loss = model(X).sparse_categorical_crossentropy(Y)
+  ```
+  """
+  def __init__(self, dataset:Any, batch_size:int, collate_fn:Callable[[List[Any]], Any]=default_collate, shuffle:bool=False,
+               seed:Optional[int]=None, num_workers:int=4, prefetch:Optional[int]=None, drop_last:bool=False, device:Optional[str]=None):
+    self.dataset, self.batch_size, self.collate_fn, self.shuffle, self.seed = dataset, batch_size, collate_fn, shuffle, seed
+    self.num_workers, self.prefetch, self.drop_last, self.device = num_workers, prefetch or 2*max(num_workers, 1), drop_last, device
+    self.epoch, self.batches_sent = 0, 0
+    self.procs: List[multiprocessing.process.BaseProcess] = []
+
+  def __len__(self) -> int: return len(self.dataset) // self.batch_size if self.drop_last else -(-len(self.dataset) // self.batch_size)
+
+  def _batches(self) -> List[Sequence[int]]:
+    order = list(range(len(self.dataset)))
+    if self.shuffle: random.Random(None if self.seed is None else self.seed * 2**20 + self.epoch).shuffle(order)
+    return [order[i*self.batch_size:(i+1)*self.batch_size] for i in range(len(self))]
+
+  def _start(self):
+    # the first batch fixes the dtype and per sample shape of every field
+    probe = self.collate_fn([self.dataset[i] for i in range(min(self.batch_size, len(self.dataset)))])
+    self.single = not isinstance(probe, tuple)
+    self.layout, self.slot_nbytes = [], 0
+    for x in (probe,) if self.single else probe:
+      x = np.asarray(x)
+      self.layout.append((self.slot_nbytes, (self.batch_size,)+x.shape[1:], x.dtype))
+      self.slot_nbytes = round_up(self.slot_nbytes + self.batch_size*prod(x.shape[1:])*x.dtype.itemsize, 64)
+    self.shm = shared_memory.SharedMemory(create=True, size=max(1, self.prefetch*self.slot_nbytes))
+    self.mem = Tensor.empty(self.shm.size, dtype=dtypes.uint8, device=f"disk:shm:{self.shm.name}")
+    ctx = multiprocessing.get_context()
+    self.q_in, self.q_out = ctx.Queue(), ctx.Queue()
+    args = (self.dataset, self.collate_fn, self.shm.name, self.slot_nbytes, self.layout, self.q_in, self.q_out, self.seed)
+    self.procs = [ctx.Process(target=_loader_worker, args=args, daemon=True) for _ in range(self.num_workers)]
+    for p in self.procs: p.start()
+
+  def _read_slot(self, slot:int, n:int) -> Tuple[Tensor, ...]:
+    ret = []
+    for off,shape,dtype in self.layout:
+      st, sz = slot*self.slot_nbytes+off, n*prod(shape[1:])*dtype.itemsize
+      ret.append(self.mem[st:st+sz].bitcast(_from_np_dtype(dtype)).reshape(n, *shape[1:]).to(self.device).realize())
+    return tuple(ret)
+
+  def _recv(self) -> Tuple[int, int, Optional[str]]:
+    # a worker killed mid batch never answers, so poll and check that they are all still running
+    while True:
+      try: return self.q_out.get(timeout=1.0)
+      except queue.Empty:
+        if dead:=[p for p in self.procs if not p.is_alive()]:
+          for p in self.procs: p.terminate()
+          self.close()
+          raise RuntimeError(f"DataLoader worker exited unexpectedly with code {dead[0].exitcode}")
+
+  def __iter__(self) -> Iterator:
+    batches, self.epoch = self._batches(), self.epoch+1
+    if self.num_workers == 0:
+      for b in batches:
+        out = self.collate_fn([self.dataset[i] for i in b])
+        yield tuple(Tensor(np.asarray(x), device=self.device) for x in out) if isinstance(out, tuple) else Tensor(np.asarray(out), device=self.device)
+      return
+    if not self.procs: self._start()
+    base, free, ready, sent, received = self.batches_sent, list(range(self.prefetch)), {}, 0, 0
+    try:
+      for i in range(len(batches)):
+        while free and sent < len(batches):
+          self.q_in.put((free.pop(), base+sent, batches[sent]))
+          sent += 1
+        while i not in ready:
+          slot, batch, err = self._recv()
+          received += 1
+          if err is not None: raise RuntimeError(f"DataLoader worker failed on batch {batch-base}:\n{err}")
+          ready[batch-base] = slot
+        ret = self._read_slot(slot:=ready.pop(i), len(batches[i]))
+        free.append(slot)
+        yield ret[0] if self.single else ret
+    finally:
+      # an abandoned epoch still has batches in flight, they have to land before their slots are reused
+      while received < sent and self.procs:
+        self._recv()
+        received += 1
+      self.batches_sent += sent
+
+  def close(self):
+    """Stops the worker processes and frees the shared memory."""
+    if not self.procs: return
+    for _ in self.procs: self.q_in.put(None)
+    for p in self.procs: p.join()
+    self.procs = []
+    self.shm.close()
+    self.shm.unlink()
+  def __del__(self): self.close()
@@ -0,0 +1,121 @@
+from __future__ import annotations
+import os, mmap, time, functools, multiprocessing, _posixshmem
+import multiprocessing.shared_memory as shared_memory
+from typing import List, Callable, Any
+from tinygrad.tensor import Tensor
+from tinygrad.device import Device
+from tinygrad.dtype import dtypes, DType
+from tinygrad.ops import ReduceOps
+from tinygrad.helpers import getenv, DEBUG
+from tinygrad.shape.symbolic import sint
+
+CTRL_STRIDE = 64  # every rank owns one cache line of barrier counter at the start of the segment
+
+class ProcessGroup:
+  """
+  A group of `world_size` processes on one host that exchange tensors through a POSIX shared memory segment.
+
+  The segment starts with one barrier counter per rank, followed by a send slot per rank and one result slot of `slot_size` bytes each.
+  Tensors move in and out of it as `disk:shm:` tensors. Collectives realize their input and return a realized tensor on the input's device.
+
+  ```python
+  def train(pg:ProcessGroup): print(pg.rank, pg.all_reduce(Tensor([pg.rank])).item())
+  launch(train, 2)
+  ```
+  """
+  def __init__(self, rank:int, world_size:int, name:str, slot_size:int, timeout:float=getenv("PG_TIMEOUT", 300.0)):
+    assert 0 <= rank < world_size, f"rank {rank} out of range for world size {world_size}"
+    self.rank, self.world_size, self.name, self.slot_size, self.timeout, self.gen = rank, world_size, name, slot_size, timeout, 0
+    fd = _posixshmem.shm_open("/"+name.lstrip("/"), os.O_RDWR, 0o600)
+    self.ctrl = memoryview(mmap.mmap(fd, world_size*CTRL_STRIDE, mmap.MAP_SHARED)).cast("q")
+    os.close(fd)
+    self.shm = Tensor.empty(ProcessGroup.nbytes(world_size, slot_size), dtype=dtypes.uint8, device=f"disk:shm:{name}")
+
+  @staticmethod
+  def nbytes(world_size:int, slot_size:int) -> int: return world_size*CTRL_STRIDE + (world_size+1)*slot_size
+
+  def _slot(self, slot:int, offset:sint, dtype:DType, numel:sint) -> Tensor:
+    # slot world_size is the result slot
+    start = self.world_size*CTRL_STRIDE + slot*self.slot_size + offset*dtype.itemsize
+    return self.shm[start:start+numel*dtype.itemsize].bitcast(dtype)
+
+  def _pieces(self, t:Tensor) -> List[Tensor]:
+    flat, per_slot = t.flatten().realize(), self.slot_size // t.dtype.itemsize
+    return [flat[i:min(i+per_slot, flat.numel())] for i in range(0, flat.numel(), per_slot)]
+
+  def barrier(self):
+    """Blocks until every rank in the group has reached the barrier."""
+    self.gen += 1
+    self.ctrl[self.rank*CTRL_STRIDE//8] = self.gen
+    st = time.perf_counter()
+    while any(self.ctrl[r*CTRL_STRIDE//8] < self.gen for r in range(self.world_size)):
+      if time.perf_counter() - st > self.timeout: raise RuntimeError(f"rank {self.rank} timed out in barrier {self.gen} after {self.timeout} s")
+      time.sleep(0)
+
+  def all_reduce(self, t:Tensor, op:ReduceOps=ReduceOps.SUM) -> Tensor:
+    """
+    Reduces `t` over all ranks with `op` (SUM or MAX) and returns the result on every rank.
+
+    Tensors larger than `slot_size` are reduced piece by piece. Each piece is a reduce-scatter followed by an all-gather:
+    every rank reduces its own chunk of all send slots into the result slot, then reads the whole result.
+    """
+    assert op in {ReduceOps.SUM, ReduceOps.MAX}, f"all_reduce doesn't support {op}"
+    bop: Callable[[Tensor, Tensor], Tensor] = (lambda x,y: x+y) if op is ReduceOps.SUM else Tensor.maximum
+    ret = []
+    for piece in self._pieces(t):
+      self._slot(self.rank, 0, t.dtype, n:=piece.numel()).assign(piece)
+      self.barrier()
+      chunk = -(-n // self.world_size)
+      if (sz:=min(n, (self.rank+1)*chunk) - (lo:=min(n, self.rank*chunk))) > 0:
+        parts = [self._slot(r, lo, t.dtype, sz).to(t.device) for r in range(self.world_size)]
+        self._slot(self.world_size, lo, t.dtype, sz).assign(functools.reduce(bop, parts))
+      self.barrier()
+      ret.append(self._slot(self.world_size, 0, t.dtype, n).to(t.device).realize())
+      self.barrier()
+    if DEBUG >= 2: print(f"rank {self.rank}: all_reduce {op} of {t.nbytes()} bytes in {len(ret)} pieces")
+    return (ret[0].cat(*ret[1:]) if ret else t).reshape(t.shape).realize()
+
+  def broadcast(self, t:Tensor, root:int=0) -> Tensor:
+    """Returns the value of `t` on rank `root` on every rank. `t` must have the same shape and dtype on all ranks."""
+    ret = []
+    for piece in self._pieces(t):
+      if self.rank == root: self._slot(self.world_size, 0, t.dtype, piece.numel()).assign(piece)
+      self.barrier()
+      ret.append(piece if self.rank == root else self._slot(self.world_size, 0, t.dtype, piece.numel()).to(t.device).realize())
+      self.barrier()
+    return (ret[0].cat(*ret[1:]) if ret else t).reshape(t.shape).realize()
+
+  def all_gather(self, t:Tensor, dim:int=0) -> Tensor:
+    """Concatenates `t` from every rank along `dim`, in rank order. `t` must fit in one slot."""
+    assert t.nbytes() <= self.slot_size, f"all_gather of {t.nbytes()} bytes doesn't fit in slot of {self.slot_size} bytes"
+    self._slot(self.rank, 0, t.dtype, t.numel()).assign(t.flatten().realize())
+    self.barrier()
+    parts = [t if r == self.rank else self._slot(r, 0, t.dtype, t.numel()).to(t.device).reshape(t.shape) for r in range(self.world_size)]
+    ret = parts[0].cat(*parts[1:], dim=dim).realize()
+    self.barrier()
+    return ret
+
+def _worker(fxn:Callable[..., Any], rank:int, world_size:int, name:str, slot_size:int, args):
+  # this process was spawned, so it may open devices. the pid keeps processes it forks from inheriting that
+  Device.spawned_pid = os.getpid()
+  fxn(ProcessGroup(rank, world_size, name, slot_size), *args)
+
+def launch(fxn:Callable[..., Any], world_size:int, *args, slot_size:int=getenv("PG_SLOT_SIZE", 64*2**20)):
+  """
+  Runs `fxn(pg, *args)` in `world_size` spawned processes that share one ProcessGroup, and waits for them to finish.
+
+  `fxn` must be importable from the spawned processes. If any rank fails, the others are terminated and a RuntimeError is raised.
+  """
+  shm = shared_memory.SharedMemory(create=True, size=ProcessGroup.nbytes(world_size, slot_size))
+  try:
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_worker, args=(fxn, rank, world_size, shm.name, slot_size, args)) for rank in range(world_size)]
+    for p in procs: p.start()
+    while (alive:=[p for p in procs if p.is_alive()]) and all(p.exitcode in {None, 0} for p in procs): alive[0].join(0.1)
+    for p in procs:
+      p.terminate()
+      p.join()
+    if failed:=[f"rank {rank} exited with {p.exitcode}" for rank,p in enumerate(procs) if p.exitcode != 0]: raise RuntimeError(", ".join(failed))
+  finally:
+    shm.close()
+    shm.unlink()
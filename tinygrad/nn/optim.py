@@ -1,8 +1,10 @@
 # sorted in order of increasing complexity
-from typing import List
-from tinygrad.helpers import dedup, flatten, getenv
+from typing import List, Dict, Tuple
+from tinygrad.helpers import dedup, flatten, getenv, Context
 from tinygrad.tensor import Tensor
 from tinygrad.dtype import dtypes, least_upper_dtype
+from tinygrad.ops import ReduceOps
+from tinygrad.multi import MultiLazyBuffer, bucketed_all_reduce
 
 class Optimizer:
   """
@@ -53,6 +55,24 @@ class OptimizerGroup(Optimizer):
   def zero_grad(self): [o.zero_grad() for o in self.optimizers]
   def _step(self) -> List[Tensor]: return [x for o in self.optimizers for x in o._step()]
 
+def data_parallel_backward(loss:Tensor, params:List[Tensor], bucket_size:int=getenv("ALLREDUCE_BUCKET_SIZE", 25*2**20)) -> Tensor:
+  """
+  Runs `loss.backward()` and all-reduces the data parallel gradients of `params` in flat buckets of at most `bucket_size` bytes,
+  with one all-reduce per bucket instead of one per gradient.
+
+  Buckets are filled from the last parameter to the first, in the order the backward pass produces the gradients,
+  so the reduction of a bucket only depends on the kernels that computed it.
+  """
+  with Context(DEFER_ALLREDUCE=1): loss.backward()
+  groups: Dict[Tuple[ReduceOps, Tuple[str, ...]], List[Tensor]] = {}
+  for t in params:
+    if t.grad is not None and isinstance(mlb:=t.grad.lazydata, MultiLazyBuffer) and mlb.unreduced is not None:
+      groups.setdefault((mlb.unreduced[0], mlb.device), []).append(t)
+  for (op, device), ts in groups.items():
+    reduced = bucketed_all_reduce(op, [t.grad.lazydata.unreduced[1] for t in ts], bucket_size) # type: ignore
+    for t,lbs in zip(ts, reduced): t.grad = Tensor(MultiLazyBuffer(lbs, None), device=device, requires_grad=False)
+  return loss
+
 # LARS is essentially just trust ratio to SGD so if we just set the trust coeff 0.0 its just standard SGD.
 def SGD(params: List[Tensor], lr=0.001, momentum=0.0, weight_decay=0.0, nesterov=False, classic=False):
   """
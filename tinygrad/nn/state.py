@@ -1,9 +1,12 @@
-import os, json, pathlib, zipfile, pickle, tarfile, struct
-from typing import Dict, Union, List, Optional, Any, Tuple
+import os, json, pathlib, zipfile, pickle, tarfile, struct, threading, queue
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Union, List, Optional, Any, Tuple, Callable, cast
 from tinygrad.tensor import Tensor
 from tinygrad.dtype import dtypes
-from tinygrad.helpers import prod, argsort, DEBUG, Timing, CI, unwrap, GlobalCounters, tqdm
-from tinygrad.shape.view import strides_for_shape
+from tinygrad.device import Device, Buffer
+from tinygrad.helpers import prod, DEBUG, Timing, CI, unwrap, GlobalCounters, tqdm, round_up
+from tinygrad.shape.shapetracker import ShapeTracker
+from tinygrad.shape.view import View, strides_for_shape
 from tinygrad.multi import MultiLazyBuffer
 
 safe_dtypes = {"BOOL":dtypes.bool, "I8":dtypes.int8, "U8":dtypes.uint8, "I16":dtypes.int16, "U16":dtypes.uint16, "I32":dtypes.int, "U32":dtypes.uint,
@@ -35,10 +38,16 @@ def safe_load(fn:Union[Tensor,str]) -> Dict[str, Tensor]:
     ret[k] = t[8+json_len+v['data_offsets'][0]:8+json_len+v['data_offsets'][0]+sz].bitcast(dtype).reshape(v['shape'])
   return ret
 
-def safe_save(tensors:Dict[str, Tensor], fn:str, metadata:Optional[Dict[str, Any]]=None):
+def safe_save(tensors:Dict[str, Tensor], fn:str, metadata:Optional[Dict[str, Any]]=None, background=False, workers:int=4,
+              chunk_size:int=16<<20) -> Optional[Future]:
   """
   Saves a state_dict to disk in a .safetensor file with optional metadata.
 
+  Tensors are realized and copied out one at a time into `chunk_size` byte host buffers, and a pool of `workers` threads writes them
+  at chunk aligned offsets of the file. At most `2*workers` chunks are in flight, so memory use doesn't grow with the state_dict.
+  With `background=True` every tensor is snapshotted to host memory before returning a `Future` that completes once the file is written,
+  so training can keep updating the weights in the meantime.
+
   ```python
   t = Tensor([1, 2, 3])
   nn.state.safe_save({'t':t}, "test.safetensor")
@@ -52,10 +61,68 @@ def safe_save(tensors:Dict[str, Tensor], fn:str, metadata:Optional[Dict[str, Any
   j = json.dumps(headers, separators=(',', ':'))
   j += "\x20"*((8-len(j)%8)%8)
   pathlib.Path(fn).unlink(missing_ok=True)
-  t = Tensor.empty(8+len(j)+offset, dtype=dtypes.uint8, device=f"disk:{fn}")
-  t[0:8].bitcast(dtypes.int64).assign([len(j)])
-  t[8:8+len(j)].assign(list(j.encode('utf-8')))
-  for k,v in safe_load(t).items(): v.assign(tensors[k])
+  fd = os.open(fn, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+  pool, writes = ThreadPoolExecutor(workers, thread_name_prefix="safe_save"), []
+  try:
+    os.ftruncate(fd, 8+len(j)+offset)
+
+    free: queue.Queue[bytearray] = queue.Queue()
+    for _ in range(0 if background else 2*workers): free.put(bytearray(chunk_size))
+    def write(chunk:memoryview, pos:int):
+      try:
+        while len(chunk): chunk, pos = chunk[(sz:=os.pwrite(fd, chunk, pos)):], pos+sz
+      finally:
+        if not background: free.put(cast(bytearray, chunk.obj))
+    chunk, pos = memoryview(free.get() if not background else bytearray(chunk_size)), 0
+    def stream(sz:int, copy:Callable[[int, memoryview], None]):
+      # fill the chunk with sz bytes from copy(offset, dest), submitting it every time it's full
+      nonlocal chunk, pos
+      done = 0
+      while done < sz:
+        fill = pos % chunk_size
+        copy(done, chunk[fill:fill+(n:=min(sz-done, chunk_size-fill))])
+        done, pos = done+n, pos+n
+        if pos % chunk_size == 0:
+          writes.append(pool.submit(write, chunk, pos-chunk_size))
+          chunk = memoryview(free.get() if not background else bytearray(chunk_size))
+
+    hdr = struct.pack('<Q', len(j)) + j.encode('utf-8')
+    def copy_hdr(off:int, dest:memoryview): dest[:] = hdr[off:off+len(dest)]
+    stream(len(hdr), copy_hdr)
+    for v in tensors.values():
+      if v.nbytes() == 0: continue
+      if isinstance(v.device, tuple) or v.device.startswith("DISK"): v = v.to(Device.DEFAULT)
+      buf = cast(Buffer, v.contiguous().realize().lazydata.base.realized)
+      staged: List[memoryview] = []
+      def copy_buf(off:int, dest:memoryview):
+        if off == 0 and len(dest) == buf.nbytes: buf.copyout(dest)
+        elif hasattr(buf.allocator, "offset"): buf.view(len(dest), dtypes.uint8, off).ensure_allocated().copyout(dest)
+        else:
+          # this allocator can't make views, so the whole buffer is copied out once and sliced
+          if not staged: staged.append(buf.as_buffer())
+          dest[:] = staged[0][off:off+len(dest)]
+      stream(buf.nbytes, copy_buf)
+    if pos % chunk_size: writes.append(pool.submit(write, chunk[:pos % chunk_size], pos - pos % chunk_size))
+  except BaseException:
+    # nothing may still be writing to fd when it's closed
+    pool.shutdown(wait=True, cancel_futures=True)
+    os.close(fd)
+    raise
+  pool.shutdown(wait=False)
+
+  ret: Future = Future()
+  def finish():
+    try:
+      for w in writes: w.result()
+      ret.set_result(fn)
+    except Exception as e: ret.set_exception(e)
+    finally: os.close(fd)
+  if not background:
+    finish()
+    ret.result()
+    return None
+  threading.Thread(target=finish, daemon=True).start()
+  return ret
 
 # state dict
 
@@ -148,20 +215,14 @@ def torch_load(fn:str) -> Dict[str, Tensor]:
     lens[storage[2]] = storage[4] * storage[1].itemsize
     if storage[2] not in offsets: return None
     byte_offset = offsets[storage[2]]+storage_offset*storage[1].itemsize
-    ret = t[byte_offset:byte_offset+prod(size)*storage[1].itemsize].bitcast(storage[1])
-
-    # 7 lines to deal with permuted tensors. NOTE: this currently requires reading off the disk
-    shape_strides = [(s, st) for s,st in zip(size, stride) if s != 1]
-    permute_indexes = [len(shape_strides)-1-y for y in argsort([x[1] for x in shape_strides])]
-    if tuple(permute_indexes) != tuple(range(len(permute_indexes))):
-      intermediate_shape = tuple([shape_strides[x][0] for x in argsort(permute_indexes)])
-      assert tuple([shape_strides[i][1] for i in argsort(permute_indexes)]) == strides_for_shape(intermediate_shape), "nonpermutable strides"
-      if DEBUG >= 3: print(f"WARNING: this torch load is slow. CLANG to permute {intermediate_shape} with {permute_indexes}")
-      assert storage[1] != dtypes.bfloat16, "can't CLANG permute BF16"
-      # TODO: find a nice way to support all shapetracker on disktensors
-      ret = ret.clang().reshape(intermediate_shape).permute(permute_indexes)
+    if prod(size) == 0 or all(s == 1 or st == cst for s,st,cst in zip(size, stride, strides_for_shape(size))):
+      return t[byte_offset:byte_offset+prod(size)*storage[1].itemsize].bitcast(storage[1]).reshape(size)
 
-    return ret.reshape(size)
+    # permuted or otherwise strided, the span of storage it covers is copied to the device as is and viewed with the strides there
+    span = 1 + sum((s-1)*st for s,st in zip(size, stride))
+    if DEBUG >= 3: print(f"strided torch load of {size} with strides {stride} on {Device.DEFAULT}")
+    ret = t[byte_offset:byte_offset+span*storage[1].itemsize].bitcast(storage[1]).to(Device.DEFAULT)
+    return Tensor(ret.lazydata._view(ShapeTracker((View.create(tuple(size), tuple(stride)),))), device=ret.device)
 
   class Parameter:
     def __setstate__(self, state): self.tensor = state[0]
@@ -214,3 +275,93 @@ def torch_load(fn:str) -> Dict[str, Tensor]:
         base_offset += 8 + lens[i]
       f.seek(rwd)
       return TorchPickle(f).load()
+
+# gguf support!
+
+ggml_dtypes = {0:dtypes.float32, 1:dtypes.float16, 24:dtypes.int8, 25:dtypes.int16, 26:dtypes.int32, 27:dtypes.int64, 28:dtypes.float64,
+               30:dtypes.bfloat16}
+# quantized types are blocks of (elements, bytes)
+ggml_blocks = {2:(32, 18), 3:(32, 20), 6:(32, 22), 7:(32, 24), 8:(32, 34), 12:(256, 144), 13:(256, 176), 14:(256, 210)}
+
+def _bits(t:Tensor, b:int) -> Tensor:
+  # every byte split into 8//b values of b bits on a new last axis, lowest bits first
+  return t.unsqueeze(-1).div(Tensor([2**i for i in range(0, 8, b)], dtype=t.dtype, device=t.device), upcast=False).bitwise_and(2**b-1)
+
+def _nibbles(t:Tensor) -> Tensor:
+  # (..., n) bytes to (..., 2n) values, the low nibbles first
+  return _bits(t, 4).transpose(-1, -2).flatten(-2)
+
+def ggml_dequantize(blocks:Tensor, ggml_type:int) -> Tensor:
+  """
+  Dequantizes a `(blocks, bytes per block)` uint8 Tensor of a ggml quantized type to float32 on the Tensor's device.
+  """
+  def f16(a:int) -> Tensor: return blocks[:, a:a+2].bitcast(dtypes.float16).cast(dtypes.float32)
+  if ggml_type == 2: return (_nibbles(blocks[:, 2:]).cast(dtypes.int8) - 8) * f16(0)
+  if ggml_type == 3: return _nibbles(blocks[:, 4:]) * f16(0) + f16(2)
+  if ggml_type == 6: return ((_nibbles(blocks[:, 6:]) + _bits(blocks[:, 2:6], 1).flatten(-2) * 16).cast(dtypes.int8) - 16) * f16(0)
+  if ggml_type == 7: return (_nibbles(blocks[:, 8:]) + _bits(blocks[:, 4:8], 1).flatten(-2) * 16) * f16(0) + f16(2)
+  if ggml_type == 8: return blocks[:, 2:].bitcast(dtypes.int8) * f16(0)
+  if ggml_type in (12, 13):
+    # 8 sub-blocks of 32 with 6 bit scales and mins, each of the 64 element chunks takes its low then its high nibbles
+    sc = blocks[:, 4:16]
+    scale = (sc[:, 0:4] & 63).cat((sc[:, 8:12] & 0xF) + sc[:, 0:4].div(64, upcast=False) * 16, dim=-1).unsqueeze(-1)
+    mn = (sc[:, 4:8] & 63).cat(sc[:, 8:12].div(16, upcast=False) + sc[:, 4:8].div(64, upcast=False) * 16, dim=-1).unsqueeze(-1)
+    q = _bits(blocks[:, -128:].reshape(-1, 4, 32), 4).permute(0, 1, 3, 2).reshape(-1, 8, 32)
+    if ggml_type == 13: q = q + _bits(blocks[:, 16:48], 1).permute(0, 2, 1) * 16
+    return (q * scale * f16(0).unsqueeze(-1) - mn * f16(2).unsqueeze(-1)).flatten(-2)
+  if ggml_type == 14:
+    # two halves of 128, each byte of ql holds element l and l+64 and each byte of qh the 2 high bits of l, l+32, l+64 and l+96
+    ql = _bits(blocks[:, :128].reshape(-1, 2, 2, 32), 4).permute(0, 1, 4, 2, 3).reshape(-1, 256)
+    qh = _bits(blocks[:, 128:192].reshape(-1, 2, 32), 2).permute(0, 1, 3, 2).reshape(-1, 256)
+    scale = blocks[:, 192:208].bitcast(dtypes.int8).unsqueeze(-1).expand(-1, 16, 16).reshape(-1, 256)
+    return ((ql + qh * 16).cast(dtypes.int8) - 32) * scale * f16(208)
+  raise ValueError(f"unsupported ggml type {ggml_type}")
+
+def gguf_load(fn:Union[Tensor,str]) -> Tuple[Dict[str, Any], Dict[str, Tensor]]:
+  """
+  Loads a .gguf file from disk, returning the key-value metadata and the state_dict.
+
+  Unquantized tensors are `disk:` slices like with `safe_load`. Quantized ones copy their blocks to `Device.DEFAULT` and dequantize
+  to float32 there when they are realized, so every tensor is read from disk once and never dequantized on the host.
+
+  ```python
+  kv, state_dict = nn.state.gguf_load("model.gguf")
+  ```
+  """
+  t = fn if isinstance(fn, Tensor) else Tensor.empty(os.stat(fn).st_size, dtype=dtypes.uint8, device=f"disk:{fn}")
+  header, pos = bytearray(), 0
+  def read(sz:int) -> bytes:
+    nonlocal header, pos
+    # the header is read in chunks, it can hold a vocabulary of megabytes
+    while len(header) < pos+sz: header += t[len(header):min(len(header)+(1<<20), t.shape[0])].data()
+    pos += sz
+    return bytes(header[pos-sz:pos])
+  def unpack(fmt:str) -> Any: return struct.unpack(fmt, read(struct.calcsize(fmt)))[0]
+  def read_str() -> str: return read(unpack("<Q")).decode("utf-8")
+  scalars = {0:"B", 1:"b", 2:"H", 3:"h", 4:"I", 5:"i", 6:"f", 7:"?", 10:"Q", 11:"q", 12:"d"}
+  def read_value(typ:int) -> Any:
+    if typ == 8: return read_str()
+    if typ == 9:
+      typ, n = unpack("<I"), unpack("<Q")
+      if typ not in scalars: return [read_value(typ) for _ in range(n)]
+      return list(struct.unpack(f"<{n}{scalars[typ]}", read(n*struct.calcsize(scalars[typ]))))
+    return unpack("<"+scalars[typ])
+
+  if (magic:=read(4)) != b"GGUF": raise ValueError(f"not a gguf file, magic is {magic!r}")
+  if (version:=unpack("<I")) not in (2, 3): raise ValueError(f"unsupported gguf version {version}")
+  n_tensors, n_kv = unpack("<Q"), unpack("<Q")
+  kv = {read_str(): read_value(unpack("<I")) for _ in range(n_kv)}
+  infos = [(read_str(), [unpack("<Q") for _ in range(unpack("<I"))], unpack("<I"), unpack("<Q")) for _ in range(n_tensors)]
+  data_start = round_up(pos, kv.get("general.alignment", 32))
+
+  ret = {}
+  for name, dims, typ, off in infos:
+    # dims are fastest moving first
+    shape, n = tuple(reversed(dims)), prod(dims)
+    if typ in ggml_dtypes: ret[name] = t[data_start+off:data_start+off+n*ggml_dtypes[typ].itemsize].bitcast(ggml_dtypes[typ]).reshape(shape)
+    elif typ in ggml_blocks:
+      elements, nbytes = ggml_blocks[typ]
+      blocks = t[data_start+off:data_start+off+n//elements*nbytes].to(Device.DEFAULT).reshape(-1, nbytes)
+      ret[name] = ggml_dequantize(blocks, typ).reshape(shape)
+    else: raise ValueError(f"unsupported ggml type {typ} for {name}")
+  return kv, ret
@@ -1,7 +1,7 @@
 from __future__ import annotations
 from collections import defaultdict
-from typing import Any, DefaultDict, List, Optional, Set, Union, Tuple, Dict, Callable, cast
-import math, operator, ctypes, struct, functools, hashlib, itertools
+from typing import Any, DefaultDict, List, Optional, Set, Union, Tuple, Dict, Callable, Sequence, cast
+import math, operator, ctypes, struct, functools, hashlib, itertools, weakref
 from enum import Enum, auto
 from dataclasses import dataclass
 from tinygrad.dtype import ConstType, dtypes, DType
@@ -94,6 +94,9 @@ BUFFER_UOPS = {UOps.LOAD, UOps.STORE, UOps.CONST}
 
 END_FOR_UOP = {UOps.IF:(UOps.STORE, UOps.ENDIF), UOps.RANGE:(UOps.PHI, UOps.ENDRANGE)}
 
+# hash-consing table for UOp.intern, keyed by (op, dtype, arg, canonical srcs) with their types
+uop_intern: weakref.WeakValueDictionary[Tuple, UOp] = weakref.WeakValueDictionary()
+
 @dataclass(frozen=True, eq=False)
 class UOp:
   op: UOps
@@ -109,9 +112,36 @@ class UOp:
     return (self.op.value, (self.arg if self.op is not UOps.DEFINE_VAR else self.arg.expr) if self.op is not UOps.ALU else \
             self.arg.value, self.dtype, self.src)
   def __lt__(self, x:UOp): return self.cmp_tuple < x.cmp_tuple
+  def _uncached(self, name:str) -> List[UOp]:
+    # parents (and self) without the cached property `name` yet, children before parents. iterative so deep graphs don't hit the recursion limit
+    ret: List[UOp] = []
+    stack: List[Tuple[UOp, bool]] = [(self, False)]
+    visited: Set[UOp] = set()
+    while stack:
+      u, done = stack.pop()
+      if done: ret.append(u)
+      elif u not in visited and name not in u.__dict__:
+        visited.add(u)
+        stack.append((u, True))
+        stack.extend((x, False) for x in u.src)
+    return ret
   @functools.cached_property
   def key(self) -> bytes:
-    return hashlib.sha256(functools.reduce(lambda x,y: x+y, [s.key for s in self.src], str((self.op, self.dtype, self.arg)).encode())).digest()
+    # structural hash, computed once per UOp bottom-up
+    for u in self._uncached("key"):
+      u.__dict__["key"] = hashlib.sha256(str((u.op, u.dtype, u.arg)).encode() + b"".join(x.__dict__["key"] for x in u.src)).digest()
+    return self.__dict__["key"]
+  def intern(self) -> UOp:
+    """returns the canonical UOp with this structure, so identical subtrees are the same object and share their cached properties"""
+    # NOTE: the canonical UOp stores None instead of a reference to itself
+    def canonical(u:UOp) -> UOp: return u.__dict__["_interned"] or u
+    for u in self._uncached("_interned"):
+      # floats are compared by bits so 0.0 and -0.0 stay apart, PtrDType compares equal to its base DType
+      arg = struct.pack("<d", u.arg) if isinstance(u.arg, float) else u.arg
+      try: ret = uop_intern.setdefault((type(u), u.op, type(u.dtype), u.dtype, type(u.arg), arg, tuple(canonical(x) for x in u.src)), u)
+      except TypeError: ret = u  # unhashable arg
+      u.__dict__["_interned"] = ret if ret is not u else None
+    return canonical(self)
   def __repr__(self): return pretty_print(self, lambda x: f"{type(self).__name__}({x.op}, {x.dtype}, arg={x.argstr()}, src=(%s))")
   def argstr(self): return f'({", ".join(map(str, self.arg))})' if self.op is UOps.REDUCE_AXIS else self.arg
   # *** uop syntactic sugar
@@ -269,23 +299,96 @@ def _match(uop:UOp, pat:UPat, store:Dict[str, UOp]) -> List[Dict[str, UOp]]:
     res.extend(new_stores)
   return res
 
+def _upat_alts(pat:UPat, path:str, alts:List[Tuple[List[str], Dict[str, str]]], consts:Dict[int, Tuple[str, Any]]):
+  # expand pat into the straight-line alternatives _match would try, in the same order. each one is (conditions, name -> path)
+  def const(x:Any) -> str: return consts.setdefault(id(x), (f"c{len(consts)}", x))[0]
+  ret = []
+  for conds, names in alts:
+    conds = conds + ([] if pat.op is None else [f"{path}.op is UOps.{pat.op[0].name}" if len(pat.op) == 1 else f"{path}.op in {const(pat.op)}"])
+    if pat.arg is not None: conds.append(f"not ({const(pat.arg)} != {path}.arg)")
+    if pat.dtype is not None: conds.append(f"{path}.dtype in {const(pat.dtype)}")
+    if pat.name is not None:
+      if pat.name in names: conds.append(f"{path} is {names[pat.name]}")
+      else: names = {**names, pat.name: path}
+    if pat.src is None:
+      ret.append((conds, names))
+      continue
+    for vp in pat.src:
+      if isinstance(vp, itertools.repeat):
+        # the first src binds the names, every other src is checked in a loop against them
+        child, var = next(vp), f"_x{path.count('_x')}"
+        ret.append((conds+[f"len({path}.src) == 0"], names))
+        for conds0, names0 in _upat_alts(child, f"{path}.src[0]", [(conds+[f"len({path}.src) >= 1"], names)], consts):
+          rest = _upat_alts(child, var, [([], names0)], consts)
+          if any(n != names0 for _,n in rest): raise NotImplementedError("repeated src binding names")
+          if all(c for c,_ in rest): conds0 = conds0 + [f"all({' or '.join('('+' and '.join(c)+')' for c,_ in rest)} for {var} in {path}.src[1:])"]
+          ret.append((conds0, names0))
+        continue
+      # with allow_any_len, zip stops at the shorter of the srcs and the patterns
+      lens = [(len(vp), f"len({path}.src) == {pat.allowed_len}")] if pat.allowed_len != 0 else \
+        [(k, f"len({path}.src) == {k}") for k in range(len(vp))] + ([(len(vp), f"len({path}.src) >= {len(vp)}")] if len(vp) else [(0, "")])
+      for k, lcond in lens:
+        sub = [(conds+[lcond] if lcond else conds, names)]
+        for i,child in enumerate(vp[:k]): sub = _upat_alts(child, f"{path}.src[{i}]", sub, consts)
+        ret.extend(sub)
+    if len(ret) > 64: raise NotImplementedError("too many alternatives")
+  return ret
+
+def _compile_rewrite(pats:List[Tuple[UPat, Callable]]) -> Callable[[UOp], Optional[UOp]]:
+  # generate one function that tries all the patterns in order, with consecutive patterns sharing the checks of their common prefix
+  consts: Dict[int, Tuple[str, Any]] = {}
+  entries: List[Tuple[List[str], str]] = []
+  flags = []
+  for j,(p,fxn) in enumerate(pats):
+    try: alts = _upat_alts(p, "u", [([], {})], consts)
+    except NotImplementedError: alts = []
+    if not all(k.isidentifier() for _,names in alts for k in names): alts = []
+    if not alts:
+      entries.append(([], f"if (ms:=_match(u, p{j}, {{}})) and (r:=f{j}(**ms[0])) is not None: return r"))
+      continue
+    for conds, names in alts:
+      call = f"if (r:=f{j}({', '.join(f'{k}={v}' for k,v in names.items())})) is not None: return r"
+      # if fxn returns None, the pattern's later alternatives are not tried
+      entries.append((conds, call if len(alts) == 1 else f"if not m{j}:\n  m{j} = True\n  " + call))
+    if len(alts) > 1: flags.append(f"m{j}")
+  def emit(entries:List[Tuple[List[str], str]], indent:str) -> List[str]:
+    lines: List[str] = []
+    i = 0
+    while i < len(entries):
+      conds, action = entries[i]
+      if not conds:
+        lines += [indent+x for x in action.split("\n")]
+        i += 1
+        continue
+      group = list(itertools.takewhile(lambda e: e[0][:1] == conds[:1], entries[i:]))
+      lines += [f"{indent}if {conds[0]}:"] + emit([(c[1:], a) for c,a in group], indent+"  ")
+      i += len(group)
+    return lines
+  src = "\n".join(["def rewrite(u):"] + [f"  {x} = False" for x in flags] + emit(entries, "  ") + ["  return None"])
+  namespace = {"UOps": UOps, "_match": _match, **dict(consts.values()), **{f"p{j}":p for j,(p,_) in enumerate(pats)},
+               **{f"f{j}":fxn for j,(_,fxn) in enumerate(pats)}}
+  exec(src, namespace)  # pylint: disable=exec-used
+  return namespace["rewrite"]
+
 class PatternMatcher:
-  def __init__(self, patterns:List[Tuple[Union[UPat, NOp], Callable]]):
-    self.patterns = patterns
+  def __init__(self, patterns:Sequence[Tuple[Union[UPat, NOp], Callable]]):
+    self.patterns: List[Tuple[UPat, Callable]] = [(p.compile() if isinstance(p, NOp) else p, fxn) for p,fxn in patterns]
     self.pdict: DefaultDict[Tuple[UOps, Any], List[Tuple[UPat, Callable]]] = defaultdict(list)
     # uop is required, arg is optional
     for p,fxn in self.patterns:
-      if isinstance(p, NOp): p = p.compile()
       assert p.op is not None
       for uop in p.op: self.pdict[(uop, p.arg)].append((p, fxn))
+    # a generated matching function for each (op, arg) in pdict and each op, built the first time it's needed
+    self.compiled: Dict[Tuple[UOps, Any], Callable[[UOp], Optional[UOp]]] = {}
 
   @functools.lru_cache(None)  # pylint: disable=method-cache-max-size-none
   def __add__(self, more:PatternMatcher): return PatternMatcher(self.patterns+more.patterns)
 
   def rewrite(self, uop:UOp) -> Optional[UOp]:
-    for p,fxn in itertools.chain(self.pdict[(uop.op, uop.arg)], self.pdict[(uop.op, None)]):
-      if (matches := _match(uop, p, {})) and (ret:=fxn(**matches[0])) is not None: return ret # NOTE: if it returns None, we keep trying to match
-    return None
+    key = (uop.op, uop.arg) if (uop.op, uop.arg) in self.pdict else (uop.op, None)
+    if (fxn:=self.compiled.get(key)) is None:
+      fxn = self.compiled[key] = _compile_rewrite(self.pdict.get(key, []) + (self.pdict.get((uop.op, None), []) if key[1] is not None else []))
+    return fxn(uop)
 
 def type_verify(uops):
   for u in uops:
@@ -4,7 +4,7 @@ from dataclasses import dataclass, field
 from tinygrad.helpers import to_function_name, dedup
 from tinygrad.ops import Op, UOps, UOp, flops_mem
 from tinygrad.shape.symbolic import sym_infer, sint, Variable
-from tinygrad.dtype import DType
+from tinygrad.dtype import DType, dtypes
 
 @dataclass(frozen=True)
 class TensorCore: # D = A * B + C, A is (M x K), B is (K x N), C and D are (M x N)
@@ -14,6 +14,11 @@ class TensorCore: # D = A * B + C, A is (M x K), B is (K x N), C and D are (M x
   threads: List[Tuple[int,int]] # list of (TC dim,amt) that construct the warp thread structure
   def __str__(self): return "_".join(["WMMA"] + list(map(str, self.dims)) + [self.dtype_in.name, self.dtype_out.name])
 
+def cpu_tensor_cores(vector_bytes:int) -> List[TensorCore]:
+  # one row of a cpu matmul microkernel: an element of A broadcast times a full (or half) vector register of B, accumulated into a row of C
+  return [TensorCore(dims=(sz//di.itemsize,1,1), threads=[], dtype_in=di, dtype_out=di)
+          for sz in [vector_bytes, vector_bytes//2] for di in [dtypes.float, dtypes.double] if sz >= 2*di.itemsize]
+
 @dataclass
 class Program:
   name:str
@@ -73,6 +78,10 @@ class Renderer:
   suffix: str = ""
   # TODO: make this generic with a list of supported types
   supports_float4: bool = True
+  # widest vector in bytes that loads, stores and ALU fold to, None is float4 (and half4)
+  vector_bytes: Optional[int] = None
+  # float ALU ops that render on vector dtypes, the others are done one element at a time
+  vector_alus: Tuple[Op, ...] = ()
   has_local: bool = True
   has_shared: bool = True
   # NOTE: these two should be in (x,y,z) order to match the max_sizes argument in get_grouped_dims
@@ -2,9 +2,9 @@ from typing import Dict, List, Optional, Tuple, Union, DefaultDict, cast, Litera
 import os, math
 from collections import defaultdict, Counter
 from tinygrad.ops import UnaryOps, BinaryOps, TernaryOps, UOps, UOp
-from tinygrad.helpers import strip_parens, getenv, prod, dedup
+from tinygrad.helpers import strip_parens, getenv, prod, dedup, cpu_vector_bytes
 from tinygrad.dtype import ImageDType, dtypes, DType, PtrDType, ConstType
-from tinygrad.renderer import Renderer, TensorCore
+from tinygrad.renderer import Renderer, TensorCore, cpu_tensor_cores
 
 class CStyleLanguage(Renderer):
   kernel_prefix: str = ""
@@ -189,7 +189,9 @@ class CStyleLanguage(Renderer):
     return self.render_kernel(name, kernel, list(bufs.values()), uops)
 
 def _make_clang_dtype(self, dtype):
-  return f"typedef {self.render_dtype(dtype.scalar())} {self.render_dtype(dtype)} __attribute__((aligned({(sz:=dtype.itemsize)}),vector_size({sz})));"
+  # buffers are only 16 byte aligned, so wider (AVX/AVX-512) vectors are too
+  sz = dtype.itemsize
+  return f"typedef {self.render_dtype(dtype.scalar())} {self.render_dtype(dtype)} __attribute__((vector_size({sz}),aligned({min(sz, 16)})));"
 
 class ClangRenderer(CStyleLanguage):
   device = "CLANG"
@@ -205,9 +207,20 @@ class ClangRenderer(CStyleLanguage):
   code_for_op = {**({k:v for k,v in CStyleLanguage().code_for_op.items() if k not in [UnaryOps.EXP2, UnaryOps.SIN, UnaryOps.LOG2]}),
                  UnaryOps.SQRT: lambda x,dtype: f"__builtin_sqrtl({x})" if dtype == dtypes.float64 else f"__builtin_sqrtf({x})",
                  BinaryOps.MAX: lambda a,b,dtype: f"(({a}>{b})?{a}:{b})"}
+  # gcc/clang vector extensions do these elementwise on float4/8/16s
+  vector_alus = (BinaryOps.ADD, BinaryOps.MUL, UnaryOps.NEG, UnaryOps.RECIP)
+
+  def __init__(self):
+    self.vector_bytes = cpu_vector_bytes()
+    # one row of the cpu matmul microkernel: an element of A broadcast times a vector of B, accumulated into a vector register row of C
+    self.tensor_cores = cpu_tensor_cores(self.vector_bytes)
 
   def render_kernel(self, function_name, kernel, bufs, uops, prefix=None) -> str:
     prefix = [_make_clang_dtype(self, dtype) for dtype in dedup(uop.dtype for uop in uops if uop.dtype is not None and uop.dtype.count>1)]
+    for (name, (N, _, _), dtype_in, dtype_out, *_) in dedup([uop.arg for uop in uops if uop.op is UOps.WMMA]):
+      a, b, c = self.render_dtype(dtype_in), self.render_dtype(dtype_in.vec(N)), self.render_dtype(dtype_out.vec(N))
+      # guarded, so kernels can be pasted into one file (like export_c does)
+      prefix.append(f"#ifndef __{name}_DEFINED\n#define __{name}_DEFINED\nstatic {c} __{name}({a} a, {b} b, {c} c) {{ return c + a * b; }}\n#endif")
     return super().render_kernel(function_name, kernel, bufs, uops, prefix)
 
 class OpenCLRenderer(CStyleLanguage):
@@ -2,7 +2,8 @@ from typing import Dict, Callable, Any, List, Optional
 from llvmlite import ir
 from tinygrad.dtype import DType, PtrDType, dtypes
 from tinygrad.ops import Op, UnaryOps, BinaryOps, TernaryOps, UOps, UOp
-from tinygrad.renderer import Renderer
+from tinygrad.helpers import cpu_vector_bytes
+from tinygrad.renderer import Renderer, cpu_tensor_cores
 
 MFLAGS = ('nsz', 'arcp', 'contract', 'afn', 'reassoc') # All from fast math, but nnan and ninf
 
@@ -44,19 +45,33 @@ def cast(bb, val, input_type, output_type, bitcast=False):
 
   raise NotImplementedError(f"cast from {input_type} -> {output_type} not implemented")
 
-def const(args, dtype): return ir.Constant(dtype_to_llvm_dtype[dtype], args)
+def ldt(dtype:DType): return ir.VectorType(dtype_to_llvm_dtype[dtype.scalar()], dtype.count) if dtype.count > 1 else dtype_to_llvm_dtype[dtype]
+def const(args, dtype): return ir.Constant(ldt(dtype), [args]*dtype.count if dtype.count > 1 else args)
+def intrinsic(module, name, typ):
+  # llvmlite can't name the overloads of vector types, like llvm.sqrt.v8f32
+  if not isinstance(typ, ir.VectorType): return module.declare_intrinsic(name, [typ])
+  name = f"{name}.v{typ.count}{typ.element.intrinsic_name}"
+  return module.globals.get(name) or ir.Function(module, ir.FunctionType(typ, [typ]), name)
+def vptr(bb, buf, idx, dtype:DType):
+  # pointer to element idx of buf, as a pointer to a vector when a folded load or store moves dtype.count elements at once
+  ptr = bb[-1].gep(buf, [idx], inbounds=True)
+  return bb[-1].bitcast(ptr, ldt(dtype).as_pointer()) if dtype.count > 1 else ptr
 
 class LLVMRenderer(Renderer):
   device = "LLVM"
-  supports_float4 = False
   has_local = False
   has_shared = False
   global_max = None
+  vector_alus = (BinaryOps.ADD, BinaryOps.MUL, BinaryOps.MAX, UnaryOps.NEG, UnaryOps.RECIP, UnaryOps.SQRT, TernaryOps.WHERE)
+  def __init__(self):
+    self.vector_bytes = cpu_vector_bytes()
+    # same as CLANG, one row of the cpu matmul microkernel per WMMA
+    self.tensor_cores = cpu_tensor_cores(self.vector_bytes)
   code_for_op: Dict[Op, Callable] = {
     UnaryOps.NEG: lambda builder, x, dtype: builder.neg(x) if dtypes.is_int(dtype) else \
     (builder.not_(x) if dtype == dtypes.bool else builder.fneg(x, flags=MFLAGS)),
     UnaryOps.RECIP: lambda builder, x, dtype: builder.fdiv(const(1, dtype), x, flags=MFLAGS),
-    UnaryOps.SQRT: lambda builder, x, dtype: builder.call(builder.module.declare_intrinsic('llvm.sqrt', [x.type]), [x], fastmath=MFLAGS),
+    UnaryOps.SQRT: lambda builder, x, dtype: builder.call(intrinsic(builder.module, 'llvm.sqrt', x.type), [x], fastmath=MFLAGS),
     BinaryOps.ADD: lambda builder, x, y, dtype: builder.or_(x, y) if dtype == dtypes.bool else builder.add(x, y) if dtypes.is_int(dtype) else builder.fadd(x, y, flags=MFLAGS),  # noqa: E501
     BinaryOps.MUL: lambda builder, x, y, dtype: builder.mul(x, y) if is_bool_or_unsigned(dtype) or dtypes.is_int(dtype) else builder.fmul(x, y, flags=MFLAGS),  # noqa: E501
     BinaryOps.IDIV: lambda builder, x, y, dtype: builder.udiv(x, y) if is_bool_or_unsigned(dtype) else builder.sdiv(x, y),
@@ -93,12 +108,13 @@ class LLVMRenderer(Renderer):
     for u in uops:
       uop,dtype,src,args = u.op,u.dtype,u.src,u.arg
       if uop is UOps.STORE:
-        element = cast(bb, lvars[src[2]], src[2].dtype, src[0].dtype)
+        assert (val_dtype:=src[2].dtype) is not None, f"None dtype for stored {src[2]}"
+        element = lvars[src[2]] if val_dtype.count > 1 else cast(bb, lvars[src[2]], val_dtype, src[0].dtype)
         if len(src) > 3:
           with bb[-1].if_then(lvars[src[3]]):
-            bb[-1].store(element, bb[-1].gep(lvars[src[0]], [lvars[src[1]]], inbounds=True))
+            bb[-1].store(element, vptr(bb, lvars[src[0]], lvars[src[1]], val_dtype), align=val_dtype.scalar().itemsize)
         else:
-          bb[-1].store(element, bb[-1].gep(lvars[src[0]], [lvars[src[1]]], inbounds=True))
+          bb[-1].store(element, vptr(bb, lvars[src[0]], lvars[src[1]], val_dtype), align=val_dtype.scalar().itemsize)
       elif uop is UOps.ENDRANGE:
         loop_entry_bb, phis = loop_blocks.pop()
         idx_p1 = bb[-1].add(lvars[src[0]], ir.Constant(ir.IntType(32), 1))
@@ -115,7 +131,7 @@ class LLVMRenderer(Renderer):
           phis = []
           for rp in reduce_phis:
             incoming = lvars[rp]
-            lvars[rp] = bb[-1].phi(dtype_to_llvm_dtype[rp.dtype])
+            lvars[rp] = bb[-1].phi(ldt(rp.dtype))
             lvars[rp].add_incoming(incoming, bb[-2].block)
             phis.append((rp, lvars[rp]))
 
@@ -123,15 +139,15 @@ class LLVMRenderer(Renderer):
           lvars[u].add_incoming(lvars[src[0]], bb[-2].block)
           loop_blocks.append((bb[-1].block, phis))
         elif uop is UOps.DEFINE_ACC:
-          lvars[u] = const(src[0].arg, dtype)
+          lvars[u] = lvars[src[0]] if src[0].op is UOps.VECTORIZE else const(src[0].arg, dtype)
           reduce_phis.append(u)
         elif uop is UOps.LOAD:
           if len(src) > 2:
             aug_idx = bb[-1].select(lvars[src[3]], lvars[src[1]], ir.Constant(ir.IntType(32), 0))
-            val = bb[-1].load(bb[-1].gep(lvars[src[0]], [aug_idx], inbounds=True))
+            val = bb[-1].load(vptr(bb, lvars[src[0]], aug_idx, dtype), align=dtype.scalar().itemsize)
             val = bb[-1].select(lvars[src[3]], val, lvars[src[2]])
           else:
-            val = bb[-1].load(bb[-1].gep(lvars[src[0]], [lvars[src[1]]], inbounds=True))
+            val = bb[-1].load(vptr(bb, lvars[src[0]], lvars[src[1]], dtype), align=dtype.scalar().itemsize)
           lvars[u] = val
         elif uop is UOps.PHI:
           lvars[u] = lvars[src[1]]
@@ -144,6 +160,15 @@ class LLVMRenderer(Renderer):
         elif uop in {UOps.CAST, UOps.BITCAST}: lvars[u] = cast(bb, lvars[src[0]], src[0].dtype, dtype, bitcast=uop is UOps.BITCAST)
         elif uop in {UOps.DEFINE_GLOBAL, UOps.DEFINE_VAR}: lvars[u] = func.args[buf_index[args]]
         elif uop is UOps.CONST: lvars[u] = const(args, dtype)
+        elif uop is UOps.VECTORIZE:
+          lvars[u] = ir.Constant(ldt(dtype), ir.Undefined)
+          for i,x in enumerate(src): lvars[u] = bb[-1].insert_element(lvars[u], lvars[x], ir.Constant(ir.IntType(32), i))
+        elif uop is UOps.GEP: lvars[u] = bb[-1].extract_element(lvars[src[0]], ir.Constant(ir.IntType(32), args))
+        elif uop is UOps.WMMA:
+          # c + a * b, with the scalar a broadcast across the vector b
+          a = bb[-1].insert_element(ir.Constant(ldt(dtype), ir.Undefined), lvars[src[0]], ir.Constant(ir.IntType(32), 0))
+          a = bb[-1].shuffle_vector(a, ir.Constant(ldt(dtype), ir.Undefined), const(0, dtypes.int32.vec(dtype.count)))
+          lvars[u] = bb[-1].fadd(lvars[src[2]], bb[-1].fmul(a, lvars[src[1]], flags=MFLAGS), flags=MFLAGS)
         else: raise RuntimeError(f"failed to render {uop}")
 
     bb[-1].ret_void()
@@ -37,7 +37,9 @@ class LLVMDevice(Compiled):
     llvm.initialize_native_asmparser()
     self.optimizer: llvm.passmanagers.ModulePassManager = llvm.create_module_pass_manager()
     # this opt actually can change things. ex: opt=3 means no FMA, opt=2 means FMA
-    self.target_machine: llvm.targets.TargetMachine = llvm.Target.from_triple(llvm.get_process_triple()).create_target_machine(opt=2)
+    # target the host cpu, so the vector widths the renderer folds to (see cpu_vector_bytes) are native registers
+    self.target_machine: llvm.targets.TargetMachine = llvm.Target.from_triple(llvm.get_process_triple()).create_target_machine(
+      cpu=llvm.get_host_cpu_name(), features=llvm.get_host_cpu_features().flatten(), opt=2)
     self.target_machine.add_analysis_passes(self.optimizer)
     self.target_machine.set_asm_verbosity(True)
     backing_mod = llvm.parse_assembly(str())
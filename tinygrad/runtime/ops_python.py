@@ -2,12 +2,13 @@
 # a python uops emulator
 # works to test the tensor cores, and all the uops in general
 # this is the (living) definition of uops
-from typing import Tuple, List, Optional, Any, Dict
+from typing import Tuple, List, Optional, Any, Dict, Callable
 import pickle, base64, itertools, time, struct
+import numpy as np
 from tinygrad.dtype import DType, dtypes, ImageDType
-from tinygrad.helpers import all_same, getenv, flatten
+from tinygrad.helpers import all_same, getenv, flatten, prod
 from tinygrad.device import Compiled, Compiler, Allocator
-from tinygrad.ops import BinaryOps, TernaryOps, exec_alu, truncate, UOps, UOp
+from tinygrad.ops import UnaryOps, BinaryOps, TernaryOps, exec_alu, truncate, UOps, UOp
 from tinygrad.renderer import Renderer
 from tinygrad.renderer.cstyle import CUDARenderer, MetalRenderer, AMDRenderer, IntelRenderer
 
@@ -23,6 +24,22 @@ def _store(m, i, v):
   if i < 0 or i >= len(m): raise IndexError(f"store out of bounds, size is {len(m)}, access is {i}, value is {v}")
   m[i] = v
 
+# here are the models for the WMMA instruction on the different hardware
+# a_elem and b_elem map element (i, j) of A and B to the (register, lane) holding it, c_map maps (lane, register) of C and D to its (i, j)
+# TODO: refactor these to a shared TensorCoreLayout in kernel.py
+wmma_layouts: Dict[str, Tuple[int, int, int, int, int, Callable, Callable, Callable]] = {
+  # A, B (2 elements on 32 threads): row major. C, D (2 elements on 32 threads): row major same as A/B
+  "METAL": (32, 8, 2, 2, 2, lambda i, j: (i%2, (i//2)%2+(j%4)*2+(i//4)*8+(j//4)*16), lambda i, j: (i%2, (i//2)%2+(j%4)*2+(i//4)*8+(j//4)*16),
+            lambda lane, elem: (elem + ((lane%2)*2) + ((lane//8)%2)*4, ((lane//2)%4) + (lane//16)*4)),
+  # A (16 elements on 32 threads): col major, B (16 elements on 32 threads): row major, lane 16-32 == lane 0-15. C, D (8 elements on 32 threads)
+  "AMD": (32, 16, 16, 16, 8, lambda i, j: (i, j), lambda i, j: (j, i), lambda lane, elem: (lane%16, lane//16+elem*2)),
+  # A (8 elements on 32 threads), B (4 elements on 32 threads), C, D (4 elements on 32 threads)
+  "CUDA": (32, 16, 8, 4, 4, lambda i, j: ((i%2)+(j//8)*2+(i//8)*4, ((i//2)%4)+(j%8)*4), lambda i, j: ((j%2)+(j//8)*2, (j//2)%4+i*4),
+           lambda lane, elem: ((elem%2)+(lane%4)*2, (lane//4)+(elem//2)*8)),
+  # A (16 elements on 8 threads), B (16 elements on 8 threads), C, D (8 elements on 8 threads)
+  "INTEL": (8, 16, 16, 16, 8, lambda i, j: (i%2+j*2, i//2), lambda i, j: (j, i), lambda lane, elem: (lane, elem)),
+}
+
 class PythonProgram:
   def __init__(self, name:str, lib:bytes):
     self.uops: List[Tuple[UOps, Optional[DType], List[int], Any]] = pickle.loads(lib)
@@ -129,56 +146,25 @@ class PythonProgram:
         elif uop is UOps.GEP:
           ul[i] = inp[0][arg]
         elif uop is UOps.WMMA:
-          # here are the models for the WMMA instruction on the different hardware
-          def wmma_helper(WARP_THREADS, K, NUM_A, NUM_B, NUM_C, a_elem, b_elem, c_map):
-            assert len(inp[0]) == NUM_A, f"A must have {NUM_A} elements per thread, it has {len(inp[0])}"
-            assert len(inp[1]) == NUM_B, f"B must have {NUM_B} elements per thread, it has {len(inp[1])}"
-            assert len(inp[2]) == NUM_C, f"C must have {NUM_C} elements per thread, it has {len(inp[2])}"
-            assert len(flatten(inp[0])) == NUM_A * warp_size, f"WMMA must have {NUM_A * warp_size} total elements for A in WMMA"
-            assert len(flatten(inp[1])) == NUM_B * warp_size, f"WMMA must have {NUM_B * warp_size} total elements for B in WMMA"
-            assert len(flatten(inp[2])) == NUM_C * warp_size, f"WMMA must have {NUM_C * warp_size} total elements for C in WMMA"
-            assert warp_size > 0 and warp_size % WARP_THREADS == 0, f"must have multiples of {WARP_THREADS} warp threads"
-            out = [inp[2][elem_idx][:] for elem_idx in range(NUM_C)]
-            for goff in range(0, warp_size, WARP_THREADS):
-              for lane_id in range(WARP_THREADS):
-                for elem_idx in range(NUM_C): # calculate new muls and add to acc
-                  (c_i, c_j) = c_map(lane_id, elem_idx)
-                  out[elem_idx][goff+lane_id] += sum(a_elem(inp[0], _k, c_j, goff) * b_elem(inp[1], c_i, _k, goff) for _k in range(K))
-            return out
-
-          # TODO: refactor these to a shared TensorCoreLayout in kernel.py
-          if arg[4] == "METAL":
-            # A (2 elements on 32 threads): row major
-            def a_b_elem(x, i, j, goff): return x[(i%2)][goff+(i//2)%2+(j%4)*2+(i//4)*8+(j//4)*16]
-            # (i, j), C, D (2 elements on 32 threads): row major same as A/B
-            def c_map(lane, elem): return (elem + ((lane%2)*2) + ((lane//8)%2)*4, ((lane//2)%4) + (lane//16)*4)
-            ul[i] = wmma_helper(32, 8, 2, 2, 2, a_b_elem, a_b_elem, c_map)
-          elif arg[4] == "AMD":
-            # A (16 elements on 32 threads): col major, lane 16-32 == lane 0-15
-            def a_elem(x, i, j, goff):
-              assert x[i][goff+j] == x[i][goff+j+16], "warp elements not duplicated properly across lanes"
-              return x[i][goff+j]
-            # B (16 elements on 32 threads): row major, lane 16-32 == lane 0-15
-            def b_elem(x, i, j, goff): return a_elem(x, j, i, goff)  # pylint: disable=arguments-out-of-order
-            def c_map(lane, elem): return (lane%16, lane//16+elem*2) # (i, j), C, D (8 elements on 32 threads): row major
-            ul[i] = wmma_helper(32, 16, 16, 16, 8, a_elem, b_elem, c_map)
-          elif arg[4] == "CUDA":
-            # A (8 elements on 32 threads)
-            def a_elem(x, i, j, goff): return x[(i%2)+(j//8)*2+(i//8)*4][goff+((i//2)%4)+(j%8)*4]
-            # B (4 elements on 32 threads)
-            def b_elem(x, i, j, goff): return x[(j%2)+(j//8)*2][goff+(j//2)%4+(i)*4]
-            # (i, j), C, D (4 elements on 32 threads)
-            def c_map(lane, elem): return ((elem%2)+(lane%4)*2, (lane//4)+(elem//2)*8)
-            ul[i] = wmma_helper(32, 16, 8, 4, 4, a_elem, b_elem, c_map)
-          elif arg[4] == "INTEL":
-            # A (16 elements on 8 threads)
-            def a_elem(x, i, j, goff): return x[i%2+j*2][goff+i//2]
-            # B (16 elements on 8 threads)
-            def b_elem(x, i, j, goff): return x[j][goff+i]
-            # C, D (8 elements on 8 threads)
-            def c_map(lane, elem): return (lane, elem)
-            ul[i] = wmma_helper(8, 16, 16, 16, 8, a_elem, b_elem, c_map)
-          else: raise NotImplementedError(f"unimplemented tensor core {arg}")
+          if arg[4] not in wmma_layouts: raise NotImplementedError(f"unimplemented tensor core {arg}")
+          WARP_THREADS, K, NUM_A, NUM_B, NUM_C, a_elem, b_elem, c_map = wmma_layouts[arg[4]]
+          assert len(inp[0]) == NUM_A, f"A must have {NUM_A} elements per thread, it has {len(inp[0])}"
+          assert len(inp[1]) == NUM_B, f"B must have {NUM_B} elements per thread, it has {len(inp[1])}"
+          assert len(inp[2]) == NUM_C, f"C must have {NUM_C} elements per thread, it has {len(inp[2])}"
+          assert len(flatten(inp[0])) == NUM_A * warp_size, f"WMMA must have {NUM_A * warp_size} total elements for A in WMMA"
+          assert len(flatten(inp[1])) == NUM_B * warp_size, f"WMMA must have {NUM_B * warp_size} total elements for B in WMMA"
+          assert len(flatten(inp[2])) == NUM_C * warp_size, f"WMMA must have {NUM_C * warp_size} total elements for C in WMMA"
+          assert warp_size > 0 and warp_size % WARP_THREADS == 0, f"must have multiples of {WARP_THREADS} warp threads"
+          out = [inp[2][elem_idx][:] for elem_idx in range(NUM_C)]
+          for goff in range(0, warp_size, WARP_THREADS):
+            if arg[4] == "AMD":
+              assert all(x[goff+j] == x[goff+j+16] for x in inp[0]+inp[1] for j in range(16)), "warp elements not duplicated properly across lanes"
+            for lane_id in range(WARP_THREADS):
+              for elem_idx in range(NUM_C): # calculate new muls and add to acc
+                (c_i, c_j) = c_map(lane_id, elem_idx)
+                out[elem_idx][goff+lane_id] += sum(inp[0][(a:=a_elem(_k, c_j))[0]][goff+a[1]] * inp[1][(b:=b_elem(c_i, _k))[0]][goff+b[1]]
+                                                   for _k in range(K))
+          ul[i] = out
         elif uop is UOps.ALU:
           assert all_same([len(x) for x in inp]), f"{[len(x) for x in inp]} doesn't match on {arg}"
           assert all_same([dtype] + dtp) or arg in {BinaryOps.CMPNE, BinaryOps.CMPLT, TernaryOps.WHERE}, f"dtype mismatch on {arg}"
@@ -187,6 +173,153 @@ class PythonProgram:
         i += 1
     return time.perf_counter() - st
 
+# *** the vectorized emulator: every uop runs once for all threads of the launch, as numpy arrays over global x local lanes ***
+
+def _np_dtype(dtype:DType) -> np.dtype:
+  assert (fmt:=dtype.scalar().fmt) is not None, f"{dtype} has no numpy dtype"
+  return np.dtype(fmt)
+
+# like python_alu, IDIV and MOD round towards zero
+def _np_idiv(x:np.ndarray, y:np.ndarray) -> np.ndarray:
+  return np.where(y == 0, 0, np.abs(x) // np.where(y == 0, 1, np.abs(y)) * np.where((x<0) != (y<0), -1, 1))
+def _np_mod(x:np.ndarray, y:np.ndarray) -> np.ndarray: return np.where(y == 0, 0, np.abs(x) % np.where(y == 0, 1, np.abs(y)) * np.where(x<0, -1, 1))
+
+numpy_alu: Dict[Any, Callable] = {
+  UnaryOps.LOG2: lambda x: np.where(x > 0, np.log2(x), np.where(x == 0, -np.inf, np.nan)), UnaryOps.EXP2: np.exp2, UnaryOps.RECIP: np.reciprocal,
+  UnaryOps.SQRT: lambda x: np.where(x >= 0, np.sqrt(x), np.nan), UnaryOps.SIN: lambda x: np.where(np.isinf(x), np.nan, np.sin(x)),
+  UnaryOps.NEG: lambda x: np.logical_not(x) if x.dtype == np.bool_ else np.negative(x),
+  BinaryOps.SHR: np.right_shift, BinaryOps.SHL: np.left_shift, BinaryOps.MUL: np.multiply, BinaryOps.ADD: np.add, BinaryOps.XOR: np.bitwise_xor,
+  BinaryOps.MAX: np.maximum, BinaryOps.CMPNE: np.not_equal, BinaryOps.CMPLT: np.less, BinaryOps.OR: np.bitwise_or, BinaryOps.AND: np.bitwise_and,
+  BinaryOps.MOD: _np_mod, BinaryOps.IDIV: _np_idiv, TernaryOps.MULACC: lambda x,y,z: (x*y)+z, TernaryOps.WHERE: np.where}
+
+class NumpyMem:
+  # a buffer seen by all threads, DEFINE_LOCAL memory holds one copy of `size` elements for every workgroup
+  def __init__(self, arr:np.ndarray, size:int, group:Optional[np.ndarray]=None): self.arr, self.size, self.group = arr, size, group
+  def addr(self, idx:np.ndarray, mask:np.ndarray, op:str) -> np.ndarray:
+    if (oob:=mask & ((idx < 0) | (idx >= self.size))).any():
+      raise IndexError(f"{op} out of bounds, size is {self.size} and access is {idx[oob][0]}")
+    return np.where(mask, idx + (0 if self.group is None else self.group*self.size), 0)
+  def load(self, idx:np.ndarray, mask:np.ndarray, default:Any=0) -> np.ndarray: return np.where(mask, self.arr[self.addr(idx, mask, "load")], default)
+  def store(self, idx:np.ndarray, mask:np.ndarray, val:np.ndarray): self.arr[self.addr(idx, mask, "store")[mask]] = val[mask]
+
+TRACE = getenv("TRACE")
+class PythonVecProgram:
+  """
+  Runs the same uops as PythonProgram, but evaluates each uop once for every thread as a numpy array instead of once per thread.
+  Threads are ordered like PythonProgram visits them, so the last thread still wins a racing store.
+  """
+  def __init__(self, name:str, lib:bytes):
+    self.uops: List[Tuple[UOps, Optional[DType], List[int], Any]] = pickle.loads(lib)
+    void_ops = {UOps.STORE, UOps.ENDRANGE, UOps.BARRIER, UOps.IF, UOps.ENDIF}
+    self.srcs = [[v for v in (idp[:1] if uop is UOps.DEFINE_ACC else idp) if self.uops[v][0] not in void_ops] for uop,_,idp,_ in self.uops]
+  def __call__(self, *bufs, global_size:Tuple[int,int,int]=(1,1,1), local_size:Tuple[int,int,int]=(1,1,1), vals:Tuple[int, ...]=(), wait=False):
+    st = time.perf_counter()
+    # whole workgroups run together in chunks of about PYTHON_VEC_THREADS threads, that bounds the memory of the intermediate arrays
+    groups, step = prod(global_size), max(1, getenv("PYTHON_VEC_THREADS", 2**16) // prod(local_size))
+    with np.errstate(all="ignore"):
+      for g in range(0, groups, step): self._run(list(bufs), list(vals), np.arange(g, min(g+step, groups)), global_size, local_size)
+    return time.perf_counter() - st
+  def _run(self, pbufs:List[memoryview], pvals:List[int], groups:np.ndarray, global_size:Tuple[int,int,int], local_size:Tuple[int,int,int]):
+    warp_size, n = prod(local_size), len(groups)*prod(local_size)
+    # thread t is lane t%warp_size of workgroup groups[t//warp_size], both enumerated with dimension 0 moving fastest
+    group, lane = np.repeat(np.arange(len(groups)), warp_size), np.tile(np.arange(warp_size), len(groups))
+    gidx, lidx = np.unravel_index(groups[group], global_size[::-1])[::-1], np.unravel_index(lane, local_size[::-1])[::-1]
+    ul: Dict[int, Any] = {}
+    dl: Dict[int, DType] = {}
+    i = 0
+    loop_ends: Dict[int, int] = {}
+    while i < len(self.uops):
+      uop, dtype, idp, arg = self.uops[i]
+      inp, dtp = [ul[v] for v in self.srcs[i]], [dl[v] for v in self.srcs[i]]
+      if TRACE: print(i, uop, dtype, arg, dtp)
+      if uop is UOps.STORE:
+        gate = inp[3] if len(inp) == 4 else np.ones(n, dtype=np.bool_)
+        if isinstance(dtp[0], ImageDType):
+          assert dtp[2].count == 4
+          ox, oy = inp[1]
+          assert ((ox >= 0) & (ox < dtp[0].shape[1]) & (oy >= 0) & (oy < dtp[0].shape[0]))[gate].all()
+          for j,val in enumerate(inp[2]): inp[0].store(ox*4 + oy*dtp[0].shape[1]*4 + j, gate, val)
+        elif dtp[2].count > 1:
+          for j,val in enumerate(inp[2]): inp[0].store(inp[1]+j, gate, val)
+        else: inp[0].store(inp[1], gate, inp[2])
+        i += 1
+        continue
+      if uop is UOps.ENDRANGE:
+        loop_ends[idp[0]] = i
+        i = idp[0]
+        continue
+      if uop in (UOps.BARRIER, UOps.IF, UOps.ENDIF):
+        # all threads run in lockstep
+        i += 1
+        continue
+      assert dtype is not None, f"{uop} is missing a dtype"
+      dl[i] = dtype
+      if uop is UOps.DEFINE_GLOBAL:
+        buf = np.frombuffer(pbufs.pop(0), dtype=_np_dtype(dtype))
+        ul[i] = NumpyMem(buf, len(buf))
+      elif uop is UOps.DEFINE_LOCAL:
+        ul[i] = NumpyMem(np.zeros(arg[1]*len(groups), dtype=_np_dtype(dtype)), arg[1], group)
+      elif uop is UOps.DEFINE_VAR: ul[i] = np.full(n, pvals.pop(0))
+      elif uop is UOps.SPECIAL:
+        if arg[0][0] == 'g': ul[i] = gidx[int(arg[0][-1])].copy()
+        elif arg[0][0] == 'l': ul[i] = lidx[int(arg[0][-1])].copy()
+      elif uop is UOps.CONST:
+        # like in PythonProgram, float consts keep double precision until an ALU truncates them
+        ul[i] = np.full(n, arg, dtype=np.float64) if dtypes.is_float(dtype) else np.full(n, np.array(arg).astype(_np_dtype(dtype)))
+      elif uop is UOps.DEFINE_ACC:
+        ul[i] = [np.full(n, inp[0][0][0]) for _ in range(dtype.count)] if dtype.count > 1 else np.full(n, inp[0][0])
+      elif uop is UOps.RANGE:
+        if i not in ul: ul[i] = np.full(n, inp[0][0])
+        else:
+          ul[i] += 1
+          if ul[i][0] == inp[1][0]:
+            del ul[i]
+            i = loop_ends[i] + 1
+            continue
+      elif uop is UOps.VECTORIZE: ul[i] = inp
+      elif uop is UOps.BITCAST: ul[i] = inp[0].astype(_np_dtype(dtp[0])).view(_np_dtype(dtype)).copy()
+      elif uop is UOps.CAST:
+        x = inp[0]
+        if dtypes.is_int(dtype) and x.dtype.kind == 'f': x = np.trunc(x).astype(np.int64)
+        ul[i] = (x != 0) if dtype == dtypes.bool else x.astype(_np_dtype(dtype))
+      elif uop is UOps.LOAD:
+        gate = inp[3] if len(inp) == 4 else np.ones(n, dtype=np.bool_)
+        if isinstance(dtp[0], ImageDType):
+          assert dtype.count == 4
+          ox, oy = inp[1]
+          valid = gate & (ox >= 0) & (ox < dtp[0].shape[1]) & (oy >= 0) & (oy < dtp[0].shape[0])
+          ul[i] = [inp[0].load(ox*4 + oy*dtp[0].shape[1]*4 + j, valid) for j in range(4)]
+        elif dtype.count > 1:
+          ul[i] = [inp[0].load(inp[1]+j, gate, (inp[2][j] if dtp[2].count > 1 else inp[2]) if len(inp) == 4 else 0) for j in range(dtype.count)]
+        else: ul[i] = inp[0].load(inp[1], gate, inp[2] if len(inp) == 4 else 0)
+        ul[i] = [x.astype(_np_dtype(dtype)) for x in ul[i]] if isinstance(ul[i], list) else ul[i].astype(_np_dtype(dtype))
+      elif uop is UOps.PHI:
+        if isinstance(inp[0], list):
+          for j in range(len(inp[0])): inp[0][j] = inp[1][j]
+        else: inp[0][:] = inp[1]
+        ul[i] = inp[0]
+      elif uop is UOps.GEP: ul[i] = inp[0][arg]
+      elif uop is UOps.WMMA:
+        if arg[4] not in wmma_layouts: raise NotImplementedError(f"unimplemented tensor core {arg}")
+        WARP_THREADS, K, NUM_A, NUM_B, NUM_C, a_elem, b_elem, c_map = wmma_layouts[arg[4]]
+        assert (len(inp[0]), len(inp[1]), len(inp[2])) == (NUM_A, NUM_B, NUM_C), f"WMMA must have {NUM_A}, {NUM_B}, {NUM_C} elements per thread"
+        assert warp_size > 0 and warp_size % WARP_THREADS == 0, f"must have multiples of {WARP_THREADS} warp threads"
+        # (elements, workgroups, warps in the workgroup, lanes in the warp)
+        A, B = [np.stack(x).astype(np.float64).reshape(len(x), -1, warp_size//WARP_THREADS, WARP_THREADS) for x in inp[:2]]
+        if arg[4] == "AMD": assert all((x[..., :16] == x[..., 16:]).all() for x in (A, B)), "warp elements not duplicated properly across lanes"
+        out = np.stack(inp[2]).astype(np.float64).reshape(NUM_C, -1, warp_size//WARP_THREADS, WARP_THREADS)
+        for lane_id in range(WARP_THREADS):
+          for elem_idx in range(NUM_C): # calculate new muls and add to acc
+            (c_i, c_j) = c_map(lane_id, elem_idx)
+            out[elem_idx, ..., lane_id] += sum(A[(a:=a_elem(_k, c_j))[0], ..., a[1]] * B[(b:=b_elem(c_i, _k))[0], ..., b[1]] for _k in range(K))
+        ul[i] = [x.reshape(-1).astype(_np_dtype(dtype)) for x in out]
+      elif uop is UOps.ALU:
+        assert all_same([dtype] + dtp) or arg in {BinaryOps.CMPNE, BinaryOps.CMPLT, TernaryOps.WHERE}, f"dtype mismatch on {arg}"
+        # like exec_alu, floats are computed in double and truncated to the output dtype
+        ul[i] = numpy_alu[arg](*[x.astype(np.float64) if x.dtype.kind == 'f' else x for x in inp]).astype(_np_dtype(dtype))
+      assert i in ul, (uop, dtype, idp, arg)
+      i += 1
+
 class PythonRenderer(Renderer):
   device = "PYTHON"
   def __init__(self):
@@ -209,4 +342,4 @@ class PythonAllocator(Allocator):
 
 class PythonDevice(Compiled):
   def __init__(self, device:str):
-    super().__init__(device, PythonAllocator(), PythonRenderer(), PythonCompiler(), PythonProgram)
+    super().__init__(device, PythonAllocator(), PythonRenderer(), PythonCompiler(), PythonProgram if getenv("PYTHON_SCALAR") else PythonVecProgram)
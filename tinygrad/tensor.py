@@ -1,19 +1,20 @@
 # inspired by https://github.com/karpathy/micrograd/blob/master/micrograd/engine.py
 from __future__ import annotations
 import dataclasses
-import time, math, itertools, functools, struct, sys, inspect
+import time, math, itertools, functools, sys, inspect, ctypes, array
 from contextlib import ContextDecorator
 from typing import List, Tuple, Callable, Optional, ClassVar, Type, Union, Sequence, Dict, DefaultDict, cast, get_args, Set
 from collections import defaultdict
 import numpy as np
 
 from tinygrad.dtype import DType, DTypeLike, dtypes, ImageDType, ConstType, least_upper_float, least_upper_dtype, sum_acc_dtype, to_dtype
-from tinygrad.helpers import argfix, make_pair, flatten, prod, all_int, round_up, merge_dicts, argsort, getenv, get_shape, fully_flatten, dedup
-from tinygrad.helpers import IMAGE, DEBUG, WINO, THREEFRY, _METADATA, Metadata, TRACEMETA
+from tinygrad.helpers import argfix, make_pair, flatten, prod, all_int, round_up, merge_dicts, argsort, getenv, fully_flatten, dedup
+from tinygrad.helpers import diskcache_get, diskcache_put
+from tinygrad.helpers import IMAGE, DEBUG, WINO, CONV_ALGO, THREEFRY, _METADATA, Metadata, TRACEMETA, cpu_profile
 from tinygrad.lazy import LazyBuffer
 from tinygrad.multi import MultiLazyBuffer
-from tinygrad.ops import MetaOps, truncate
-from tinygrad.device import Device, Buffer, BufferOptions
+from tinygrad.ops import MetaOps, UOps
+from tinygrad.device import Device, Buffer, BufferOptions, MallocAllocator
 from tinygrad.shape.symbolic import sint, Variable, MulNode, SumNode, NumNode, Node
 from tinygrad.engine.realize import run_schedule, memory_planner
 from tinygrad.engine.schedule import ScheduleItem, create_schedule_with_vars
@@ -55,17 +56,36 @@ def _fromnp(x: np.ndarray) -> LazyBuffer:
   del ret.srcs
   return ret
 
-def _frompy(x:Union[List, Tuple, bytes], dtype:DType) -> LazyBuffer:
-  if isinstance(x, bytes): ret, data = LazyBuffer.metaop(MetaOps.EMPTY, (len(x)//dtype.itemsize,), dtype, "PYTHON"), x
-  else:
-    ret = LazyBuffer.metaop(MetaOps.EMPTY, get_shape(x), dtype, "PYTHON")
-    assert dtype.fmt is not None, f"{dtype=} has None fmt"
-    truncate_function = truncate[dtype]
-    data = struct.pack(f"@{ret.size}{dtype.fmt}", *[truncate_function(xi) for xi in fully_flatten(x)])
-  # fake realize
-  ret.buffer.allocate(memoryview(data))
-  del ret.srcs
-  return ret
+def _flatten_py(x:Union[List, Tuple]) -> Tuple[Tuple[int, ...], Sequence]:
+  # one pass per nesting level instead of a python call per element, a stray list in the leaves makes the packing below raise
+  shape, flat = [len(x)], x
+  while len(flat) and isinstance(flat[0], (list, tuple)):
+    if not all(isinstance(xi, (list, tuple)) for xi in flat) or len(lens:=set(map(len, flat))) != 1: raise ValueError(f"inhomogeneous shape from {x}")
+    shape.append(lens.pop())
+    flat = list(itertools.chain.from_iterable(flat))
+  return tuple(shape), flat
+
+def _frompy(x:Union[List, Tuple, bytes], dtype:Optional[DType]) -> LazyBuffer:
+  if isinstance(x, bytes):
+    ret = LazyBuffer.metaop(MetaOps.EMPTY, (len(x)//(dtype:=dtype or dtypes.uint8).itemsize,), dtype, "PYTHON")
+    # fake realize
+    ret.buffer.allocate(memoryview(x))
+    del ret.srcs
+    return ret
+  shape, flat = _flatten_py(x)
+  if dtype is None:
+    types = set(map(type, flat))
+    if flat and all(issubclass(t, bool) for t in types): dtype = dtypes.bool
+    else: dtype = dtypes.default_int if flat and all(issubclass(t, int) for t in types) else dtypes.default_float
+  try:
+    # array packs python numbers straight into memory, it raises on out of range ints and floats for int dtypes where numpy wraps and truncates
+    if dtype.fmt is None or dtype.fmt not in "bBhHiIlLqQfd" or (arr:=array.array(dtype.fmt, flat)).itemsize != dtype.itemsize: raise TypeError
+    npa = np.frombuffer(arr, _to_np_dtype(dtype)).reshape(shape)
+  except (OverflowError, TypeError):
+    # numpy also handles ndarrays in the list, their shape is part of the tensor's shape
+    npa = np.array(x).astype(_to_np_dtype(dtype))
+  # the data stays in host memory, the copy to the device is lazy
+  return _fromnp(npa)
 
 def _get_winograd_matcols(mat, dims:int, shp:Tuple[sint, ...], device:Union[str, Tuple[str, ...]]) -> List[List[Tensor]]:
   return [[Tensor.cat(*[Tensor.full(shp[:dim] + (1,) + shp[dim+1:], float(m[k]), device=device) for m in mat], dim=dim)
@@ -83,6 +103,61 @@ def _apply_winograd_matrix(mat, t:Tensor, dims:int) -> Tensor:
   assert isinstance(ret, Tensor), "sum didn't return a Tensor"
   return ret
 
+# output tile size: (G, Bt, At) of F(mxm,3x3) winograd
+_winograd_mats = {
+  4: ([[1/4, 0, 0], [-1/6, -1/6, -1/6], [-1/6, 1/6, -1/6], [1/24, 1/12, 1/6], [1/24, -1/12, 1/6], [0, 0, 1]],
+      [[4, 0, -5, 0, 1, 0], [0, -4, -4, 1, 1, 0], [0, 4, -4, -1, 1, 0], [0, -2, -1, 2, 1, 0], [0, 2, -1, -2, 1, 0], [0, 4, 0, -5, 0, 1]],
+      [[1, 1, 1, 1, 1, 0], [0, 1, -1, 2, -2, 0], [0, 1, 1, 4, 4, 0], [0, 1, -1, 8, -8, 1]]), # applying At in pre-order doubles compile time
+  2: ([[1, 0, 0], [1/2, 1/2, 1/2], [1/2, -1/2, 1/2], [0, 0, 1]],
+      [[1, 0, -1, 0], [0, 1, 1, 0], [0, -1, 1, 0], [0, 1, 0, -1]],
+      [[1, 1, 1, 0], [0, 1, -1, -1]])}
+
+_conv_algos: Dict[str, str] = {}
+def _search_conv_algo(key:str, build:Callable[[str], Tensor], algos:List[str]) -> str:
+  # time the kernels each algorithm schedules, as they'd be optimized in realize. cached in memory and on disk for this layer signature
+  if (ret:=_conv_algos.get(key)) is not None or (ret:=diskcache_get("conv_algo", key)) is not None: return _conv_algos.setdefault(key, ret)
+  from tinygrad.engine.realize import get_kernel
+  from tinygrad.engine.search import time_linearizer, bufs_from_lin
+  tms = {}
+  for algo in algos:
+    try:
+      kernels = [get_kernel(Device[si.outputs[0].device].renderer, si.ast) for si in build(algo).schedule() if si.ast.op is UOps.SINK]
+      tms[algo] = sum(time_linearizer(k, bufs_from_lin(k)) for k in kernels)
+    except Exception: tms[algo] = math.inf  # one that fails to compile or run isn't picked
+  if all(tm == math.inf for tm in tms.values()): return algos[0]
+  ret = _conv_algos[key] = diskcache_put("conv_algo", key, min(tms, key=lambda a: tms[a]))
+  if DEBUG >= 1: print(f"conv algo {ret} for {key}: " + ", ".join(f"{a} {tm*1e3:.2f} ms" for a,tm in tms.items()))
+  return ret
+
+EinsumTree = Union[int, Tuple["EinsumTree", "EinsumTree"]]
+@functools.lru_cache(None)
+def _einsum_plan(inputs:Tuple[str, ...], output:str, sizes:Tuple[Tuple[str, int], ...]) -> EinsumTree:
+  # order of pairwise contractions as a tree over the operand indices, minimizing the total size of the product each one reduces
+  size = dict(sizes)
+  def result(ops:int) -> str:
+    # letters of the contraction of the operands in the bitmask ops still needed by the output or the other operands
+    inside, outside = [set(x) for i,x in enumerate(inputs) if ops>>i&1], [set(x) for i,x in enumerate(inputs) if not ops>>i&1]
+    return "".join(sorted(set().union(*inside) & set(output).union(*outside)))
+  def letters(ops:int) -> str: return inputs[ops.bit_length()-1] if ops & (ops-1) == 0 else result(ops)
+  def cost(a:int, b:int) -> int: return prod(size[c] for c in set(letters(a)) | set(letters(b)))
+  if len(inputs) <= 6:
+    # dynamic programming over every subset, like opt_einsum's optimal path
+    best: Dict[int, Tuple[int, EinsumTree]] = {1<<i:(0, i) for i in range(len(inputs))}
+    for ops in sorted(range(1, 1<<len(inputs)), key=lambda x: bin(x).count("1")):
+      if ops in best: continue
+      # every split in two, each counted once by keeping the lowest operand on the left
+      for a in range(1, ops):
+        if a & ops != a or not a & (ops & -ops): continue
+        c = best[a][0] + best[ops^a][0] + cost(a, ops^a)
+        if ops not in best or c < best[ops][0]: best[ops] = (c, (best[a][1], best[ops^a][1]))
+    return best[(1<<len(inputs))-1][1]
+  # greedy, contract the cheapest pair until one is left
+  todo: List[Tuple[int, EinsumTree]] = [(1<<i, i) for i in range(len(inputs))]
+  while len(todo) > 1:
+    i, j = min(itertools.combinations(range(len(todo)), 2), key=lambda ij: cost(todo[ij[0]][0], todo[ij[1]][0]))
+    todo = [x for k,x in enumerate(todo) if k not in (i, j)] + [(todo[i][0] | todo[j][0], (todo[i][1], todo[j][1]))]
+  return todo[0][1]
+
 def _pad_left(*shapes:Tuple[sint, ...]) -> Tuple[Tuple[sint, ...], ...]:
   max_dim = max(len(shape) for shape in shapes)
   return tuple((1,) * (max_dim - len(shape)) + shape for shape in shapes)
@@ -125,13 +200,10 @@ class Tensor:
     if isinstance(data, LazyBuffer): assert dtype is None or dtype == data.dtype, "dtype doesn't match, and casting isn't supported"
     elif isinstance(data, get_args(ConstType)): data = _metaop(MetaOps.CONST, tuple(), dtype or dtypes.from_py(data), device, data)
     elif isinstance(data, Variable): data = _metaop(MetaOps.CONST, tuple(), dtype or dtypes.from_py(data.unbind()[1]), device, data)
-    elif isinstance(data, bytes): data = _frompy(data, dtypes.uint8 if dtype is None else dtype)
-    elif isinstance(data, (list, tuple)):
-      if dtype is None:
-        if (d := fully_flatten(data)) and all(isinstance(s, bool) for s in d): dtype = dtypes.bool
-        else: dtype = dtypes.default_int if d and all_int(d) else dtypes.default_float
-      if dtype == dtypes.bfloat16: data = Tensor(_fromnp(np.array(data, np.float32)), device=device).cast(dtypes.bfloat16).lazydata
-      else: data = _fromnp(np.array(data).astype(_to_np_dtype(dtype)))
+    elif isinstance(data, (bytes, list, tuple)):
+      # numpy has no bfloat16, it's packed as float32 and cast on the device
+      if dtype == dtypes.bfloat16: data = Tensor(_frompy(data, dtypes.float32), device=device).cast(dtypes.bfloat16).lazydata
+      else: data = _frompy(data, dtype)
     elif data is None: data = _metaop(MetaOps.EMPTY, (0,), dtype or dtypes.default_float, device)
     elif isinstance(data, np.ndarray):
       if data.shape == (): data = _metaop(MetaOps.CONST, tuple(), dtype or _from_np_dtype(data.dtype), device, data.item())
@@ -190,8 +262,9 @@ class Tensor:
     if getenv("FUZZ_SCHEDULE"):
       from test.external.fuzz_schedule import fuzz_schedule
       fuzz_schedule(flatten([x.lazydata.lbs for x in (self,)+lst]))
-    schedule, var_vals = create_schedule_with_vars(flatten([x.lazydata.lbs for x in (self,)+lst]), seen)
-    return memory_planner(schedule), var_vals
+    with cpu_profile("schedule", subactor="schedule"):
+      schedule, var_vals = create_schedule_with_vars(flatten([x.lazydata.lbs for x in (self,)+lst]), seen)
+      return memory_planner(schedule), var_vals
 
   def schedule(self, *lst:Tensor, seen:Optional[Set[LazyBuffer]]=None) -> List[ScheduleItem]:
     """Creates the schedule needed to realize these Tensor(s)."""
@@ -286,15 +359,31 @@ class Tensor:
     """
     return self.data().tolist()
 
-  def numpy(self) -> np.ndarray:
+  def numpy(self, copy:bool=True) -> np.ndarray:
     """
     Returns the value of this tensor as a `numpy.ndarray`.
 
+    With `copy=False` the tensor is realized and the array is a view of its buffer, so writes on either side (including `assign`) are visible
+    on the other. This needs a contiguous tensor on a CPU device (CLANG or LLVM) with a NumPy dtype, otherwise a `ValueError` is raised.
+    A constant tensor (like `Tensor.ones(4)`) has no buffer, so it is copied into a new one that only the array sees.
+    The buffer is kept out of the allocator cache, so the view stays valid after the tensor is freed.
+
     ```python exec="true" source="above" session="tensor" result="python"
     t = Tensor([1, 2, 3, 4])
     print(repr(t.numpy()))
     ```
     """
+    if not copy:
+      if not isinstance(self.device, str) or Device[self.device].allocator is not MallocAllocator or _to_np_dtype(self.dtype) is None:
+        raise ValueError(f"can't view {self.dtype} tensor on {self.device} without a copy")
+      # realizing a const doesn't allocate a buffer
+      lb = cast(LazyBuffer, (self.contiguous() if cast(LazyBuffer, self.lazydata).is_unrealized_const() else self).realize().lazydata)
+      if (buf:=lb.base.realized) is None or not all_int(self.shape) or not lb.st.contiguous:
+        raise ValueError("can't view an unrealized or non contiguous tensor without a copy")
+      # the memory belongs to the base buffer when this is a buffer view, that's the one to keep out of the LRU cache and for the array to hold
+      buf.base.options = dataclasses.replace(buf.base.options or BufferOptions(), nolru=True)
+      mv = buf.base.as_buffer(force_zero_copy=True)[buf.offset:buf.offset+buf.nbytes]
+      return np.frombuffer(mv, dtype=_to_np_dtype(self.dtype), count=prod(self.shape)).reshape(self.shape)
     if self.dtype == dtypes.bfloat16: return self.float().numpy()
     assert _to_np_dtype(self.dtype) is not None, f"no np dtype for {self.dtype}"
     assert all_int(self.shape), f"no data if shape is symbolic, {self.shape=}"
@@ -383,6 +472,34 @@ class Tensor:
     """
     return Tensor._metaop(MetaOps.EMPTY, argfix(*shape), **kwargs)
 
+  @staticmethod
+  def from_numpy(arr:np.ndarray, device:Optional[str]=None, copy:bool=True, requires_grad:Optional[bool]=None) -> Tensor:
+    """
+    Creates a tensor from a `numpy.ndarray`. With `copy=True` this is the same as `Tensor(arr, device)`.
+
+    With `copy=False` the tensor's buffer is the array's memory, pinned for as long as the buffer lives.
+    This needs a non empty, writeable, C-contiguous and 16 byte aligned array and a CPU device (CLANG or LLVM), otherwise a `ValueError` is raised.
+    Kernels read the array when they run, so writes to it before the tensor is realized are seen by tinygrad, and `assign` writes into it.
+
+    ```python exec="true" source="above" session="tensor" result="python"
+    a = np.arange(4, dtype=np.float32)
+    t = Tensor.from_numpy(a, device="CLANG", copy=False)
+    t.assign(t * 2).realize()
+    print(a)
+    ```
+    """
+    if copy: return Tensor(arr, device, requires_grad=requires_grad)
+    device = Device.canonicalize(device)
+    if Device[device].allocator is not MallocAllocator: raise ValueError(f"can't wrap a numpy array on {device} without a copy")
+    if arr.size == 0 or not arr.flags.c_contiguous or not arr.flags.writeable or arr.ctypes.data % 16 != 0 or arr.dtype.name not in dtypes.fields():
+      raise ValueError(f"can't wrap {arr.dtype} array with {arr.shape=} {arr.strides=} without a copy")
+    ret = LazyBuffer.metaop(MetaOps.EMPTY, arr.shape, _from_np_dtype(arr.dtype), device)
+    # the buffer is never put back in the LRU cache, and the ctypes array keeps a reference to arr
+    ret.buffer.options = BufferOptions(nolru=True)
+    ret.buffer.allocate((ctypes.c_uint8 * arr.nbytes).from_buffer(arr.data))
+    del ret.srcs
+    return Tensor(ret, device, requires_grad=requires_grad)
+
   _seed: int = int(time.time())
   _rng_counter: Optional[Tensor] = None
   @staticmethod
@@ -1644,7 +1761,7 @@ class Tensor:
     print(Tensor.einsum("ij,ij->", x, y).numpy())
     ```
     """
-    xs:Tuple[Tensor] = argfix(*raw_xs)
+    xs:Tuple[Tensor, ...] = argfix(*raw_xs)
     formula = formula.replace(" ", "")
     inputs_str, output = formula.split("->") if "->" in formula else (formula, \
                                                                        ''.join(c for c in sorted(formula) if formula.count(c) == 1 and c.isalpha()))
@@ -1654,6 +1771,16 @@ class Tensor:
     # map the value of each letter in the formula
     letter_val = sorted(merge_dicts([dict(zip(letters, tensor.shape)) for letters, tensor in zip(inputs, xs)]).items())
 
+    # with more than two operands, contract them pairwise so no intermediate spans every letter
+    if len(xs) > 2 and all_int([v for _,v in letter_val]):
+      def contract(node:EinsumTree) -> Tuple[Tensor, str, int]:
+        if isinstance(node, int): return xs[node], inputs[node], 1<<node
+        (a, la, ma), (b, lb, mb) = contract(node[0]), contract(node[1])
+        needed = set(output).union(*[x for i,x in enumerate(inputs) if not (ma|mb)>>i&1])
+        lr = output if ma|mb == (1<<len(xs))-1 else "".join(c for c in dict.fromkeys(la+lb) if c in needed)
+        return Tensor.einsum(f"{la},{lb}->{lr}", a, b, acc_dtype=acc_dtype), lr, ma|mb
+      return contract(_einsum_plan(tuple(inputs), output, tuple(letter_val)))[0]
+
     xs_:List[Tensor] = []
     lhs = [sorted(enumerate(s), key=lambda e:e[1]) for s in inputs]
     for x,(order,letters) in zip(xs, [list(zip(*l)) for l in lhs]):
@@ -1751,15 +1878,40 @@ class Tensor:
     print(t.conv2d(w).numpy())
     ```
     """
-    (bs,cin_), (cout,cin), HW = self.shape[:2], weight.shape[:2], weight.shape[2:]
+    cin_, cin, HW = self.shape[1], weight.shape[1], weight.shape[2:]
     assert groups*cin == cin_ and len(self.shape) == len(weight.shape), f"Input Tensor shape {self.shape} does not match the shape of the weights {weight.shape}. ({groups*cin} vs. {cin_})"  # noqa: E501
     if isinstance(padding, (tuple,list)): assert len(padding) == 2*len(HW) or len(padding) == len(HW), f"Expected padding of length {2*len(HW)} or {len(HW)}, but got {len(padding)} for tensor of shape {self.shape}"  # noqa: E501
     padding_ = self._padding2d(padding, len(HW))
 
+    # by default the algorithm is searched for layers big enough that the pick matters, like BEAM the timings are cached per layer signature
+    if not (algo:=str(CONV_ALGO.value)):
+      flops = 2*self.shape[0]*prod(weight.shape)*prod(self.shape[2:])//prod(make_pair(stride, len(HW))) if all_int(self.shape) else 0
+      algo = "winograd" if WINO else "search" if flops >= getenv("CONV_SEARCH_FLOPS", 10**8) else "direct"
+    if algo.startswith("winograd") and (not all(x == 3 for x in HW) or stride != 1 or dilation != 1): algo = "direct"
+    if algo == "search" and (not all_int(self.shape) or not isinstance(self.device, str)): algo = "direct"
+    if algo == "search":
+      # winograd's transforms are fractional, integer convs only use the exact algorithms
+      algos = ["direct", "im2col"] + (["winograd", "winograd2"] if all(x == 3 for x in HW) and stride == 1 and dilation == 1 and
+                                      dtypes.is_float(self.dtype) and dtypes.is_float(weight.dtype) else [])
+      algo = _search_conv_algo(str((self.shape, weight.shape, groups, stride, dilation, padding_, self.dtype, weight.dtype, acc_dtype, self.device)),
+        lambda a: Tensor.empty(*self.shape, dtype=self.dtype, device=self.device)._conv(Tensor.empty(*weight.shape, dtype=weight.dtype,
+          device=self.device), None, a, groups, stride, dilation, padding_, acc_dtype), algos)
+    return self._conv(weight, bias, algo, groups, stride, dilation, padding_, acc_dtype)
+
+  def _conv(self, weight:Tensor, bias:Optional[Tensor], algo:str, groups:int, stride, dilation, padding_:Sequence[int],
+            acc_dtype:Optional[DTypeLike]) -> Tensor:
+    (bs,_), (cout,cin), HW = self.shape[:2], weight.shape[:2], weight.shape[2:]
     # conv2d is a pooling op (with padding)
     x = self.pad2d(padding_)._pool(HW, stride, dilation)   # (bs, groups*cin, oy, ox, H, W)
     rcout, oyx = cout//groups, x.shape[2:-len(HW)]
-    if not all(x == 3 for x in HW) or stride != 1 or dilation != 1 or not WINO:
+    if algo == "im2col":
+      # gather the patches into a (groups, bs*oy*ox, cin*H*W) matrix, then one matmul per group
+      x = x.reshape(bs, groups, cin, *oyx, *HW).permute(1, 0, *[3+i for i in range(len(oyx))], 2, *[3+len(oyx)+i for i in range(len(HW))])
+      x = x.reshape(groups, bs*prod(oyx), cin*prod(HW)).contiguous()
+      ret = x.matmul(weight.reshape(groups, rcout, cin*prod(HW)).transpose(1, 2), acc_dtype=acc_dtype).reshape(groups, bs, *oyx, rcout)
+      ret = ret.permute(1, 0, -1, *[2+i for i in range(len(oyx))]).reshape(bs, cout, *oyx)
+      return ret if bias is None else ret.add(bias.reshape(1, -1, *[1] * len(HW)))
+    if not algo.startswith("winograd"):
       # normal conv
       x = x.reshape(bs, groups, cin, 1, *oyx, *HW).expand(bs, groups, cin, rcout, *oyx, *HW).permute(0,1,3,*[4+i for i in range(len(oyx))],2,*[4+len(oyx)+i for i in range(len(HW))])  # noqa: E501
 
@@ -1767,22 +1919,22 @@ class Tensor:
       ret = (x * weight.reshape(1, groups, rcout, *[1] * len(oyx), cin, *HW)).sum([-1-i for i in range(1+len(oyx))], keepdim=True, acc_dtype=acc_dtype).reshape(bs, cout, *oyx)  # noqa: E501
       return ret if bias is None else ret.add(bias.reshape(1, -1, *[1] * len(HW)))
 
-    HWI, HWO = (6,) * len(HW), (4,) * len(HW)  # F(4x4,3x3) winograd tiles
-    winograd_G = [[1/4, 0, 0], [-1/6, -1/6, -1/6], [-1/6, 1/6, -1/6], [1/24, 1/12, 1/6], [1/24, -1/12, 1/6], [0, 0, 1]]
-    winograd_Bt = [[4, 0, -5, 0, 1, 0], [0, -4, -4, 1, 1, 0], [0, 4, -4, -1, 1, 0], [0, -2, -1, 2, 1, 0], [0, 2, -1, -2, 1, 0], [0, 4, 0, -5, 0, 1]]
-    winograd_At = [[1, 1, 1, 1, 1, 0], [0, 1, -1, 2, -2, 0], [0, 1, 1, 4, 4, 0], [0, 1, -1, 8, -8, 1]] # applying At in pre-order doubles compile time
+    # F(mxm,3x3) winograd tiles
+    m = 2 if algo == "winograd2" else 4
+    winograd_G, winograd_Bt, winograd_At = _winograd_mats[m]
+    HWI, HWO = (m+2,) * len(HW), (m,) * len(HW)
 
     # todo: stride == dilation
-    # use padding to round up to 4x4 output tiles
+    # use padding to round up to mxm output tiles
     # (bs, cin_, tyx, HWI)
-    d = self.pad2d(sum([[padding_[i*2], padding_[i*2+1] + (-(dim + sum(padding_[i * 2:(i + 1) * 2]) - 2) % 4)] for i, dim in enumerate(self.shape[-len(HW):])], []))._pool(HWI, HWO)  # noqa: E501
+    d = self.pad2d(sum([[padding_[i*2], padding_[i*2+1] + (-(dim + sum(padding_[i * 2:(i + 1) * 2]) - 2) % m)] for i, dim in enumerate(self.shape[:-len(HW)-1:-1])], []))._pool(HWI, HWO)  # noqa: E501
     # move HW to the front: # (HWI, bs, cin_, tyx)
     d = d.permute(*range(len(d.shape)-len(HW),len(d.shape)), *range(len(d.shape)-len(HW)))
     tyx = d.shape[-len(HWI):]  # dim of tiling
 
     g = weight.permute(*range(len(weight.shape)-len(HW),len(weight.shape)), *range(len(weight.shape)-len(HW)))  # move HW to the front
 
-    # compute 6x6 winograd tiles: GgGt, BtdB
+    # compute winograd tiles: GgGt, BtdB
     # (HWI, groups * rcout, cin) -> (HWI, bs=1, groups, rcout, cin, tyx=(1,1))
     gfactors = _apply_winograd_matrix(winograd_G, g, len(HW)).reshape(*HWI, 1, groups, rcout, cin, *([1]*len(tyx)))
     # (HWI, bs, cin_, tyx) -> (HWI, bs, groups, 1 ,cin, *tyx)